@@ -0,0 +1,208 @@
+'''
+Per-stop game analytics from an event log written by events.py.
+
+The log is streamed, so it can be far larger than memory: only each
+player's current stop and a fixed-size sample of solve times per stop are
+kept. For every stop it reports how many players reached and solved it,
+the drop-off between the two, solve time percentiles and clue usage.
+
+    python analyze_events.py events.jsonl [--game static/data/game.json]
+    python analyze_events.py events.db --json
+'''
+import argparse
+import json
+import random
+
+from events import read_events
+from registry import GameGraph
+
+
+class Reservoir(object):
+    '''
+    A uniform random sample of at most size values from a stream.
+    '''
+    def __init__(self, size=10000, seed=None):
+        self.size = size
+        self.count = 0
+        self.values = []
+
+        self._random = random.Random(seed)
+
+    def add(self, value):
+        self.count += 1
+
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            n = self._random.randrange(self.count)
+            if n < self.size:
+                self.values[n] = value
+
+    def percentile(self, fraction):
+        if not self.values:
+            return None
+
+        values = sorted(self.values)
+
+        return values[min(len(values) - 1,
+                          int(round(fraction * (len(values) - 1))))]
+
+
+class StopStats(object):
+    __slots__ = ('reached', 'solved', 'clues', 'clued', 'times')
+
+    def __init__(self, sample):
+        self.reached = 0
+        self.solved = 0
+        self.clues = 0
+        self.clued = 0
+        self.times = Reservoir(sample)
+
+
+class Analysis(object):
+    def __init__(self, sample=10000):
+        self.sample = sample
+        self.events = 0
+
+        self.stops = {}
+        # player -> [game, stop, entered at, clues used there]
+        self.players = {}
+
+    def stats(self, game, stop):
+        key = (game, stop)
+
+        if key not in self.stops:
+            self.stops[key] = StopStats(self.sample)
+
+        return self.stops[key]
+
+    def enter(self, player, game, stop, ts):
+        self.players[player] = [game, stop, ts, 0]
+        self.stats(game, stop).reached += 1
+
+    def add(self, event):
+        self.events += 1
+
+        type = event.get('type', None)
+        player = event.get('player', None)
+        game = event.get('game', None)
+        stop = event.get('stop', None)
+
+        current = self.players.get(player, None)
+        here = current is not None and current[1] == stop
+
+        if type in ('start', 'reset'):
+            self.enter(player, game, stop, event['ts'])
+        elif type == 'clue' and here:
+            stats = self.stats(game, stop)
+            stats.clues += 1
+
+            if current[3] == 0:
+                stats.clued += 1
+            current[3] += 1
+        elif type == 'photo' and here:
+            stats = self.stats(game, stop)
+            stats.solved += 1
+            stats.times.add(event['ts'] - current[2])
+
+            if event.get('next', None):
+                self.enter(player, game, event['next'], event['ts'])
+            else:
+                self.players.pop(player, None)
+        elif type == 'restart':
+            self.players.pop(player, None)
+
+    def report(self, order=None):
+        '''
+        Rows per stop, in play order when a stop order is given.
+        '''
+        keys = list(self.stops)
+
+        if order:
+            rank = {stop: n for n, stop in enumerate(order)}
+            keys.sort(key=lambda key: (key[0] or "",
+                                       rank.get(key[1], len(rank))))
+        else:
+            keys.sort(key=lambda key: (key[0] or "",
+                                       -self.stops[key].reached))
+
+        rows = []
+        for game, stop in keys:
+            stats = self.stops[(game, stop)]
+
+            rows.append({
+                'game': game,
+                'stop': stop,
+                'reached': stats.reached,
+                'solved': stats.solved,
+                'drop_off': (1 - stats.solved / stats.reached
+                             if stats.reached else None),
+                'median_s': stats.times.percentile(0.5),
+                'p90_s': stats.times.percentile(0.9),
+                'clues_per_visit': (stats.clues / stats.reached
+                                    if stats.reached else None),
+                'clued': (stats.clued / stats.reached
+                          if stats.reached else None)})
+
+        return rows
+
+
+def analyze(events, order=None, sample=10000):
+    analysis = Analysis(sample)
+
+    for event in events:
+        analysis.add(event)
+
+    return analysis.report(order)
+
+
+def stop_order(path):
+    with open(path) as f:
+        definition = json.load(f)
+
+    return GameGraph(definition.get('Stop', {}),
+                     start=definition.get('Start', None)).order
+
+
+def percent(value):
+    return "-" if value is None else "{0:.0%}".format(value)
+
+
+def minutes(value):
+    return "-" if value is None else "{0:.1f}".format(value / 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('log', help="JSON lines or SQLite event log.")
+    parser.add_argument('--game', help="Game definition, for stop order.")
+    parser.add_argument('--sample', type=int, default=10000,
+                        help="Solve times kept per stop for percentiles.")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    order = stop_order(args.game) if args.game else None
+    rows = analyze(read_events(args.log), order, args.sample)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print("{0:<10} {1:<12} {2:>8} {3:>7} {4:>9} {5:>9} {6:>8} {7:>7} "
+          "{8:>7}".format("game", "stop", "reached", "solved", "drop-off",
+                          "med min", "p90 min", "clues", "clued"))
+
+    for row in rows:
+        print("{0:<10} {1:<12} {2:>8} {3:>7} {4:>9} {5:>9} {6:>8} "
+              "{7:>7} {8:>7}".format(
+                  str(row['game']), str(row['stop']), row['reached'],
+                  row['solved'], percent(row['drop_off']),
+                  minutes(row['median_s']), minutes(row['p90_s']),
+                  "-" if row['clues_per_visit'] is None
+                  else "{0:.2f}".format(row['clues_per_visit']),
+                  percent(row['clued'])))
+
+
+if __name__ == '__main__':
+    main()
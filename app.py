@@ -1,32 +1,107 @@
+import hmac
 import os
-import json
+import time
 
+from flask import abort
+from flask import current_app
 from flask import Flask
+from flask import g
 from flask import make_response
 from flask import request
+from flask import send_from_directory
 from flask import render_template
 from flask import url_for
 
-from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.twiml.voice_response import Hangup
 from twilio.twiml.voice_response import VoiceResponse
 from twilio.twiml.voice_response import Say
 
+from archive import PhotoArchive
+from dedupe import MemoryReplyBackend
+from dedupe import PENDING
+from dedupe import ReplyCache
+from dedupe import SQLiteReplyBackend
+from delivery import DeliveryIndex
+from delivery import OutboundMessage
+from delivery import PERMANENT_ERRORS
+from delivery import SQLiteStatusBackend
+from events import EventLog
+from events import open_writer
+from lazy import Lazy
+from media import poster_path
+from media import StaticFiles
+from metrics import Metrics
+from metrics import RequestTimer
+from metrics import SlowRequestProfiler
+from outbound import Broadcaster
+from outbound import Digest
+from outbound import DispatchQueue
+from outbound import FakeClient
+from outbound import MediaBatcher
+from outbound import RateLimiter
+from pages import PageCache
+from registry import GameError
+from registry import GameRegistry
+from reloader import GameReloader
+from scheduler import Scheduler
+from scheduler import SQLiteTimerBackend
+from sessions import MemoryBackend
+from sessions import SessionStore
+from sessions import SQLiteBackend
+from signatures import SignatureCheck
+from twiml import outbound_messages
+from twiml import TwiMLCache
+
+
+def replay_duplicate():
+    sid = request.form.get('MessageSid', None) or \
+        request.form.get('SmsSid', None)
+
+    if request.endpoint not in REPLAYED or not sid:
+        return None
+
+    # Redirects keep the sid, so each hop is its own entry.
+    key = "{0}:{1}".format(sid, request.path)
+    reply = replies.begin(key)
+
+    if reply is None:
+        g.reply_key = key
+        return None
+    elif reply is PENDING:
+        return str(MessagingResponse())
+
+    status, headers, body = reply
+
+    return make_response(body, status, headers)
+
+
+def remember_reply(response):
+    key = g.pop('reply_key', None)
+
+    if key is not None:
+        replies.finish(key, response)
+
+    return response
 
-app = Flask(__name__, static_url_path='/static')
-app.config.from_pyfile('local_settings.py')
 
+def forget_reply(exception=None):
+    key = g.pop('reply_key', None)
 
-with open('static/data/game.json') as f:
-    app.config['Game'] = json.load(f)
+    if key is not None:
+        replies.release(key)
 
 
-client = Client(app.config['TWILIO_ACCOUNT_SID'],
-                app.config['TWILIO_AUTH_TOKEN'])
+def resolve_game():
+    # Status callbacks are many and need no game.
+    if 'From' in request.form and request.endpoint != 'status':
+        g.game, g.role, g.team = registry.get().resolve(
+            request.form.get('To'), request.form['From'])
+
+        if g.game is not None:
+            g.command = g.game.commands.parse(request.form.get('Body', None))
 
 
-@app.route('/voice', methods=['GET', 'POST'])
 def voice():
     response = VoiceResponse()
 
@@ -48,64 +123,160 @@ def voice():
     return str(response)
 
 
-@app.route('/sms', methods=['GET', 'POST'])
 def sms():
-    response = MessagingResponse()
+    view, kwargs = route_message(g.command, player_state())
 
-    if request.form['From'] == app.config.get('TWILIO_GM'):
-        response.redirect('/gm')
-    else:
-        response.redirect('/player')
-
-    return str(response)
+    return view(**kwargs)
 
 
-@app.route('/gm', methods=['GET', 'POST'])
 def gm():
     response = MessagingResponse()
 
-    if "START" in request.form['Body']:
+    # START [team] - anything else after START is relayed like other text.
+    name = " ".join(g.command.args)
+
+    if g.command.name == 'START' and (not name or team_named(name)):
         body = "Awwwwwwwwwww... BERFDAY TIME! Lillie - are you ready " \
                "for a fun adventure to kick off your 40th? " \
                "" \
                "Text YES or NO."
 
-        send_player_message(body)
+        queue_player_message(body, team=team_named(name))
 
         response.message("Message sent.")
-    elif request.form['Body'].upper().startswith("ADMIN"):
+    elif g.command.name == 'ADMIN':
         response.redirect('/gm/admin')
+    elif g.command.name == 'BROADCAST':
+        response.message(broadcast())
     else:
+        # "<team>: message" goes to that team, anything else to everyone.
         body = request.form['Body']
+        name, colon, rest = body.partition(':')
+        team = team_named(name) if colon and rest.strip() else None
 
-        send_player_message(body)
+        if team:
+            queue_player_message(rest.strip(), team=team)
+        else:
+            queue_player_message(body)
 
     return str(response)
 
 
-@app.route('/player', methods=['GET', 'POST'])
+def broadcast():
+    # BROADCAST [ALL|TEAM <team>|STOP <stop>] <message>
+    args = g.command.args
+    scope = args[0].upper() if args else ""
+    usage = "Text BROADCAST followed by ALL, TEAM and a team or STOP and " \
+            "a stop, then your message."
+
+    if scope == 'TEAM':
+        team, used = match_name(args[1:], g.game.teams)
+        recipients = g.game.players(team) if team else None
+    elif scope == 'STOP':
+        stop, used = match_name(args[1:], g.game.graph.order)
+        recipients = players_at(stop) if stop else None
+    else:
+        scope = 'ALL' if scope == 'ALL' else None
+        used = 0
+        recipients = g.game.players()
+
+    # The keyword, the scope and the name, then the message as typed.
+    consumed = 1 + (1 if scope else 0) + used
+    parts = g.command.text.split(None, consumed)
+
+    if recipients is None or len(parts) <= consumed:
+        return usage
+    elif not recipients:
+        return "No players to send to."
+
+    to, from_ = request.form['From'], g.game.number
+
+    def progress(sent, failed, total):
+        if sent + failed < total:
+            body = "Broadcast: {0} of {1} sent.".format(sent + failed, total)
+        elif failed:
+            body = "Broadcast done: {0} of {1} sent, {2} failed." \
+                   "".format(sent, total, failed)
+        else:
+            body = "Broadcast done: sent to {0}.".format(total)
+
+        dispatcher.put(send_gm_message, body, to=to, from_=from_)
+
+    log_event('broadcast', scope=scope or 'ALL', players=len(recipients))
+
+    broadcaster.start(send_player_message, parts[-1], recipients,
+                      progress=progress, from_=from_)
+
+    return "Broadcasting to {0} player{1}.".format(
+        len(recipients), "" if len(recipients) == 1 else "s")
+
+
+def match_name(words, names):
+    '''
+    The name the most leading words spell out, ignoring case, and how many
+    words it took.
+    '''
+    names = {name.upper(): name for name in names}
+
+    for count in range(len(words), 0, -1):
+        name = names.get(" ".join(words[:count]).upper(), None)
+
+        if name is not None:
+            return name, count
+
+    return None, 0
+
+
+def team_named(name):
+    '''
+    The team name spells out in full, ignoring case, or None.
+    '''
+    words = name.split()
+    team, used = match_name(words, g.game.teams)
+
+    return team if words and used == len(words) else None
+
+
+def which_team(command, name=None):
+    names = sorted(g.game.teams) or list(g.game.solo)
+
+    if not names:
+        return "No players in this game."
+
+    return "{0}Text {1} followed by one of: {2}.".format(
+        "No team called {0}. ".format(name) if name else "", command,
+        ", ".join(names))
+
+
+def players_at(stop):
+    return tuple(number for number in g.game.players()
+                 if (sessions.get(g.game.session_key(number)) or {})
+                 .get('Stop', None) == stop)
+
+
 def player():
     response = MessagingResponse()
 
-    if request.form['Body'].upper().startswith("HELP"):
+    if g.command.name == 'HELP':
         response.message("Text CLUE to get another hint about where you "
                          "need to go.\nText STUCK to summon the bat signal "
                          "and get additional assistance.\nIf you have "
                          "another question, just text to connect with our "
                          "AI.\nHave fun!")
         resp = make_response(str(response))
-    elif request.form['Body'].upper().startswith("STUCK"):
+    elif g.command.name == 'STUCK':
         response.message("Help is on the way!")
         resp = make_response(str(response))
 
-        send_gm_message("Player is indicating she is stuck.")
-    elif request.form['Body'].upper().startswith("ADMIN"):
+        queue_gm_message("Player is indicating she is stuck.", urgent=True)
+        log_event('stuck', stop=player_state().get('Stop', None))
+    elif g.command.name == 'ADMIN':
         response.redirect('/gm/admin')
         resp = make_response(str(response))
-    elif request.cookies.get('Stop', None):
-        response.redirect('/player/{0}'.format(request.cookies.get('Stop')))
+    elif player_state().get('Stop', None):
+        response.redirect('/player/{0}'.format(player_state()['Stop']))
         resp = make_response(str(response))
-    elif request.form['Body'].upper().startswith("YES"):
+    elif g.command.name == 'YES':
         response.message("Awesome! Gather up your crew and get stoked for "
                          "a rad photo scavenger hunt around lovely Livingston "
                          "Manor. A few folks you might know are going to give "
@@ -126,10 +297,14 @@ def player():
                           filename='images/scavengers_assemble.jpg'))
 
         resp = make_response(str(response))
-        resp.set_cookie("Stop", "Fish")
-
-        send_gm_message("Game started.")
-    elif "NO" == request.form['Body'].upper():
+        resp.set_cookie("Stop", g.game.graph.start)
+        sessions.update(session_key(), Stop=g.game.graph.start, Clue=0)
+        arm_hint(session_key(), g.game.graph.start)
+        arm_timers(session_key())
+
+        queue_gm_message("Game started.")
+        log_event('start', stop=g.game.graph.start)
+    elif g.command.name == 'NO':
         response.message("Ah, c'mon now. Rob spent some time on this. It'll "
                          "be fun! Text YES to get going.")
         resp = make_response(str(response))
@@ -141,170 +316,947 @@ def player():
     return resp
 
 
-@app.route('/player/<stop>', methods=['GET', 'POST'])
 def player_game(stop):
     response = MessagingResponse()
 
-    data = app.config['Game']['Stop'][stop]
+    if stop not in g.game.compiled.stops:
+        return finished() if stop == g.game.graph.end else lost(stop)
+
+    data = g.game.compiled.stops[stop]
 
     num_media = request.form.get('NumMedia', None)
 
-    if "YES" in request.form['Body'].upper():
-        for message in data['Introduction']['Messages']:
-            response = reply_message(response, message, stop)
+    if g.command.name == 'YES':
+        resp = make_response(twiml.get(g.game, stop, 'Introduction'))
 
-        resp = make_response(str(response))
+        queue_gm_message("Video for {0} delivered.".format(stop))
+        log_event('video', stop=stop)
 
-        send_gm_message("Video for {0} delivered.".format(stop))
+    elif g.command.name == 'CLUE':
+        clue_counter = player_state().get('Clue', 0)
 
-    elif "CLUE" == request.form['Body'].upper():
-        clue_counter = request.cookies.get('Clue', None)
-        if clue_counter:
-            clue_counter = int(clue_counter)
-        if not clue_counter or clue_counter == "0":
+        # A reload can shorten the clues.
+        if not 0 <= clue_counter < len(data.clues):
             clue_counter = 0
 
-        for message in data['Clues'][clue_counter]['Messages']:
-            response = reply_message(response, message, stop)
+        queue_gm_message("Clue {0} for {1} requested."
+                         "".format(clue_counter, stop))
+        log_event('clue', stop=stop, clue=clue_counter)
 
-        send_gm_message("Clue {0} for {1} requested."
-                        "".format(clue_counter, stop))
-
-        resp = make_response(str(response))
+        resp = make_response(twiml.get(g.game, stop, 'Clues',
+                                       clue_counter))
 
         clue_counter = clue_counter + 1
 
-        if clue_counter > 2:
+        if clue_counter >= len(data.clues):
             clue_counter = 0
 
         resp.set_cookie("Clue", str(clue_counter))
+        sessions.update(session_key(), Clue=clue_counter)
+        arm_hint(session_key(), stop)
 
     elif num_media and int(num_media) > 0:
-        for n in range(0, int(num_media)):
-            media_number = 'MediaUrl{0}'.format(str(n))
-            send_gm_message("Photo received for {0}.".format(stop),
-                            media_url=request.form[media_number])
-
-        for message in data['Victory']['Messages']:
-            if stop == "Brewery":
-                response = reply_message(response, message, "Final")
-            else:
-                response = reply_message(response, message, stop)
-
-        resp = make_response(str(response))
-        resp.set_cookie("Stop", data['Victory']['Next'])
+        media = [request.form['MediaUrl{0}'.format(str(n))]
+                 for n in range(0, int(num_media))]
+        queue_gm_media("Photo received for {0}.".format(stop), media)
+        media_forwarded.inc(amount=len(media))
+        archive_media(media, stop)
+        log_event('photo', stop=stop, next=g.game.graph.next.get(stop, None),
+                  media=len(media))
+
+        resp = make_response(twiml.get(g.game, stop, 'Victory'))
+        resp.set_cookie("Stop", data.next)
         resp.set_cookie("Clue", "0")
+        sessions.update(session_key(), Stop=data.next, Clue=0)
+
+        if data.next in g.game.compiled.stops:
+            arm_hint(session_key(), data.next)
+        else:
+            scheduler.cancel(session_key())
     else:
-        send_gm_message(request.form['Body'])
+        queue_gm_message(request.form['Body'])
 
         resp = make_response(str(response))
 
     return resp
 
 
-@app.route('/video/<location>')
+def finished():
+    # After the last photo the player's stop is the final victory's next,
+    # which isn't a stop. Anything they send still reaches the GM.
+    response = MessagingResponse()
+    response.message("You've finished the scavenger hunt - congratulations! "
+                     "Anything else you text goes to the game master.")
+
+    num_media = int(request.form.get('NumMedia', None) or 0)
+
+    if num_media:
+        queue_gm_media("Photo received after the hunt.",
+                       [request.form['MediaUrl{0}'.format(n)]
+                        for n in range(0, num_media)])
+    elif request.form.get('Body', None):
+        queue_gm_message(request.form['Body'])
+
+    return str(response)
+
+
+def lost(stop):
+    # A reload renamed or removed the player's stop. The GM puts them back
+    # with ADMIN rather than the game guessing where they were.
+    response = MessagingResponse()
+    response.message("Hang tight - the game has changed, and the game "
+                     "master will put you back on track.")
+
+    queue_gm_message("Player was at {0}, which is no longer in the game. "
+                     "Text ADMIN followed by a stop number and {1} to move "
+                     "them.".format(stop, session_key()[len(g.game.id) + 1:]),
+                     urgent=True)
+
+    if request.form.get('Body', None):
+        queue_gm_message(request.form['Body'])
+
+    return str(response)
+
+
+def game_command():
+    data = g.game.commands.replies[g.command.name]
+
+    if data.get('Notify', None):
+        queue_gm_message(data['Notify'])
+
+    log_event('command', command=g.command.name,
+              stop=player_state().get('Stop', None))
+
+    if data.get('Messages', None):
+        return twiml.get(g.game, g.command.name, 'Commands')
+
+    return str(MessagingResponse())
+
+
+def gallery(game, player):
+    game = registry.get().get(game)
+
+    if archive is None or game is None or not hmac.compare_digest(
+            request.args.get('sig', ""),
+            gallery_signature(game.session_key(player))):
+        abort(404)
+
+    team = player if player in game.teams else None
+
+    return render_template('gallery.html', title=team or "Photos",
+                           stops=archive.gallery(game.id, player,
+                                                 game.graph.order))
+
+
+def archived(filename):
+    # Not the index, which has players' numbers.
+    if archive is None or not filename.startswith(('objects/', 'thumbs/')):
+        abort(404)
+
+    # Named by content hash, so never change.
+    return send_from_directory(archive.root, filename,
+                               max_age=365 * 24 * 3600)
+
+
 def video(location):
-    if location == "Fish":
-        title = "Start with Sashimi"
-        video = url_for('static', filename='video/kamillakowal.mp4')
-        thumbnail = url_for('static', filename='images/janisjoplin.png')
-    elif location == "Bridge":
-        title = "Over Troubled Waters"
-        video = url_for('static', filename='video/patrickmcneil.mp4')
-        thumbnail = url_for('static', filename='images/joecocker.png')
-    elif location == "Farm":
-        title = "Camelids Have More Fun"
-        video = url_for('static', filename='video/dylanplayfair.mp4')
-        thumbnail = url_for('static', filename='images/jimihendrix.png')
-    elif location == "Synagogue":
-        title = "Brothers and Sisters"
-        video = url_for('static', filename='video/ktrevorwilson.mp4')
-        thumbnail = url_for('static', filename='images/arloguthrie.png')
-    elif location == "Brewery":
-        title = "Puppers Time"
-        video = url_for('static', filename='video/nathandales.mp4')
-        thumbnail = url_for('static', filename='images/bobweir.png')
-    elif location == "Final":
-        title = "Happy Berfday Lillie!"
-        video = url_for('static', filename='video/robspectre.mp4')
-        thumbnail = url_for('static', filename='images/rogerdaltrey.png')
-    else:
-        title = "File Not Found"
-        video = url_for('static', filename='video/sadtrombone.mp4')
-        thumbnail = None
-        return render_template('video.html', video=video, title=title), 404
+    games = registry.get()
+    game = games.get(request.args.get('game', None)) or games.default
+
+    if location not in game.compiled.videos:
+        location = None
+
+    page = pages.get((game.id, location), game.definition,
+                     lambda: render_video(game, location))
+
+    return page.response(request,
+                         max_age=current_app.config['VIDEO_CACHE_MAX_AGE'])
+
+
+def render_video(game, location):
+    with render_seconds.time('video'):
+        if location is None:
+            title = "File Not Found"
+            video = url_for('static', filename='video/sadtrombone.mp4')
+            return render_template('video.html', video=video,
+                                   title=title), 404
+
+        data = game.compiled.videos[location]
+
+        video = url_for('static', filename=data.video)
+
+        # The frame build_media.py grabbed, if it has been run.
+        poster = poster_path(data.video)
+        if current_app.extensions['static_files'].digest(poster) is None:
+            poster = data.thumbnail
+
+        return render_template('video.html', video=video, title=data.title,
+                               poster=url_for('static', filename=poster)), 200
+
+
+def status():
+    error_code = request.form.get('ErrorCode', None)
+    message = delivery.update(request.form.get('MessageSid', ""),
+                              request.form.get('MessageStatus', ""),
+                              error_code)
+
+    message_statuses.inc(request.form.get('MessageStatus', ""))
+
+    if message is not None:
+        delivery_failed(message, error_code)
+
+    return "", 204
+
 
-    return render_template('video.html', video=video, title=title,
-                           thumbnail=thumbnail)
+def delivery_failed(message, error_code):
+    # Also called from create_message, outside any request.
+    resend = message.attempt < app.config['STATUS_RETRIES'] and \
+        error_code not in PERMANENT_ERRORS
+
+    if resend:
+        send = send_player_message if message.kind == 'player' \
+            else send_gm_message
+
+        dispatcher.put(send, message.body, media_url=message.media_url,
+                       to=message.to, from_=message.from_,
+                       attempt=message.attempt + 1)
+
+    # A GM's own failed texts aren't reported back, or they could loop.
+    if message.kind != 'player':
+        return
+
+    games = registry.get()
+    game = games.by_number.get(message.from_, games.default)
+    body = message.body if len(message.body) <= 40 \
+        else message.body[:40] + "..."
+
+    notice = "Text to {0} failed ({1}): \"{2}\" {3}".format(
+        message.to, error_code or "no error code", body,
+        "Resending." if resend else "Not resent.")
+
+    for gm in game.gms:
+        dispatcher.put(send_gm_message, notice, to=gm, from_=message.from_)
 
 
-@app.route('/gm/admin', methods=['GET', 'POST'])
 def admin():
     response = MessagingResponse()
 
-    if "ADMIN RESTART" == request.form['Body'].upper():
+    # ADMIN <RESTART|STATUS|RELOAD|GALLERY|stop number> [team]
+    args = g.command.args
+    command = args[0].upper() if args else ""
+    team = " ".join(args[1:]) or None
+    target = admin_target(team)
+
+    if target is None and (command in ('RESTART', 'STATUS', 'GALLERY') or
+                           command.isdigit()):
+        response.message(which_team("ADMIN " + command, team))
+        return str(response)
+
+    if "RESTART" == command:
         response.message("Restarting game.")
         resp = make_response(str(response))
 
         resp.set_cookie("Stop", "", expires=0)
         resp.set_cookie("Clue", "", expires=0)
-        send_gm_message("Player restarted game.")
-    elif "ADMIN " in request.form['Body'].upper():
-        stop = int(request.form['Body'].upper().replace('ADMIN ', '').strip())
+        sessions.delete(target)
+        scheduler.cancel(target)
+        queue_gm_message("Player restarted game.")
+        log_event('restart', key=target)
+    elif "STATUS" == command:
+        state = player_state(target)
+
+        if state.get('Stop', None):
+            response.message("At {0}, next clue {1}."
+                             "".format(g.game.graph.progress(state['Stop']),
+                                       state.get('Clue', 0)))
+        else:
+            response.message("Game not started.")
 
-        stop = [n[0] for n in app.config['Game']['Stop'].items()][stop]
+        resp = make_response(str(response))
+    elif "RELOAD" == command and g.role == 'gm':
+        to, from_ = request.form['From'], g.game.number
+
+        def reloaded(error):
+            dispatcher.put(send_gm_message, "Reload failed, game unchanged: "
+                           "{0}".format(error) if error else "Game reloaded.",
+                           to=to, from_=from_)
+
+        reloader.reload_async(reloaded)
+
+        response.message("Reloading game.")
+        resp = make_response(str(response))
+    elif "GALLERY" == command and g.role == 'gm':
+        if archive is None:
+            response.message("Photos aren't being archived.")
+        else:
+            response.message(gallery_url(target))
+
+        resp = make_response(str(response))
+    elif command.isdigit():
+        try:
+            stop = g.game.graph.stop_at(int(command))
+        except GameError as e:
+            response.message(str(e))
+            return str(response)
 
         response.message("Game reset to {0}.".format(stop))
         resp = make_response(str(response))
 
         resp.set_cookie("Stop", stop)
         resp.set_cookie("Clue", "0")
+        sessions.update(target, Stop=stop, Clue=0)
+        arm_hint(target, stop)
 
-        send_gm_message("Player reset game to {0}.".format(stop))
+        queue_gm_message("Player reset game to {0}.".format(stop))
+        log_event('reset', key=target, stop=stop)
+    else:
+        response.message("Text ADMIN RESTART, ADMIN STATUS or ADMIN "
+                         "followed by a stop number.")
+        resp = make_response(str(response))
 
     return resp
 
 
-def send_player_message(body, media_url=None):
-    if media_url:
-        msg = client.messages.create(from_=app.config['TWILIO_CALLER_ID'],
-                                     to=app.config['TWILIO_PLAYER'],
-                                     body=body,
-                                     media_url=media_url)
+def route_message(command, state):
+    if command.name == 'ADMIN':
+        return admin, {}
+    elif g.role == 'gm':
+        return gm, {}
+    elif command.name in ('HELP', 'STUCK'):
+        return player, {}
+    elif command.name in g.game.commands.replies:
+        return game_command, {}
+    elif state.get('Stop', None) in g.game.compiled.stops:
+        return player_game, {'stop': state['Stop']}
+    elif state.get('Stop', None) == g.game.graph.end:
+        return finished, {}
+    elif state.get('Stop', None):
+        return lost, {'stop': state['Stop']}
     else:
-        msg = client.messages.create(from_=app.config['TWILIO_CALLER_ID'],
-                                     to=app.config['TWILIO_PLAYER'],
-                                     body=body)
+        return player, {}
 
-    return msg
 
+def session_key(number=None):
+    return g.game.session_key(number or request.form['From'])
 
-def send_gm_message(body, media_url=None):
-    if media_url:
-        msg = client.messages.create(from_=app.config['TWILIO_CALLER_ID'],
-                                     to=app.config['TWILIO_GM'],
-                                     body=body,
-                                     media_url=media_url)
+
+def player_state(key=None):
+    key = key or session_key()
+
+    state = sessions.get(key)
+
+    if state is None:
+        # Cookies are still set alongside the session store - carry over
+        # players who started before progress moved server side.
+        state = {}
+
+        if request.cookies.get('Stop', None):
+            state['Stop'] = request.cookies['Stop']
+            state['Clue'] = int(request.cookies.get('Clue', None) or 0)
+
+            sessions.set(key, state)
+
+    return state
+
+
+def admin_target(name=None):
+    '''
+    The session an ADMIN command acts on: the sender's own, or for the GM
+    the team or solo player named - or the only one, if there is just one.
+    None when the name matches nothing or the GM has to pick.
+    '''
+    if g.role != 'gm':
+        return session_key()
+
+    if name:
+        target = team_named(name) or \
+            (name if name in g.game.solo else None)
     else:
-        msg = client.messages.create(from_=app.config['TWILIO_CALLER_ID'],
-                                     to=app.config['TWILIO_GM'],
-                                     body=body)
+        targets = list(g.game.teams) + list(g.game.solo)
+        target = targets[0] if len(targets) == 1 else None
+
+    return "{0}:{1}".format(g.game.id, target) if target else None
+
+
+def log_event(type, key=None, **fields):
+    game_events.inc(type)
+    events.record(type, game=g.game.id, player=key or session_key(),
+                  **fields)
+
+
+def send_player_message(body, media_url=None, to=None, from_=None,
+                        attempt=0):
+    return create_message('player', body, media_url,
+                          to or app.config['TWILIO_PLAYER'],
+                          from_ or app.config['TWILIO_CALLER_ID'], attempt)
+
+
+def send_gm_message(body, media_url=None, to=None, from_=None, attempt=0):
+    return create_message('gm', body, media_url,
+                          to or app.config['TWILIO_GM'],
+                          from_ or app.config['TWILIO_CALLER_ID'], attempt)
+
+
+def create_message(kind, body, media_url, to, from_, attempt=0):
+    rate_limiter.acquire(from_)
+
+    params = {'from_': from_, 'to': to, 'body': body}
+
+    if media_url:
+        params['media_url'] = media_url
+
+    callback = status_callback_url()
+
+    if callback:
+        params['status_callback'] = callback
+
+    with twilio_seconds.time(kind):
+        msg = client.get().messages.create(**params)
+
+    if callback:
+        # Its status callback can beat the reply from Twilio.
+        failed = delivery.sent(msg.sid, OutboundMessage(kind, to, from_, body,
+                                                        media_url, attempt))
+
+        if failed is not None:
+            delivery_failed(failed, delivery.status(msg.sid)[1])
 
     return msg
 
 
-def reply_message(response, message, stop):
-    if message.get('Path', None):
-        response.message(message['Body'].format(url_for(message['Path'],
-                                                        location=stop,
-                                                        _external=True)))
-    elif message.get('Media', None):
-        msg = response.message(message['Body'])
-        msg.media(url_for('static', filename=message['Media']))
+def status_callback_url():
+    # Sends run outside any request, so the host has to be configured.
+    if app.config.get('BASE_URL') and app.config.get('STATUS_CALLBACKS'):
+        return app.config['BASE_URL'].rstrip('/') + '/status'
+
+    return None
+
+
+def queue_player_message(body, media_url=None, team=None):
+    # Sent in the background, a few at a time, so the webhook can return.
+    broadcaster.start(send_player_message, body, g.game.players(team),
+                      media_url=media_url, from_=g.game.number)
+
+
+def queue_gm_message(body, media_url=None, urgent=False):
+    team = g.get('team', None)
+
+    for gm in g.game.gms:
+        if urgent or media_url:
+            # Anything already collected goes first, for context.
+            gm_digest.flush(gm_digest.key(send_gm_message, team, to=gm,
+                                          from_=g.game.number))
+
+            dispatcher.put(send_gm_message, gm_digest.compose(team, [body]),
+                           media_url=media_url, to=gm, from_=g.game.number)
+        else:
+            gm_digest.add(send_gm_message, team, body, to=gm,
+                          from_=g.game.number)
+
+
+def queue_gm_media(body, media_urls):
+    if g.get('team', None):
+        body = "[{0}] {1}".format(g.team, body)
+
+    for gm in g.game.gms:
+        media_batcher.add(send_gm_message, body, media_urls, to=gm,
+                          from_=g.game.number)
+
+
+def archive_media(media, stop):
+    if archive is None:
+        return
+
+    member = session_key()[len(g.game.id) + 1:]
+
+    for url in media:
+        archive.put(url, g.game.id, member, stop)
+
+
+def gallery_signature(key):
+    return hmac.new(current_app.config['TWILIO_AUTH_TOKEN'].encode('utf-8'),
+                    key.encode('utf-8'), 'sha256').hexdigest()[:32]
+
+
+def gallery_url(key):
+    player = key[len(g.game.id) + 1:]
+
+    return url_for('gallery', game=g.game.id, player=player,
+                   sig=gallery_signature(key), _external=True)
+
+
+def timers_enabled():
+    # Pushed messages are sent outside any request, so links and media
+    # need the host configured.
+    return bool(app.config.get('BASE_URL'))
+
+
+def arm_hint(key, stop):
+    data = g.game.compiled.stops.get(stop, None)
+
+    if not timers_enabled() or data is None or not data.hint_after:
+        scheduler.cancel(key, 'hint')
+        return
+
+    scheduler.schedule(key, 'hint', time.time() + data.hint_after,
+                       {'game': g.game.id, 'stop': stop})
+
+
+def arm_timers(key):
+    if not timers_enabled():
+        return
+
+    now = time.time()
+
+    for n, timer in enumerate(g.game.compiled.timers):
+        scheduler.schedule(key, 'timer{0}'.format(n), now + timer.after,
+                           {'game': g.game.id, 'timer': n})
+
+
+def fire_timer(timer):
+    game = registry.get().get(timer.payload['game'])
+
+    if game is None or not timers_enabled():
+        return
+
+    state = sessions.get(timer.key) or {}
+
+    # Finished or restarted since it was set.
+    if state.get('Stop', None) not in game.compiled.stops:
+        return
+
+    member = timer.key[len(game.id) + 1:]
+    team = member if member in game.teams else None
+
+    with app.test_request_context(base_url=app.config['BASE_URL']):
+        g.game, g.role, g.team = game, 'player', team
+
+        if timer.name == 'hint':
+            push_hint(timer, state, game.players(team) if team
+                      else (member,))
+        else:
+            push_timed(timer, game.players(team) if team else (member,))
+
+
+def push_hint(timer, state, players):
+    stop = timer.payload['stop']
+
+    # Moved on in another worker, or the stop was reloaded away.
+    if state['Stop'] != stop or stop not in g.game.compiled.stops:
+        return
+
+    data = g.game.compiled.stops[stop]
+    clue = state.get('Clue', 0)
+
+    if clue >= len(data.clues):
+        clue = 0
+
+    push_messages(outbound_messages(data.clues[clue], stop, g.game.id),
+                  players)
+
+    queue_gm_message("Clue {0} for {1} sent, no progress."
+                     "".format(clue, stop))
+    log_event('hint', key=timer.key, stop=stop, clue=clue)
+
+    clue = clue + 1
+
+    if clue >= len(data.clues):
+        clue = 0
     else:
-        response.message(message['Body'])
+        arm_hint(timer.key, stop)
 
-    return response
+    sessions.update(timer.key, Clue=clue)
+
+
+def push_timed(timer, players):
+    timers = g.game.compiled.timers
+    n = timer.payload['timer']
+
+    # The game was reloaded with fewer timers.
+    if n >= len(timers):
+        return
+
+    push_messages(outbound_messages(timers[n].messages, None, g.game.id),
+                  players)
+
+    log_event('timer', key=timer.key, timer=n)
+
+
+def push_messages(messages, players):
+    for player in players:
+        for body, media_url in messages:
+            dispatcher.put(send_player_message, body, media_url=media_url,
+                           to=player, from_=g.game.number)
+
+
+def show_metrics():
+    token = current_app.config.get('METRICS_TOKEN', None)
+
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', "").encode('utf-8'),
+            "Bearer {0}".format(token).encode('utf-8')):
+        return make_response("Unauthorized.", 401)
+
+    return make_response(current_app.extensions['metrics'].render(), 200,
+                         {'Content-Type': "text/plain; version=0.0.4; "
+                                          "charset=utf-8"})
+
+
+# Endpoints Twilio calls, checked for a valid X-Twilio-Signature.
+WEBHOOKS = ('voice', 'sms', 'gm', 'player', 'player_game', 'admin',
+            'status')
+
+# Retries of these get the stored reply. Status callbacks all carry their
+# message's sid, so each is handled.
+REPLAYED = ('voice', 'sms', 'gm', 'player', 'player_game', 'admin')
+
+
+def create_app(config=None):
+    '''
+    Builds a Flask app from local_settings.py and any config overrides.
+    Views read settings from the app serving them, and each app has its
+    own static files, signature check and metrics. The games, sessions and
+    send queues below are shared by the process and built from the default
+    app's settings. Nothing slow happens here - games and the Twilio client
+    load on first use, or up front with warm_up().
+    '''
+    app = Flask(__name__, static_url_path='/static')
+    app.config.from_pyfile('local_settings.py')
+    app.config.update(config or {})
+
+    app.extensions['static_files'] = StaticFiles(
+        app, max_age=app.config['STATIC_MAX_AGE'])
+
+    # Ahead of every other hook, so they are timed too.
+    metrics = app.extensions['metrics'] = Metrics()
+    profiler = None
+
+    if app.config.get('PROFILE_SLOW_REQUESTS'):
+        profiler = SlowRequestProfiler(
+            threshold=app.config['PROFILE_SLOW_REQUESTS'],
+            interval=app.config['PROFILE_INTERVAL'])
+
+    app.extensions['request_timer'] = RequestTimer(
+        app, metrics.histogram('http_request_duration_seconds',
+                               "Time to answer a request.",
+                               ('endpoint', 'method', 'status')),
+        profiler=profiler)
+
+    # Registered first so forged requests never reach game logic.
+    app.extensions['signatures'] = SignatureCheck(app, WEBHOOKS)
+    app.before_request(replay_duplicate)
+    app.before_request(resolve_game)
+    app.after_request(remember_reply)
+    app.teardown_request(forget_reply)
+
+    methods = ['GET', 'POST']
+
+    app.add_url_rule('/voice', view_func=voice, methods=methods)
+    app.add_url_rule('/sms', view_func=sms, methods=methods)
+    app.add_url_rule('/gm', view_func=gm, methods=methods)
+    app.add_url_rule('/player', view_func=player, methods=methods)
+    app.add_url_rule('/player/<stop>', view_func=player_game,
+                     methods=methods)
+    app.add_url_rule('/video/<location>', view_func=video)
+    app.add_url_rule('/gallery/<game>/<player>', view_func=gallery)
+    app.add_url_rule('/archive/<path:filename>', view_func=archived)
+    app.add_url_rule('/gm/admin', view_func=admin, methods=methods)
+    app.add_url_rule('/status', view_func=status, methods=['POST'])
+    app.add_url_rule('/metrics', 'metrics', view_func=show_metrics)
+
+    return app
+
+
+def load_games():
+    '''
+    Reads the GAMES definitions now, replacing any already loaded.
+    '''
+    return registry.set(read_games())
+
+
+def game_paths():
+    # Relative paths are from the app directory, not the working one.
+    return [os.path.join(app.root_path, path) for path in app.config['GAMES']]
+
+
+def read_games():
+    loaded = GameRegistry()
+
+    # The first game falls back to the single-hunt numbers in settings.
+    defaults = {'numbers': [app.config.get('TWILIO_CALLER_ID')],
+                'gms': [app.config.get('TWILIO_GM')],
+                'players': [app.config.get('TWILIO_PLAYER')]}
+
+    for path in game_paths():
+        game = loaded.load(path, static_folder=app.static_folder,
+                           endpoints=set(app.view_functions),
+                           snapshots=app.config.get('GAME_SNAPSHOTS', True),
+                           **defaults)
+        defaults = {}
+
+        for warning in game.warnings:
+            app.logger.warning("%s: %s", game.id, warning)
+
+    app.config['Game'] = loaded.default.definition
+
+    return loaded
+
+
+def make_client():
+    if app.config.get('TWILIO_FAKE_CLIENT'):
+        return FakeClient()
+
+    # Deferred - requests and the REST modules are most of an import.
+    from twilio.rest import Client
+
+    from http_pool import PooledHttpClient
+
+    http_client = PooledHttpClient(
+        pool_size=app.config['TWILIO_POOL_SIZE'],
+        connect_timeout=app.config['TWILIO_CONNECT_TIMEOUT'],
+        read_timeout=app.config['TWILIO_READ_TIMEOUT'])
+
+    return Client(app.config['TWILIO_ACCOUNT_SID'],
+                  app.config['TWILIO_AUTH_TOKEN'],
+                  http_client=http_client)
+
+
+def pool_stats():
+    # Nothing until the first send builds the client, and the fake client
+    # has no pool.
+    if not client.loaded:
+        return {}
+
+    stats = getattr(getattr(client.get(), 'http_client', None), 'stats',
+                    None)
+
+    return stats() if stats else {}
+
+
+app = create_app()
+
+static_files = app.extensions['static_files']
+signatures = app.extensions['signatures']
+metrics = app.extensions['metrics']
+
+twilio_seconds = metrics.histogram('twilio_request_duration_seconds',
+                                   "Time to create a message with the "
+                                   "Twilio API.", ('recipient',))
+game_events = metrics.counter('game_events_total',
+                              "Game events - video, clue, photo, stuck, "
+                              "command, restart, reset - by type.",
+                              ('type',))
+media_forwarded = metrics.counter('media_forwarded_total',
+                                  "Photos forwarded to the GMs.")
+message_statuses = metrics.counter('message_status_callbacks_total',
+                                   "Delivery status callbacks by status.",
+                                   ('status',))
+render_seconds = metrics.histogram('render_duration_seconds',
+                                   "Time to build a game's TwiML or a "
+                                   "video page, on a cache miss.",
+                                   ('kind',))
+
+registry = Lazy(read_games)
+client = Lazy(make_client)
+
+twiml = TwiMLCache(app, histogram=render_seconds)
+pages = PageCache()
+
+
+if app.config.get('SESSION_DATABASE'):
+    session_backend = SQLiteBackend(app.config['SESSION_DATABASE'])
+else:
+    session_backend = MemoryBackend()
+
+sessions = SessionStore(session_backend,
+                        max_entries=app.config['SESSION_CACHE_SIZE'],
+                        ttl=app.config['SESSION_TTL'],
+                        flush_interval=app.config['SESSION_FLUSH_INTERVAL'],
+                        shared=bool(app.config.get('SESSION_DATABASE')) and
+                        app.config['WEB_CONCURRENCY'] > 1)
+
+
+if app.config.get('DEDUPE_DATABASE'):
+    reply_backend = SQLiteReplyBackend(
+        app.config['DEDUPE_DATABASE'],
+        max_entries=app.config['DEDUPE_CACHE_SIZE'])
+else:
+    reply_backend = MemoryReplyBackend(
+        max_entries=app.config['DEDUPE_CACHE_SIZE'])
+
+replies = ReplyCache(reply_backend, ttl=app.config['DEDUPE_TTL'])
+
+
+if app.config.get('STATUS_DATABASE'):
+    status_backend = SQLiteStatusBackend(app.config['STATUS_DATABASE'])
+else:
+    status_backend = None
+
+delivery = DeliveryIndex(status_backend,
+                         max_entries=app.config['STATUS_CACHE_SIZE'],
+                         flush_interval=app.config['STATUS_FLUSH_INTERVAL'])
+
+
+if app.config.get('ARCHIVE_FOLDER'):
+    archive = PhotoArchive(
+        os.path.join(app.root_path, app.config['ARCHIVE_FOLDER']),
+        auth=(app.config['TWILIO_ACCOUNT_SID'],
+              app.config['TWILIO_AUTH_TOKEN']),
+        workers=app.config['ARCHIVE_WORKERS'],
+        max_bytes=app.config['ARCHIVE_MAX_BYTES'],
+        thumbnail_size=app.config['ARCHIVE_THUMBNAIL_SIZE'])
+else:
+    archive = None
+
+
+if app.config.get('TIMER_DATABASE'):
+    timer_backend = SQLiteTimerBackend(app.config['TIMER_DATABASE'])
+else:
+    timer_backend = None
+
+scheduler = Scheduler(fire_timer, timer_backend,
+                      max_lateness=app.config['TIMER_MAX_LATENESS'],
+                      flush_interval=app.config['TIMER_FLUSH_INTERVAL'])
+
+
+# Buckets are per process - each worker sends its share of the rate.
+rate_limiter = RateLimiter(
+    rate=app.config['TWILIO_SEND_RATE'] / app.config['WEB_CONCURRENCY'],
+    burst=max(app.config['TWILIO_SEND_BURST'] //
+              app.config['WEB_CONCURRENCY'], 1))
+
+dispatcher = DispatchQueue(workers=app.config['TWILIO_DISPATCH_WORKERS'],
+                           max_retries=app.config['TWILIO_DISPATCH_RETRIES'],
+                           backoff=app.config['TWILIO_DISPATCH_BACKOFF'])
+
+
+media_batcher = MediaBatcher(dispatcher,
+                             window=app.config['MEDIA_BATCH_WINDOW'],
+                             max_media=app.config['MEDIA_BATCH_SIZE'])
+
+
+broadcaster = Broadcaster(dispatcher,
+                          parallelism=app.config['BROADCAST_PARALLELISM'],
+                          report_every=app.config['BROADCAST_REPORT_EVERY'])
+
+gm_digest = Digest(dispatcher,
+                   window=app.config['GM_DIGEST_WINDOW'],
+                   max_lines=app.config['GM_DIGEST_MAX_LINES'],
+                   max_groups=app.config['GM_DIGEST_MAX_GROUPS'])
+
+events = EventLog(open_writer(app.config['EVENT_LOG']),
+                  batch_size=app.config['EVENT_LOG_BATCH_SIZE'],
+                  flush_interval=app.config['EVENT_LOG_FLUSH_INTERVAL'])
+
+
+metrics.gauge('dispatch_queue_depth', "Outbound messages waiting to send.",
+              lambda: dispatcher.queue.qsize())
+metrics.gauge('dispatch_sent_total', "Outbound messages sent.",
+              lambda: dispatcher.sent, type='counter')
+metrics.gauge('dispatch_failed_total', "Outbound messages given up on.",
+              lambda: dispatcher.failed, type='counter')
+metrics.gauge('dispatch_dropped_total',
+              "Outbound messages dropped with the queue full.",
+              lambda: dispatcher.dropped, type='counter')
+metrics.gauge('rate_limiter_throttled_total',
+              "Sends delayed by the per-number rate limit.",
+              lambda: rate_limiter.throttled, type='counter')
+metrics.gauge('twilio_pool_size', "Connections the Twilio pool keeps.",
+              lambda: pool_stats().get('pool_size', 0))
+metrics.gauge('twilio_pool_connections', "Open connections to Twilio.",
+              lambda: pool_stats().get('connections', 0))
+metrics.gauge('twilio_requests_in_flight', "Twilio API calls under way.",
+              lambda: pool_stats().get('in_flight', 0))
+metrics.gauge('twilio_requests_in_flight_peak',
+              "Most Twilio API calls under way at once.",
+              lambda: pool_stats().get('peak_in_flight', 0))
+metrics.gauge('twilio_pool_saturated_total',
+              "Twilio API calls that waited for a pooled connection.",
+              lambda: pool_stats().get('saturated', 0), type='counter')
+metrics.gauge('media_batch_pending', "Photos waiting to be batched.",
+              lambda: sum(len(batch) for batch in
+                          list(media_batcher.pending.values())))
+metrics.gauge('media_batch_saved_total',
+              "Messages saved by sending photos together.",
+              lambda: media_batcher.saved, type='counter')
+metrics.gauge('gm_digest_pending', "GM notifications waiting in a digest.",
+              lambda: sum(len(batch) for batch in
+                          list(gm_digest.pending.values())))
+metrics.gauge('event_log_pending', "Game events not yet written.",
+              lambda: events.pending)
+metrics.gauge('sessions_pending', "Player state changes not yet written.",
+              lambda: sessions.pending)
+metrics.gauge('messages_awaiting_delivery',
+              "Sent messages without a final status yet.",
+              lambda: delivery.outstanding)
+metrics.gauge('message_failures_total',
+              "Messages reported undelivered or failed.",
+              lambda: delivery.failures, type='counter')
+metrics.gauge('timers_scheduled', "Pending hint and game event timers.",
+              lambda: len(scheduler))
+metrics.gauge('timers_fired_total', "Hint and game event timers fired.",
+              lambda: scheduler.fired, type='counter')
+metrics.gauge('archive_queue_depth', "Photos waiting to be archived.",
+              lambda: archive.queue.qsize() if archive else 0)
+metrics.gauge('photos_archived_total', "Photos added to a gallery.",
+              lambda: archive.archived if archive else 0, type='counter')
+metrics.gauge('photos_deduplicated_total',
+              "Photos already in the archive, stored once.",
+              lambda: archive.duplicates if archive else 0, type='counter')
+metrics.gauge('archive_failed_total', "Photos that couldn't be archived.",
+              lambda: (archive.failed + archive.dropped) if archive else 0,
+              type='counter')
+metrics.gauge('webhook_retries_total',
+              "Retried webhooks answered with the stored reply.",
+              lambda: replies.duplicates, type='counter')
+metrics.gauge('signatures_rejected_total',
+              "Webhooks rejected for a bad signature.",
+              lambda: signatures.rejected, type='counter')
+
+
+def compile_twiml(games):
+    if app.config.get('BASE_URL'):
+        for game in games.games.values():
+            twiml.compile(game, app.config['BASE_URL'])
+
+
+reloader = GameReloader(registry, read_games, game_paths,
+                        interval=app.config['GAME_RELOAD_INTERVAL'],
+                        on_reload=compile_twiml)
+
+
+def warm_up():
+    '''
+    Does the deferred work and starts the background threads before the
+    first webhook arrives - gunicorn calls this as each worker boots, and
+    app.run below before serving.
+    '''
+    reloader.start()
+
+    scheduler.restore()
+    scheduler.start()
+
+    games = registry.get()
+
+    # Touching messages imports the REST API modules.
+    client.get().messages
+
+    compile_twiml(games)
+
+
+def shutdown():
+    reloader.stop()
+    scheduler.stop()
+
+    if archive is not None:
+        archive.stop()
+
+    media_batcher.flush_all()
+    gm_digest.flush_all()
+    broadcaster.stop()
+    dispatcher.stop()
+    sessions.close()
+    events.close()
+    delivery.close()
 
 
 if __name__ == '__main__':
@@ -315,4 +1267,12 @@ if __name__ == '__main__':
     else:
         app.config['PREFERRED_URL_SCHEME'] = 'https'
 
-    app.run(host='0.0.0.0', port=port)
+    # In debug the reloader's watcher process runs this too - only the
+    # process serving requests should fire timers.
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
+
+    try:
+        app.run(host='0.0.0.0', port=port)
+    finally:
+        shutdown()
@@ -0,0 +1,347 @@
+'''
+Archive of the photos players send in.
+
+Each MediaUrl a player texts is queued and downloaded by a few worker
+threads, so at most `workers` downloads run at once and the webhook never
+waits on one. A download is streamed to a temporary file chunk by chunk
+while it is hashed, then moved to objects/<ab>/<sha256><ext> - a file
+already there is the same picture, so it is kept once however many times
+it is sent. Photos are recorded per game, player or team, and stop in
+archive.db, and gallery() groups them for a page.
+
+With ffmpeg installed, each new image also gets a JPEG thumbnail under
+thumbs/ - otherwise galleries show the originals.
+'''
+import atexit
+import hashlib
+import logging
+import mimetypes
+import os
+import queue
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# mimetypes picks .jpe for image/jpeg.
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif',
+              'video/mp4': '.mp4', 'video/3gpp': '.3gp'}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class SQLitePhotoIndex(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS photos "
+                                     "(game TEXT, player TEXT, stop TEXT, "
+                                     "digest TEXT, object TEXT, "
+                                     "thumbnail TEXT, content_type TEXT, "
+                                     "size INTEGER, url TEXT, received REAL, "
+                                     "UNIQUE (game, player, stop, digest))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS photos_url "
+                                     "ON photos (url)")
+
+    def known(self, url):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM photos "
+                                            "WHERE url = ?",
+                                            (url,)).fetchone() is not None
+
+    def add(self, game, player, stop, digest, object, thumbnail,
+            content_type, size, url, received):
+        '''
+        Records a photo. False if the player already sent it at the stop.
+        '''
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO photos (game, player, stop, digest, "
+                "object, thumbnail, content_type, size, url, received) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (game, player, stop, digest, object, thumbnail,
+                 content_type, size, url, received))
+
+        return cursor.rowcount == 1
+
+    def photos(self, game, player):
+        with self._lock:
+            rows = self._connection.execute("SELECT stop, object, thumbnail, "
+                                            "content_type, received "
+                                            "FROM photos WHERE game = ? AND "
+                                            "player = ? ORDER BY received",
+                                            (game, player)).fetchall()
+
+        return [{'stop': stop, 'object': object,
+                 'thumbnail': thumbnail or object,
+                 'content_type': content_type, 'received': received}
+                for stop, object, thumbnail, content_type, received in rows]
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) "
+                                            "FROM photos").fetchone()[0]
+
+
+def make_thumbnail(source, target, size):
+    if not shutil.which('ffmpeg'):
+        return None
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-i', source,
+                    '-vf', "scale='min({0},iw)':-2".format(size),
+                    '-frames:v', '1', '-q:v', '4', target],
+                   check=True, timeout=30)
+
+    return target
+
+
+class PhotoArchive(object):
+    def __init__(self, root, auth=None, workers=4, chunk_size=1 << 16,
+                 max_bytes=20 << 20, timeout=(3.05, 30), thumbnail_size=320,
+                 max_retries=2, backoff=0.5, maxsize=1000):
+        self.root = root
+        self.auth = auth
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.thumbnail_size = thumbnail_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.threads = []
+
+        self.archived = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.dropped = 0
+
+        for directory in ('objects', 'thumbs', 'tmp'):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+        self.index = SQLitePhotoIndex(os.path.join(root, 'archive.db'))
+
+        # Deferred - requests is most of an import, and the app only needs
+        # it with an archive.
+        import requests
+
+        # One keep-alive connection per worker.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=max(workers, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+
+        atexit.register(self.stop)
+
+    def start(self):
+        with self._lock:
+            if self.threads:
+                return
+
+            for n in range(0, self.workers):
+                thread = threading.Thread(target=self._work,
+                                          name="archive-{0}".format(n),
+                                          daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def put(self, url, game, player, stop, received=None):
+        job = (url, game, player, stop, received or time.time())
+
+        if self.workers == 0:
+            return self._archive(*job)
+
+        if not self.threads:
+            self.start()
+
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Archive queue full, not keeping %s.", url)
+
+    def drain(self, timeout=None):
+        if not self.threads:
+            return True
+
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while self.queue.unfinished_tasks:
+            if deadline and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+        return True
+
+    def stop(self, timeout=10):
+        with self._lock:
+            threads = self.threads
+            self.threads = []
+
+        if not threads:
+            return
+
+        for _ in threads:
+            self.queue.put(_STOP)
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def gallery(self, game, player, order=()):
+        '''
+        [(stop, photos)] for a player or team, stops in play order.
+        '''
+        stops = {}
+
+        for photo in self.index.photos(game, player):
+            stops.setdefault(photo['stop'], []).append(photo)
+
+        rank = {stop: n for n, stop in enumerate(order)}
+
+        return sorted(stops.items(),
+                      key=lambda item: rank.get(item[0], len(rank)))
+
+    def download(self, url):
+        '''
+        Streams url into the object store. Returns (object path relative to
+        root, sha256, content type, size, whether it was new).
+        '''
+        with self.session.get(url, auth=self.auth, stream=True,
+                              timeout=self.timeout) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', "") \
+                .split(';')[0].strip().lower()
+
+            if not content_type.startswith(('image/', 'video/')):
+                raise ArchiveError("{0} is {1}, not a photo or video."
+                                   "".format(url, content_type or "untyped"))
+
+            digest = hashlib.sha256()
+            size = 0
+
+            with tempfile.NamedTemporaryFile(dir=os.path.join(self.root,
+                                                              'tmp'),
+                                             delete=False) as f:
+                try:
+                    for chunk in response.iter_content(self.chunk_size):
+                        size += len(chunk)
+
+                        if size > self.max_bytes:
+                            raise ArchiveError("{0} is over {1} bytes."
+                                               "".format(url, self.max_bytes))
+
+                        digest.update(chunk)
+                        f.write(chunk)
+                except BaseException:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+
+        digest = digest.hexdigest()
+        extension = EXTENSIONS.get(content_type, None) or \
+            mimetypes.guess_extension(content_type) or ""
+        object = "objects/{0}/{1}{2}".format(digest[:2], digest, extension)
+        target = os.path.join(self.root, object)
+
+        if os.path.exists(target):
+            os.remove(f.name)
+            return object, digest, content_type, size, False
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(f.name, target)
+
+        return object, digest, content_type, size, True
+
+    def thumbnail(self, object, digest, content_type):
+        if not content_type.startswith('image/') or not self.thumbnail_size:
+            return None
+
+        thumbnail = "thumbs/{0}/{1}.jpg".format(digest[:2], digest)
+        target = os.path.join(self.root, thumbnail)
+
+        if os.path.exists(target):
+            return thumbnail
+
+        try:
+            if make_thumbnail(os.path.join(self.root, object), target,
+                              self.thumbnail_size) is None:
+                return None
+        except (OSError, subprocess.SubprocessError):
+            logger.exception("No thumbnail for %s.", object)
+            return None
+
+        return thumbnail
+
+    def _archive(self, url, game, player, stop, received):
+        # Retried webhooks replay their reply, but a GM relay or a resend
+        # can bring the same URL back.
+        if self.index.known(url):
+            self.duplicates += 1
+            return None
+
+        attempt = 0
+
+        while True:
+            try:
+                object, digest, content_type, size, new = self.download(url)
+                break
+            except ArchiveError as e:
+                self.failed += 1
+                logger.warning("Not archiving: %s", e)
+                return None
+            except OSError:
+                # requests' errors are OSErrors too.
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    logger.exception("Giving up on archiving %s after %d "
+                                     "attempts.", url, attempt + 1)
+                    return None
+
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+        thumbnail = self.thumbnail(object, digest, content_type)
+
+        if self.index.add(game, player, stop, digest, object, thumbnail,
+                          content_type, size, url, received):
+            self.archived += 1
+
+        if not new:
+            self.duplicates += 1
+
+        return object
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+
+            try:
+                if job is _STOP:
+                    return
+
+                self._archive(*job)
+            except Exception:
+                logger.exception("Archiving %s failed.", job[0])
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,92 @@
+'''
+Photo archive throughput and memory: downloads from a local stand-in for
+Twilio's media host, with a few workers, streamed in chunks versus read
+whole, plus how long a webhook waits to queue one.
+
+    python benchmarks/bench_archive.py --photos 200 --size 2000000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from archive import PhotoArchive  # noqa: E402
+
+
+class MediaHost(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # Each photo differs, so none are deduplicated.
+        body = self.path.encode('ascii').ljust(self.server.size, b"\0")
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        for start in range(0, len(body), 1 << 16):
+            self.wfile.write(body[start:start + (1 << 16)])
+
+    def log_message(self, *args):
+        pass
+
+
+def run(name, server, photos, workers, chunk_size):
+    with tempfile.TemporaryDirectory() as directory:
+        archive = PhotoArchive(directory, workers=workers,
+                               chunk_size=chunk_size)
+        base = "http://127.0.0.1:{0}/{1}".format(server.server_address[1],
+                                                 name)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        queued = 0
+        for n in range(0, photos):
+            started = time.perf_counter()
+            archive.put("{0}/{1}.jpg".format(base, n), 'bench', 'Red',
+                        'Fish')
+            queued += time.perf_counter() - started
+
+        archive.drain()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        archive.stop()
+
+        print("{0:<22} {1:>10.1f} {2:>12.1f} {3:>12.1f}".format(
+            name, photos / elapsed, peak / 1e6, queued / photos * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--size', type=int, default=2000000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHost)
+    server.size = args.size
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print("{0:<22} {1:>10} {2:>12} {3:>12}".format("", "photos/s",
+                                                   "peak MB", "queue us"))
+    run("streamed, 64 KiB", server, args.photos, args.workers, 1 << 16)
+    run("whole file", server, args.photos, args.workers, args.size + 1)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+Parsing throughput of CommandParser against the upper()/startswith chains
+it replaced, over a mix of keywords, aliases, typos and free text.
+
+    python benchmarks/bench_commands.py --iterations 100000
+'''
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from commands import CommandParser  # noqa: E402
+
+
+BODIES = [
+    ("keyword", "CLUE"),
+    ("punctuated", "Yes!!!!"),
+    ("arguments", "ADMIN 3 Red"),
+    ("alias", "hint"),
+    ("typo", "cleu"),
+    ("free text", "We are at the bridge but can't find the sign"),
+]
+
+
+def chain(body):
+    # Roughly what sms() and its views did: upper() per check.
+    if body.upper().startswith("ADMIN"):
+        return 'ADMIN'
+    elif body.upper().startswith("HELP"):
+        return 'HELP'
+    elif body.upper().startswith("STUCK"):
+        return 'STUCK'
+    elif body.upper().startswith("YES"):
+        return 'YES'
+    elif "NO" == body.upper():
+        return 'NO'
+    elif "CLUE" == body.upper():
+        return 'CLUE'
+
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    commands = CommandParser({'RULES': {'Aliases': ["RULE"]}})
+
+    print("{0:<12} {1:>8} {2:>12} {3:>12} {4:>12}".format(
+        "body", "command", "parse ns", "chain ns", "parses/s"))
+
+    total = 0
+    for name, body in BODIES:
+        parsed = timeit.timeit(lambda: commands.parse(body),
+                               number=args.iterations) / args.iterations
+        chained = timeit.timeit(lambda: chain(body),
+                                number=args.iterations) / args.iterations
+        total += parsed
+
+        print("{0:<12} {1:>8} {2:>12.0f} {3:>12.0f} {4:>12,.0f}".format(
+            name, str(commands.parse(body).name), parsed * 1e9,
+            chained * 1e9, 1 / parsed))
+
+    print("mixed: {0:,.0f} parses/s".format(len(BODIES) / total))
+
+
+if __name__ == '__main__':
+    main()
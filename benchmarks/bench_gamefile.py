@@ -0,0 +1,92 @@
+'''
+Loading a game file: parsing and validating the JSON versus reading the
+snapshot compile_games.py writes, for the bundled game and a generated
+one with many stops.
+
+    python benchmarks/bench_gamefile.py --stops 2000 --iterations 20
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+from schema import compile_definition  # noqa: E402
+from schema import load_definition  # noqa: E402
+from schema import save_snapshot  # noqa: E402
+from schema import validate  # noqa: E402
+
+
+def generate(stops):
+    names = ["Stop{0}".format(n) for n in range(0, stops)]
+
+    def messages(text):
+        return {'Messages': [{'Body': text},
+                             {'Body': "Watch: {0}", 'Path': 'video'}]}
+
+    return {'Stop': {name: {'Introduction': messages("Go to " + name),
+                            'Clues': [{'Messages': [{'Body': "Clue {0}"
+                                                             "".format(n)}]}
+                                      for n in range(0, 3)],
+                            'Victory': dict(messages("Found " + name),
+                                            Next=following)}
+                     for name, following in zip(names,
+                                                names[1:] + ["Done"])}}
+
+
+def per_load(function, iterations):
+    return timeit.timeit(function, number=iterations) / iterations * 1e3
+
+
+def measure(name, path, iterations):
+    endpoints = {'video'}
+
+    def parse():
+        with open(path) as f:
+            definition = json.load(f)
+        validate(definition, endpoints=endpoints)
+        return definition
+
+    def snapshot():
+        return load_definition(path, endpoints=endpoints)[0]
+
+    save_snapshot(path, parse())
+
+    print("{0:<22} {1:>12.2f} {2:>12.2f} {3:>12.2f}".format(
+        name, per_load(parse, iterations), per_load(snapshot, iterations),
+        per_load(lambda: compile_definition(snapshot()), iterations)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stops', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        bundled = os.path.join(directory, 'game.json')
+        shutil.copy('static/data/game.json', bundled)
+
+        generated = os.path.join(directory, 'generated.json')
+        with open(generated, 'w') as f:
+            json.dump(generate(args.stops), f)
+
+        print("{0:<22} {1:>12} {2:>12} {3:>12}".format(
+            "ms per load", "json, check", "snapshot", "+ compile"))
+
+        measure("bundled", bundled, args.iterations * 50)
+        measure("{0} stops".format(args.stops), generated, args.iterations)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Overhead of the built-in metrics: one histogram observation, a /metrics
+scrape, and /sms requests with and without the slow request profiler
+sampling them.
+
+    python benchmarks/bench_metrics.py --iterations 20000
+'''
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ.setdefault('TWILIO_CALLER_ID', '+15558675309')
+os.environ.setdefault('TWILIO_PLAYER', '+15559990000')
+os.environ.setdefault('TWILIO_GM', '+15556667777')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+os.environ['TWILIO_DISPATCH_WORKERS'] = '0'
+os.environ['TWILIO_VALIDATE_SIGNATURES'] = 'false'
+
+from app import app  # noqa: E402
+from metrics import SlowRequestProfiler  # noqa: E402
+
+
+def per_call(function, iterations):
+    return timeit.timeit(function, number=iterations) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    metrics = app.extensions['metrics']
+    timer = app.extensions['request_timer']
+    histogram = metrics.metrics['http_request_duration_seconds']
+
+    client = app.test_client()
+    requests = max(1, args.iterations // 20)
+    number = iter(range(0, 10 ** 9))
+
+    def sms():
+        client.post('/sms', data={'MessageSid': "SM{0:032d}".format(
+                                      next(number)),
+                                  'To': app.config['TWILIO_CALLER_ID'],
+                                  'From': "+15559990000",
+                                  'Body': "HELP"})
+
+    print("{0:<34} {1:>10}".format("", "us"))
+    print("{0:<34} {1:>10.2f}".format(
+        "histogram observe",
+        per_call(lambda: histogram.observe(0.004, 'sms', 'POST', 200),
+                 args.iterations)))
+
+    sms()
+    print("{0:<34} {1:>10.2f}".format(
+        "/metrics scrape", per_call(metrics.render, requests)))
+
+    print("{0:<34} {1:>10.2f}".format("/sms request",
+                                      per_call(sms, requests)))
+
+    timer.profiler = SlowRequestProfiler(threshold=10)
+    print("{0:<34} {1:>10.2f}".format("/sms request, profiler on",
+                                      per_call(sms, requests)))
+
+
+if __name__ == '__main__':
+    main()
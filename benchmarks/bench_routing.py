@@ -0,0 +1,119 @@
+'''
+Compares the legacy /sms redirect chain with in-process routing.
+
+Twilio follows every <Redirect> with a fresh POST to our dyno, so each hop
+costs a network round trip on top of handler time. --rtt models that round
+trip when reporting end-to-end latency.
+
+    python benchmarks/bench_routing.py --iterations 500 --rtt 0.08
+'''
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ.setdefault('TWILIO_CALLER_ID', '+15558675309')
+os.environ.setdefault('TWILIO_PLAYER', '+15559990000')
+os.environ.setdefault('TWILIO_GM', '+15556667777')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+os.environ['TWILIO_DISPATCH_WORKERS'] = '0'
+# Sends run inline, so don't let the rate limit time them.
+os.environ['TWILIO_SEND_RATE'] = os.environ['TWILIO_SEND_BURST'] = '1000000'
+os.environ['TWILIO_VALIDATE_SIGNATURES'] = 'false'
+
+from flask import request  # noqa: E402
+from twilio.twiml.messaging_response import MessagingResponse  # noqa: E402
+
+from app import app  # noqa: E402
+
+
+REDIRECT = re.compile(r'<Redirect>([^<]+)</Redirect>')
+
+# Each message needs its own sid, or it is replayed as a retry.
+sids = itertools.count()
+
+SCENARIOS = [
+    ("player-start", "+15559990000", "YES", None),
+    ("player-clue", "+15559990000", "CLUE", "Fish"),
+    ("player-admin", "+15559990000", "ADMIN 1", "Fish"),
+    ("gm-relay", "+15556667777", "On our way.", None),
+]
+
+
+@app.route('/bench/legacy-sms', methods=['POST'])
+def legacy_sms():
+    response = MessagingResponse()
+
+    if request.form['From'] == app.config.get('TWILIO_GM'):
+        response.redirect('/gm')
+    else:
+        response.redirect('/player')
+
+    return str(response)
+
+
+def deliver(client, url, params):
+    requests = 0
+
+    while url:
+        response = client.post(url, data=params)
+        requests += 1
+
+        match = REDIRECT.search(response.get_data(as_text=True))
+        url = match.group(1) if match else None
+
+    return requests
+
+
+def message(from_, body):
+    return {'SmsSid': "SM{0:032d}".format(next(sids)), 'From': from_,
+            'To': '+15558675309', 'Body': body}
+
+
+def run(entry, from_, body, stop, iterations):
+    client = app.test_client()
+
+    if stop:
+        client.set_cookie('localhost', 'Stop', stop)
+
+    requests = deliver(client, entry, message(from_, body))
+
+    start = time.perf_counter()
+    for _ in range(0, iterations):
+        client.set_cookie('localhost', 'Clue', '0')
+        deliver(client, entry, message(from_, body))
+    elapsed = (time.perf_counter() - start) / iterations
+
+    return requests, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--rtt', type=float, default=0.05,
+                        help="Modeled Twilio to dyno round trip, seconds.")
+    args = parser.parse_args()
+
+    print("{0:<14} {1:>8} {2:>12} {3:>12} {4:>14}".format(
+        "scenario", "mode", "requests", "handler ms", "end-to-end ms"))
+
+    for name, from_, body, stop in SCENARIOS:
+        for mode, entry in (("legacy", '/bench/legacy-sms'),
+                            ("routed", '/sms')):
+            requests, elapsed = run(entry, from_, body, stop,
+                                    args.iterations)
+            print("{0:<14} {1:>8} {2:>12} {3:>12.3f} {4:>14.1f}".format(
+                name, mode, requests, elapsed * 1000,
+                (elapsed + requests * args.rtt) * 1000))
+
+
+if __name__ == '__main__':
+    main()
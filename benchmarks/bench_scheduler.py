@@ -0,0 +1,77 @@
+'''
+Hint timers for many players: scheduling, rescheduling as players make
+progress, cancelling and firing, per operation, with and without the
+SQLite backend.
+
+    python benchmarks/bench_scheduler.py --players 100000
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from scheduler import Scheduler  # noqa: E402
+from scheduler import SQLiteTimerBackend  # noqa: E402
+
+
+def per_op(function, count):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(name, scheduler, players):
+    keys = ["game:+1555{0:07d}".format(n) for n in range(0, players)]
+    dues = [random.uniform(0, 3600) for _ in keys]
+
+    def schedule():
+        for key, due in zip(keys, dues):
+            scheduler.schedule(key, 'hint', due, {'stop': "Fish"})
+
+    def reschedule():
+        for key, due in zip(keys, dues):
+            scheduler.schedule(key, 'hint', due + 600, {'stop': "Bridge"})
+
+    def cancel():
+        for key in keys[::2]:
+            scheduler.cancel(key, 'hint')
+
+    def fire():
+        scheduler.run_due(10 ** 6)
+
+    times = (per_op(schedule, players), per_op(reschedule, players),
+             per_op(cancel, players // 2))
+
+    # Written out, so firing claims each timer from the backend.
+    scheduler.flush()
+
+    print("{0:<10} {1:>10.2f} {2:>10.2f} {3:>10.2f} {4:>10.2f}".format(
+        name, *times, per_op(fire, players - players // 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=100000)
+    args = parser.parse_args()
+
+    random.seed(1)
+
+    print("{0:<10} {1:>10} {2:>10} {3:>10} {4:>10}".format(
+        "us", "schedule", "replace", "cancel", "fire"))
+
+    run("memory", Scheduler(lambda timer: None), args.players)
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteTimerBackend(os.path.join(directory, 'timers.db'))
+        run("sqlite", Scheduler(lambda timer: None, backend,
+                                flush_interval=60, batch_size=10 ** 9),
+            args.players)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+'''
+Throughput of the production server as gunicorn workers are added.
+
+Starts gunicorn with gunicorn.conf.py at each worker count and has client
+processes hammer the /sms -> /player/<stop> flow over keep-alive
+connections: each client starts a hunt with YES, then loops on CLUE.
+Sessions go in a temporary SQLite database so the workers share them.
+
+    python benchmarks/bench_serving.py --workers 1 2 4 --duration 10
+'''
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from urllib.parse import urlencode
+
+from twilio.request_validator import RequestValidator
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers, threads, directory):
+    env = dict(os.environ,
+               PORT=str(port),
+               WEB_CONCURRENCY=str(workers),
+               WEB_THREADS=str(threads),
+               SESSION_DATABASE=os.path.join(directory, 'sessions.db'),
+               TWILIO_FAKE_CLIENT='true')
+    env.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+    env.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+    env.setdefault('TWILIO_CALLER_ID', '+15558675309')
+    env.setdefault('TWILIO_GM', '+15556667777')
+
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app',
+                               '--config', 'gunicorn.conf.py',
+                               '--access-logfile', '/dev/null'],
+                              cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+
+    for _ in range(0, 100):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.1)
+
+    server.kill()
+    raise RuntimeError("gunicorn did not start.")
+
+
+def client(args):
+    port, number, duration = args
+
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    validator = RequestValidator(os.environ.get('TWILIO_AUTH_TOKEN',
+                                                'yyyyyyy'))
+    url = "http://127.0.0.1:{0}/sms".format(port)
+    params = {'To': os.environ.get('TWILIO_CALLER_ID', '+15558675309'),
+              'From': "+1555{0:07d}".format(number)}
+
+    def post(body):
+        data = dict(params, Body=body)
+        headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                   'X-Twilio-Signature':
+                       validator.compute_signature(url, data)}
+
+        connection.request('POST', '/sms', urlencode(data), headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    post("YES")
+
+    requests = 0
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    while time.monotonic() < deadline:
+        if post("CLUE") != 200:
+            errors += 1
+        requests += 1
+
+    connection.close()
+
+    return requests, errors
+
+
+def measure(workers, threads, clients, duration):
+    port = free_port()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(port, workers, threads, directory)
+
+        try:
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.map(client, [(port, n, duration)
+                                            for n in range(0, clients)])
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(30)
+
+    requests = sum(r for r, _ in results)
+    errors = sum(e for _, e in results)
+
+    return requests / duration, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int,
+                        default=multiprocessing.cpu_count() * 2)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    print("{0} cores, {1} clients, {2} threads per worker".format(
+        multiprocessing.cpu_count(), args.clients, args.threads))
+    print("{0:>8} {1:>10} {2:>8} {3:>8}".format("workers", "req/s",
+                                                "scaling", "errors"))
+
+    baseline = None
+    for workers in args.workers:
+        throughput, errors = measure(workers, args.threads, args.clients,
+                                     args.duration)
+        baseline = baseline or throughput
+
+        print("{0:>8} {1:>10.0f} {2:>7.2f}x {3:>8}".format(
+            workers, throughput, throughput / baseline, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Cost of checking X-Twilio-Signature on each webhook.
+
+Compares the check on its own - a new RequestValidator per request, a
+shared one through validate(), and SignatureCheck with cached URL forms -
+then whole /sms requests with checking on and off, and how cheaply an
+unsigned request is turned away.
+
+    python benchmarks/bench_signatures.py --iterations 20000
+'''
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ.setdefault('TWILIO_CALLER_ID', '+15558675309')
+os.environ.setdefault('TWILIO_PLAYER', '+15559990000')
+os.environ.setdefault('TWILIO_GM', '+15556667777')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+os.environ['TWILIO_DISPATCH_WORKERS'] = '0'
+
+from twilio.request_validator import RequestValidator  # noqa: E402
+
+from app import app  # noqa: E402
+from app import signatures  # noqa: E402
+
+
+URL = "http://localhost/sms"
+
+
+def params(body, n=0):
+    return {'MessageSid': "SM{0:032d}".format(n),
+            'AccountSid': app.config['TWILIO_ACCOUNT_SID'],
+            'To': app.config['TWILIO_CALLER_ID'],
+            'From': "+15559990000",
+            'Body': body,
+            'NumMedia': '0'}
+
+
+def per_call(function, iterations):
+    return timeit.timeit(function, number=iterations) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    token = app.config['TWILIO_AUTH_TOKEN']
+    data = params("HELP")
+    signature = RequestValidator(token).compute_signature(URL, data)
+    shared = RequestValidator(token)
+
+    print("{0:<34} {1:>10}".format("check", "us"))
+
+    for name, check in [
+            ("new validator per request",
+             lambda: RequestValidator(token).validate(URL, data, signature)),
+            ("shared validator, validate()",
+             lambda: shared.validate(URL, data, signature)),
+            ("SignatureCheck, cached URLs",
+             lambda: signatures.valid(signature,
+                                      signatures.variants(
+                                          "http://localhost/", "/sms", ""),
+                                      data))]:
+        print("{0:<34} {1:>10.2f}".format(name,
+                                          per_call(check, args.iterations)))
+
+    client = app.test_client()
+    requests = max(1, args.iterations // 10)
+
+    # Each request needs its own sid, or it is replayed as a retry. They
+    # are signed up front so only the server's work is timed.
+    validator = RequestValidator(token)
+    messages = iter([(data, validator.compute_signature(URL, data))
+                     for data in (params("HELP", n)
+                                  for n in range(1, 3 * requests + 1))])
+
+    def signed():
+        data, signature = next(messages)
+        client.post('/sms', data=data,
+                    headers={'X-Twilio-Signature': signature})
+
+    def unsigned():
+        client.post('/sms', data=next(messages)[0])
+
+    print()
+    print("{0:<34} {1:>10}".format("/sms request", "us"))
+
+    app.config['TWILIO_VALIDATE_SIGNATURES'] = False
+    print("{0:<34} {1:>10.2f}".format("not checked",
+                                      per_call(unsigned, requests)))
+
+    app.config['TWILIO_VALIDATE_SIGNATURES'] = True
+    print("{0:<34} {1:>10.2f}".format("signed",
+                                      per_call(signed, requests)))
+    print("{0:<34} {1:>10.2f}".format("unsigned, rejected",
+                                      per_call(unsigned, requests)))
+
+
+if __name__ == '__main__':
+    main()
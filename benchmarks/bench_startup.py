@@ -0,0 +1,124 @@
+'''
+Cold start cost of a worker: importing the app, the deferred work that
+warm_up() does, and the first and second webhook after boot.
+
+Every run is a fresh interpreter so nothing is cached between them:
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --imports 15
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import json
+import time
+
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+timings = {'import': imported - start}
+
+if WARM:
+    start = time.perf_counter()
+    app.registry.get()
+    timings['games'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app.app.config['TWILIO_FAKE_CLIENT'] = None
+    app.make_client().messages
+    app.app.config['TWILIO_FAKE_CLIENT'] = 'true'
+    timings['client'] = time.perf_counter() - start
+
+client = app.app.test_client()
+params = {'To': '+15558675309', 'From': '+15559990000', 'Body': 'YES'}
+
+for name in ('first_request', 'second_request'):
+    start = time.perf_counter()
+    client.post('/sms', data=params)
+    timings[name] = time.perf_counter() - start
+
+print(json.dumps(timings))
+'''
+
+
+def environment():
+    env = dict(os.environ,
+               TWILIO_FAKE_CLIENT='true',
+               TWILIO_DISPATCH_WORKERS='0',
+               TWILIO_VALIDATE_SIGNATURES='false')
+    env.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+    env.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+    env.setdefault('TWILIO_CALLER_ID', '+15558675309')
+    env.setdefault('TWILIO_PLAYER', '+15559990000')
+    env.setdefault('TWILIO_GM', '+15556667777')
+
+    return env
+
+
+def sample(warm):
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD.replace('WARM', str(warm))],
+        cwd=ROOT, env=environment(), text=True)
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def imports(count):
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import app'],
+                            cwd=ROOT, env=environment(), text=True,
+                            stderr=subprocess.PIPE, check=True).stderr
+
+    modules = []
+    for line in output.splitlines()[1:]:
+        _, own, cumulative, name = [part.strip()
+                                    for part in line.replace(':', '|', 1)
+                                                    .split('|')]
+        modules.append((int(cumulative), int(own), name))
+
+    print("{0:<40} {1:>12} {2:>10}".format("module", "cumulative ms",
+                                           "self ms"))
+
+    for cumulative, own, name in sorted(modules, reverse=True)[:count]:
+        print("{0:<40} {1:>12.1f} {2:>10.1f}".format(name, cumulative / 1000,
+                                                     own / 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--imports', type=int, default=0,
+                        help="List the N slowest imports instead.")
+    args = parser.parse_args()
+
+    if args.imports:
+        imports(args.imports)
+        return
+
+    for warm in (False, True):
+        runs = [sample(warm) for _ in range(0, args.runs)]
+
+        print("{0} ({1} runs)".format("warm_up() at boot" if warm
+                                      else "lazy, first use", args.runs))
+        print("{0:<16} {1:>10} {2:>10}".format("stage", "median ms",
+                                               "max ms"))
+
+        for stage in runs[0]:
+            values = [run[stage] * 1000 for run in runs]
+            print("{0:<16} {1:>10.1f} {2:>10.1f}".format(
+                stage, statistics.median(values), max(values)))
+
+        print()
+
+
+if __name__ == '__main__':
+    main()
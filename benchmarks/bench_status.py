@@ -0,0 +1,105 @@
+'''
+Delivery status callback ingestion: DeliveryIndex updates per second and
+memory per tracked message, against a plain dict of status dicts keyed
+by sid, and whole /status requests.
+
+    python benchmarks/bench_status.py --messages 100000
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ.setdefault('TWILIO_CALLER_ID', '+15558675309')
+os.environ.setdefault('TWILIO_PLAYER', '+15559990000')
+os.environ.setdefault('TWILIO_GM', '+15556667777')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+os.environ['TWILIO_VALIDATE_SIGNATURES'] = 'false'
+
+from delivery import DeliveryIndex  # noqa: E402
+
+
+def sids(count):
+    return ["SM{0:032x}".format(n) for n in range(0, count)]
+
+
+def measure(name, build, count):
+    keys = sids(count)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    index = build(keys)
+    elapsed = time.perf_counter() - start
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    used = sum(stat.size_diff for stat in after.compare_to(before,
+                                                           'filename'))
+
+    print("{0:<26} {1:>14,.0f} {2:>12.0f}".format(
+        name, count * 3 / elapsed, used / count))
+
+    return index
+
+
+def plain(keys):
+    statuses = {}
+
+    for status in ('queued', 'sent', 'delivered'):
+        for sid in keys:
+            statuses[sid] = {'status': status, 'error_code': None}
+
+    return statuses
+
+
+def indexed(keys):
+    index = DeliveryIndex(max_entries=len(keys))
+
+    for status in ('queued', 'sent', 'delivered'):
+        for sid in keys:
+            index.update(sid, status)
+
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print("{0:<26} {1:>14} {2:>12}".format("", "updates/s",
+                                           "bytes/sid"))
+    measure("dict of dicts", plain, args.messages)
+    measure("DeliveryIndex", indexed, args.messages)
+
+    from app import app
+
+    client = app.test_client()
+    keys = sids(args.requests)
+
+    start = time.perf_counter()
+    for sid in keys:
+        client.post('/status', data={'MessageSid': sid,
+                                     'MessageStatus': 'delivered',
+                                     'From': '+15558675309',
+                                     'To': '+15559990000'})
+    elapsed = time.perf_counter() - start
+
+    print()
+    print("/status requests/s         {0:>14,.0f}".format(
+        args.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+'''
+Per-request TwiML rendering versus the precompiled cache.
+
+    python benchmarks/bench_twiml.py --iterations 20000
+'''
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+
+from app import app  # noqa: E402
+from app import registry  # noqa: E402
+from app import twiml  # noqa: E402
+from twiml import render_messages  # noqa: E402
+
+
+CASES = [
+    ("introduction", 'Fish', 'Introduction', 0),
+    ("clue", 'Bridge', 'Clues', 1),
+    ("victory", 'Farm', 'Victory', 0),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    game = registry.get().default
+
+    print("{0:<14} {1:>14} {2:>14} {3:>10}".format(
+        "section", "render us", "cached us", "speedup"))
+
+    with app.test_request_context(base_url="https://hunt.example.com/"):
+        for name, stop, section, index in CASES:
+            data = game.compiled.stops[stop]
+            messages = {'Introduction': data.introduction,
+                        'Victory': data.victory}.get(section, None) or \
+                data.clues[index]
+
+            def render():
+                return render_messages(messages, stop)
+
+            def cached():
+                return twiml.get(game, stop, section, index)
+
+            cached()
+
+            rendered = timeit.timeit(render, number=args.iterations)
+            served = timeit.timeit(cached, number=args.iterations)
+
+            print("{0:<14} {1:>14.2f} {2:>14.2f} {3:>9.1f}x".format(
+                name, rendered / args.iterations * 1e6,
+                served / args.iterations * 1e6, rendered / served))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+'''
+Replays signed Twilio webhook traffic against the WSGI app.
+
+Each virtual player walks the hunt - start, intro video, clues, photo
+submission - while a GM sends admin commands, all as form posts signed
+with X-Twilio-Signature. Twilio sends are stubbed with FakeClient.
+
+Latency percentiles and throughput per route are printed and written as
+JSON so runs on different commits can be compared:
+
+    python benchmarks/loadtest.py --concurrency 8 --players 200 \
+        --output loadtest.json
+    python benchmarks/loadtest.py --compare loadtest.json
+'''
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'ACxxxx')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'yyyyyyy')
+os.environ.setdefault('TWILIO_CALLER_ID', '+15558675309')
+os.environ.setdefault('TWILIO_PLAYER', '+15559990000')
+os.environ.setdefault('TWILIO_GM', '+15556667777')
+os.environ['TWILIO_FAKE_CLIENT'] = 'true'
+
+from twilio.request_validator import RequestValidator  # noqa: E402
+
+from app import app  # noqa: E402
+from app import registry  # noqa: E402
+
+
+BASE_URL = "http://localhost"
+
+_sids = itertools.count()
+
+
+class Traffic(object):
+    def __init__(self, auth_token):
+        self.validator = RequestValidator(auth_token)
+        self.to = app.config['TWILIO_CALLER_ID']
+        self.gm_number = app.config['TWILIO_GM']
+
+    def post(self, route, params):
+        signature = self.validator.compute_signature(BASE_URL + route,
+                                                     params)
+
+        return route, params, {'X-Twilio-Signature': signature}
+
+    def sms(self, route, from_, body, **extra):
+        params = {'MessageSid': "SM{0:032d}".format(next(_sids)),
+                  'AccountSid': app.config['TWILIO_ACCOUNT_SID'],
+                  'To': self.to,
+                  'From': from_,
+                  'Body': body,
+                  'NumMedia': '0'}
+        params.update(extra)
+
+        return self.post(route, params)
+
+    def call(self, from_):
+        return self.post('/voice', {'CallSid': "CA{0:032d}"
+                                               "".format(next(_sids)),
+                                    'AccountSid':
+                                        app.config['TWILIO_ACCOUNT_SID'],
+                                    'To': self.to,
+                                    'From': from_,
+                                    'CallStatus': 'ringing'})
+
+    def player(self, n):
+        from_ = "+1555{0:07d}".format(n)
+        stop = registry.get().default.definition['Stop']
+
+        yield self.sms('/sms', from_, "HELP")
+        yield self.sms('/sms', from_, "YES")
+
+        for name in stop:
+            route = '/player/{0}'.format(name)
+
+            yield self.sms(route, from_, "YES")
+            yield self.sms(route, from_, "CLUE")
+            yield self.sms('/sms', from_, "CLUE")
+            yield self.sms(route, from_, "", NumMedia='2',
+                           MediaUrl0="https://example.com/{0}/0.jpg"
+                                     "".format(n),
+                           MediaUrl1="https://example.com/{0}/1.jpg"
+                                     "".format(n))
+
+        yield self.call(from_)
+
+    def gm(self, n):
+        yield self.sms('/gm/admin', self.gm_number, "ADMIN STATUS")
+        yield self.sms('/sms', self.gm_number, "ADMIN {0}".format(n % 5))
+        yield self.sms('/sms', self.gm_number, "Keep going!")
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+
+    index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+
+    return samples[index]
+
+
+def label(route):
+    if route.startswith('/player/'):
+        return '/player/<stop>'
+
+    return route
+
+
+def run(players, concurrency):
+    traffic = Traffic(app.config['TWILIO_AUTH_TOKEN'])
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def script(n):
+        # A client per player - the test client keeps cookies.
+        client = app.test_client()
+
+        requests = list(traffic.player(n))
+        if n % 10 == 0:
+            requests.extend(traffic.gm(n))
+
+        timings = []
+        for route, params, headers in requests:
+            start = time.perf_counter()
+            response = client.post(route, data=params, headers=headers)
+            timings.append((label(route), time.perf_counter() - start,
+                            response.status_code))
+
+        with lock:
+            for route, elapsed, status in timings:
+                samples.setdefault(route, []).append(elapsed)
+                if status >= 400:
+                    errors[route] = errors.get(route, 0) + 1
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(script, range(0, players)))
+
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for route, timings in sorted(samples.items()):
+        timings.sort()
+        routes[route] = {
+            'requests': len(timings),
+            'errors': errors.get(route, 0),
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'throughput_rps': len(timings) / elapsed}
+
+    total = sum(route['requests'] for route in routes.values())
+
+    return {'commit': commit(),
+            'python': platform.python_version(),
+            'players': players,
+            'concurrency': concurrency,
+            'elapsed_s': elapsed,
+            'throughput_rps': total / elapsed,
+            'routes': routes}
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short',
+                                        'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    print("commit {0}, {1} players, concurrency {2}, {3:.0f} req/s".format(
+        results['commit'], results['players'], results['concurrency'],
+        results['throughput_rps']))
+    print("{0:<16} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9}".format(
+        "route", "requests", "errors", "p50 ms", "p95 ms", "p99 ms",
+        "req/s"))
+
+    for route, stats in results['routes'].items():
+        print("{0:<16} {1:>8} {2:>7} {3:>9.2f} {4:>9.2f} {5:>9.2f} "
+              "{6:>9.0f}".format(route, stats['requests'], stats['errors'],
+                                 stats['p50_ms'], stats['p95_ms'],
+                                 stats['p99_ms'], stats['throughput_rps']))
+
+        if baseline and route in baseline['routes']:
+            before = baseline['routes'][route]
+            print("{0:<16} {1:>8} {2:>7} {3:>+8.0%} {4:>+8.0%} {5:>+8.0%} "
+                  "{6:>+8.0%}".format(
+                      "  vs " + str(baseline['commit']), "", "",
+                      change(before['p50_ms'], stats['p50_ms']),
+                      change(before['p95_ms'], stats['p95_ms']),
+                      change(before['p99_ms'], stats['p99_ms']),
+                      change(before['throughput_rps'],
+                             stats['throughput_rps'])))
+
+
+def change(before, after):
+    return (after - before) / before if before else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--output', help="Write results as JSON.")
+    parser.add_argument('--compare', help="JSON results to compare with.")
+    args = parser.parse_args()
+
+    results = run(args.players, args.concurrency)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
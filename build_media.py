@@ -0,0 +1,77 @@
+'''
+Build-time media variants for the static folder.
+
+Writes a gzip sibling for each compressible asset (served by media.py to
+clients accepting gzip) and, when ffmpeg is installed, a poster frame for
+each MP4 under static/video as static/video/posters/<name>.jpg, which
+the video page shows in place of the game's Thumbnail.
+
+    python build_media.py [--static static] [--force]
+'''
+import argparse
+import gzip
+import os
+import shutil
+import subprocess
+
+from media import COMPRESSIBLE
+from media import poster_path
+
+
+def compress(path, force=False):
+    target = path + '.gz'
+
+    if not force and os.path.exists(target) and \
+            os.path.getmtime(target) >= os.path.getmtime(path):
+        return None
+
+    with open(path, 'rb') as source, gzip.open(target, 'wb', 9) as out:
+        shutil.copyfileobj(source, out)
+
+    # Not worth serving if it barely shrank.
+    if os.path.getsize(target) > os.path.getsize(path) * 0.9:
+        os.remove(target)
+        return None
+
+    return target
+
+
+def poster(path, force=False):
+    target = os.path.normpath(poster_path(path.replace(os.sep, '/')))
+
+    if not force and os.path.exists(target):
+        return None
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-ss', '1',
+                    '-i', path, '-frames:v', '1', '-q:v', '3', target],
+                   check=True)
+
+    return target
+
+
+def build(static, force=False):
+    built = []
+    ffmpeg = shutil.which('ffmpeg')
+
+    for root, _, files in os.walk(static):
+        for name in files:
+            path = os.path.join(root, name)
+
+            if name.endswith(COMPRESSIBLE):
+                built.append(compress(path, force))
+            elif name.endswith('.mp4') and ffmpeg:
+                built.append(poster(path, force))
+
+    return [path for path in built if path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--static', default='static')
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    for path in build(args.static, force=args.force):
+        print(path)
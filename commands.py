@@ -0,0 +1,183 @@
+'''
+Parses texts from players and GMs into commands.
+
+A body is normalized once - trimmed, first word upper-cased with its
+punctuation dropped - and that word looked up in tables built when the
+parser is created. Keywords match with words after them ("ADMIN 2",
+"HELP me") where the command allows it. Aliases and typos only count
+when they are the whole text: "HINT" or "CLEU" is a clue request, "Clues
+are hard" is a question for the GM. Typos are anything one edit away from
+a keyword of four or more letters, found through a table of the keywords
+with one letter deleted and remembered once found.
+
+A bare keyword or alias typed in upper, lower or title case ("CLUE",
+"clue", "Clue") is matched as is, before any of that.
+
+Games can add aliases and their own reply commands:
+
+    "Commands": {
+        "CLUE": {"Aliases": ["PISTA"]},
+        "RULES": {"Aliases": ["RULE"],
+                  "Messages": [{"Body": "Stay off the train tracks."}],
+                  "Notify": "Rules requested."}
+    }
+
+A declared command replies with its Messages (Body and Media, no Path)
+and relays Notify, if present, to the GM.
+'''
+import string
+
+
+# Keyword: (aliases, whether words may follow it)
+COMMANDS = {
+    'ADMIN': ((), True),
+    'START': ((), True),
+    'HELP': (('INFO', 'OPTIONS', 'MENU'), True),
+    'STUCK': (('SOS', 'LOST'), True),
+    'YES': (('Y', 'YEP', 'YEAH', 'YUP'), True),
+    'NO': (('N', 'NOPE', 'NAH'), False),
+    'CLUE': (('HINT',), False),
+    'BROADCAST': (('BCAST',), True),
+}
+
+FUZZY_LENGTH = 4
+
+# Words remembered by fuzzy(), matched or not, before it starts over.
+FUZZY_CACHE = 1024
+
+PUNCTUATION = string.punctuation + string.whitespace
+
+
+def deletions(word):
+    return set(word[:n] + word[n + 1:] for n in range(0, len(word)))
+
+
+class Command(object):
+    __slots__ = ('name', 'args', 'text')
+
+    def __init__(self, name, args=(), text=""):
+        self.name = name
+        self.args = args
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, Command) and \
+            (self.name, self.args, self.text) == \
+            (other.name, other.args, other.text)
+
+    def __repr__(self):
+        return "<Command {0} {1}>".format(self.name, " ".join(self.args))
+
+
+class CommandParser(object):
+    def __init__(self, declared=None):
+        commands = {name: (list(aliases), trailing)
+                    for name, (aliases, trailing) in COMMANDS.items()}
+
+        self.replies = {}
+
+        for name, data in (declared or {}).items():
+            name = name.upper()
+            aliases = [alias.upper() for alias in data.get('Aliases', [])]
+
+            if name in commands:
+                commands[name][0].extend(aliases)
+            else:
+                commands[name] = (aliases, False)
+                self.replies[name] = data
+
+        self.keywords = {}
+        self.trailing = set()
+        self.aliases = {}
+
+        for name, (aliases, trailing) in commands.items():
+            self.keywords[name] = name
+
+            if trailing:
+                self.trailing.add(name)
+
+            for alias in aliases:
+                self.aliases[alias] = name
+
+        # Keywords with a letter deleted, for typos one edit away. A
+        # variant reachable from two keywords is dropped as ambiguous.
+        variants = {}
+        for name in commands:
+            if len(name) >= FUZZY_LENGTH:
+                for variant in deletions(name) | {name}:
+                    variants.setdefault(variant, set()).add(name)
+
+        self.variants = {variant: names.pop()
+                         for variant, names in variants.items()
+                         if len(names) == 1}
+
+        # Bare keywords and aliases as players usually type them, so the
+        # common texts skip normalizing altogether.
+        self.exact = {}
+        for word, name in list(self.aliases.items()) + \
+                list(self.keywords.items()):
+            for form in (word, word.lower(), word.capitalize()):
+                self.exact[form] = name
+
+        self.typos = {}
+
+    def parse(self, body):
+        name = self.exact.get(body, None)
+
+        if name is not None:
+            return Command(name, (), body)
+
+        text = (body or "").strip()
+        words = text.split()
+
+        if not words:
+            return Command(None, (), text)
+
+        word = words[0].upper().strip(PUNCTUATION)
+        args = tuple(words[1:])
+
+        name = self.keywords.get(word, None)
+
+        if name is not None:
+            if not args or name in self.trailing:
+                return Command(name, args, text)
+
+            return Command(None, (), text)
+
+        if args:
+            return Command(None, (), text)
+
+        name = self.aliases.get(word, None) or self.fuzzy(word)
+
+        return Command(name, (), text)
+
+    def fuzzy(self, word):
+        if len(word) < FUZZY_LENGTH - 1:
+            return None
+
+        try:
+            return self.typos[word]
+        except KeyError:
+            pass
+
+        if len(self.typos) >= FUZZY_CACHE:
+            self.typos.clear()
+
+        name = self.typos[word] = self.match(word)
+
+        return name
+
+    def match(self, word):
+        # Missing letter, then extra or swapped letter.
+        name = self.variants.get(word, None)
+
+        if name is not None:
+            return name
+
+        matches = set()
+        for variant in deletions(word):
+            name = self.variants.get(variant, None)
+            if name is not None:
+                matches.add(name)
+
+        return matches.pop() if len(matches) == 1 else None
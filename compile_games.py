@@ -0,0 +1,68 @@
+'''
+Checks game definitions and writes a snapshot of each valid one.
+
+Prints every problem found. Errors - and with --strict, warnings such as
+a missing video - fail the run. A game's snapshot is written beside it as
+<name>.snapshot and loaded in place of the JSON until the JSON changes.
+
+    python compile_games.py [--strict] [--check] [static/data/game.json ...]
+'''
+import argparse
+import json
+import os
+import sys
+
+from schema import save_snapshot
+from schema import snapshot_path
+from schema import validate
+
+
+def compile_game(path, static_folder, endpoints, strict=False, check=False):
+    with open(path) as f:
+        definition = json.load(f)
+
+    errors, warnings = validate(definition, static_folder, endpoints)
+
+    for problem in errors:
+        print("{0}: error: {1}".format(path, problem))
+
+    for problem in warnings:
+        print("{0}: warning: {1}".format(path, problem))
+
+    if errors or (strict and warnings):
+        # An old snapshot would keep serving the game as it was.
+        if os.path.exists(snapshot_path(path)):
+            os.remove(snapshot_path(path))
+        return False
+
+    if not check:
+        print("{0}: wrote {1}".format(path, save_snapshot(path, definition)))
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('games', nargs='*')
+    parser.add_argument('--strict', action='store_true',
+                        help="Treat warnings as errors.")
+    parser.add_argument('--check', action='store_true',
+                        help="Validate only, without writing snapshots.")
+    args = parser.parse_args()
+
+    # Path messages are checked against the app's routes.
+    from app import app
+
+    games = args.games or [os.path.join(app.root_path, path)
+                           for path in app.config['GAMES']]
+    endpoints = set(app.view_functions)
+
+    results = [compile_game(path, app.static_folder, endpoints,
+                            strict=args.strict, check=args.check)
+               for path in games]
+
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
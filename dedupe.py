@@ -0,0 +1,200 @@
+'''
+Replays the reply to a webhook Twilio has already delivered.
+
+Twilio retries a webhook that times out, with the same MessageSid. The
+first request for a sid and path claims it; its reply is stored when it
+finishes and returned as-is to any retry, without running the handler -
+so photos are not forwarded twice and players don't skip a stop. A retry
+that arrives while the first is still running gets an empty reply.
+
+Replies expire after ttl seconds. MemoryReplyBackend serves one process;
+SQLiteReplyBackend shares claims and replies between gunicorn workers.
+'''
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+
+PENDING = object()
+
+# Only these headers are replayed - the rest are rebuilt by Flask.
+HEADERS = ('Content-Type', 'Set-Cookie')
+
+
+class MemoryReplyBackend(object):
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, expires):
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+            self._entries[key] = (expires, PENDING)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return None
+
+    def store(self, key, reply, expires):
+        with self._lock:
+            self._entries[key] = (expires, reply)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteReplyBackend(object):
+    def __init__(self, path, max_entries=10000, prune_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           timeout=5, isolation_level=None)
+
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS replies "
+                                     "(key TEXT PRIMARY KEY, status INTEGER, "
+                                     "headers TEXT, body BLOB, "
+                                     "expires REAL)")
+
+    def claim(self, key, expires):
+        now = time.time()
+
+        with self._lock:
+            connection = self._connection
+
+            # IMMEDIATE takes the write lock up front, so two workers can't
+            # both see the key as free.
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT status, headers, body, "
+                                         "expires FROM replies "
+                                         "WHERE key = ?", (key,)).fetchone()
+
+                if row is not None and row[3] > now:
+                    connection.execute("COMMIT")
+
+                    if row[0] is None:
+                        return PENDING
+
+                    return (row[0], decode_headers(row[1]), row[2])
+
+                connection.execute("INSERT OR REPLACE INTO replies "
+                                   "(key, status, headers, body, expires) "
+                                   "VALUES (?, NULL, NULL, NULL, ?)",
+                                   (key, expires))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(now)
+
+        return None
+
+    def store(self, key, reply, expires):
+        status, headers, body = reply
+
+        with self._lock:
+            self._connection.execute("UPDATE replies SET status = ?, "
+                                     "headers = ?, body = ?, expires = ? "
+                                     "WHERE key = ?",
+                                     (status, encode_headers(headers), body,
+                                      expires, key))
+
+    def release(self, key):
+        with self._lock:
+            self._connection.execute("DELETE FROM replies WHERE key = ?",
+                                     (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM replies")
+
+    def _prune(self, now):
+        self._connection.execute("DELETE FROM replies WHERE expires <= ?",
+                                 (now,))
+        self._connection.execute("DELETE FROM replies WHERE key IN "
+                                 "(SELECT key FROM replies "
+                                 "ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) "
+                                            "FROM replies").fetchone()[0]
+
+
+def encode_headers(headers):
+    return "\n".join("{0}: {1}".format(name, value)
+                     for name, value in headers)
+
+
+def decode_headers(text):
+    return [tuple(line.split(": ", 1)) for line in text.splitlines()] \
+        if text else []
+
+
+class ReplyCache(object):
+    def __init__(self, backend, ttl=600):
+        self.backend = backend
+        self.ttl = ttl
+
+        self.duplicates = 0
+
+    def begin(self, key):
+        '''
+        Claims key, returning None. If it was already claimed, returns
+        PENDING or the stored (status, headers, body) reply.
+        '''
+        reply = self.backend.claim(key, time.time() + self.ttl)
+
+        if reply is not None:
+            self.duplicates += 1
+
+        return reply
+
+    def finish(self, key, response):
+        # Failures aren't kept, so Twilio's retry runs the handler again.
+        if response.status_code >= 500:
+            self.backend.release(key)
+            return
+
+        headers = [(name, value) for name, value in response.headers
+                   if name in HEADERS]
+
+        self.backend.store(key, (response.status_code, headers,
+                                 response.get_data()),
+                           time.time() + self.ttl)
+
+    def release(self, key):
+        self.backend.release(key)
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,349 @@
+'''
+Delivery status of outbound messages, from Twilio's status callbacks.
+
+Every message sent with a status_callback is indexed by its sid. Twilio
+posts each change - queued, sent, delivered, undelivered, failed - and
+callbacks can arrive out of order - even before messages.create returns -
+so a status is only ever replaced by a later one. Memory is bounded
+rather than small:
+
+    - statuses are an LRU of max_entries sids, each sid packed into bytes
+      and its status and error code into one int - still about 170 bytes
+      a sid with the OrderedDict, not far off a dict of dicts
+    - the message itself (recipient, body, media) is only kept until it
+      reaches a final status, for resending if it fails, in an LRU of
+      max_outstanding
+
+Changes are written to the backend in batches from a background thread,
+like the session store. With several workers a callback can reach one
+that didn't send the message, so SQLiteStatusBackend also keeps the
+messages, and a failure for a sid this worker doesn't know is looked up
+there.
+'''
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('accepted', 'scheduled', 'queued', 'sending', 'sent',
+            'receiving', 'received', 'delivered', 'read', 'undelivered',
+            'failed', 'canceled')
+
+CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# A status is never replaced by one of a lower rank.
+RANK = {'accepted': 0, 'scheduled': 1, 'queued': 2, 'sending': 3,
+        'sent': 4, 'receiving': 4, 'received': 5, 'delivered': 6,
+        'read': 7, 'undelivered': 6, 'failed': 6, 'canceled': 6}
+
+# RANK for SQLite, so workers writing the same sid keep the later status.
+RANK_SQL = "CASE {0} " + " ".join("WHEN '{0}' THEN {1}".format(status, rank)
+                                  for status, rank in RANK.items()) + " END"
+
+FINAL = frozenset(('delivered', 'read', 'undelivered', 'failed',
+                   'canceled', 'received'))
+
+FAILED = frozenset(('undelivered', 'failed'))
+
+# Error codes resending won't fix - bad, blocked, unsubscribed or landline
+# numbers, carrier filtering, a suspended account.
+PERMANENT_ERRORS = frozenset(('21211', '21610', '21612', '21614', '30002',
+                              '30004', '30005', '30006', '30007', '30034'))
+
+
+def encode_sid(sid):
+    '''
+    "SM" and 32 hex digits as 18 bytes - other strings as they are.
+    '''
+    try:
+        return sid[:2].encode('ascii') + bytes.fromhex(sid[2:])
+    except (ValueError, UnicodeEncodeError):
+        return sid.encode('utf-8')
+
+
+def pack(status, error_code):
+    error = int(error_code) if error_code and error_code.isdigit() else 0
+
+    return CODES[status] * 100000 + error % 100000
+
+
+def unpack(value):
+    code, error = divmod(value, 100000)
+
+    return STATUSES[code], str(error) if error else None
+
+
+class OutboundMessage(object):
+    __slots__ = ('kind', 'to', 'from_', 'body', 'media_url', 'attempt')
+
+    def __init__(self, kind, to, from_, body, media_url=None, attempt=0):
+        self.kind = kind
+        self.to = to
+        self.from_ = from_
+        self.body = body
+        self.media_url = media_url
+        self.attempt = attempt
+
+
+class SQLiteStatusBackend(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS statuses "
+                                     "(sid TEXT PRIMARY KEY, status TEXT, "
+                                     "error_code TEXT, message TEXT, "
+                                     "updated REAL)")
+
+    def save_many(self, rows):
+        rows = [(sid, status, error_code,
+                 json.dumps([message.kind, message.to, message.from_,
+                             message.body, message.media_url,
+                             message.attempt]) if message else None,
+                 updated)
+                for sid, status, error_code, message, updated in rows]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO statuses (sid, status, error_code, message, "
+                "updated) VALUES (?, ?, ?, ?, ?) ON CONFLICT (sid) DO UPDATE "
+                "SET status = {0}, error_code = {1}, "
+                "message = COALESCE(excluded.message, message), "
+                "updated = excluded.updated".format(
+                    self.later('excluded.status', 'status'),
+                    self.later('excluded.error_code', 'error_code')), rows)
+
+    @staticmethod
+    def later(new, old):
+        return "CASE WHEN {0} >= {1} THEN {2} ELSE {3} END".format(
+            RANK_SQL.format('excluded.status'), RANK_SQL.format('status'),
+            new, old)
+
+    def load(self, sid):
+        '''
+        Returns (status, error code, message) or None.
+        '''
+        with self._lock:
+            row = self._connection.execute("SELECT status, error_code, "
+                                           "message FROM statuses "
+                                           "WHERE sid = ?",
+                                           (sid,)).fetchone()
+
+        if row is None:
+            return None
+
+        return (row[0], row[1],
+                OutboundMessage(*json.loads(row[2])) if row[2] else None)
+
+
+class DeliveryIndex(object):
+    def __init__(self, backend=None, max_entries=100000,
+                 max_outstanding=10000, flush_interval=5.0, batch_size=500):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_outstanding = max_outstanding
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.callbacks = 0
+        self.failures = 0
+
+        self._statuses = OrderedDict()
+        self._outstanding = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        atexit.register(self.close)
+
+    def sent(self, sid, message, status='queued'):
+        '''
+        Records a message just sent. Returns it if a callback that got here
+        first already failed it, like update() would have, otherwise None.
+        '''
+        key = encode_sid(sid)
+        failed = None
+
+        with self._lock:
+            current = self._statuses.get(key, None)
+            error_code = None
+
+            if current is None or RANK[status] > RANK[unpack(current)[0]]:
+                self._set(key, pack(status, None))
+            else:
+                status, error_code = unpack(current)
+
+            if status in FAILED:
+                failed = message
+            elif status not in FINAL:
+                self._outstanding[key] = message
+
+                while len(self._outstanding) > self.max_outstanding:
+                    self._outstanding.popitem(last=False)
+
+            self._mark(sid, status, error_code, message)
+
+        self._schedule()
+
+        return failed
+
+    def update(self, sid, status, error_code=None):
+        '''
+        Records a callback. Returns the message if it has just failed and
+        is still known, otherwise None.
+        '''
+        if status not in CODES:
+            return None
+
+        key = encode_sid(sid)
+        failed = None
+
+        with self._lock:
+            self.callbacks += 1
+
+            current = self._statuses.get(key, None)
+
+            if current is not None:
+                previous = unpack(current)[0]
+
+                if RANK[status] < RANK[previous] or \
+                        (previous in FINAL and RANK[status] == RANK[previous]):
+                    return None
+
+            self._set(key, pack(status, error_code))
+
+            if status in FINAL:
+                message = self._outstanding.pop(key, None)
+
+                if status in FAILED:
+                    self.failures += 1
+                    failed = self._recorded(sid, message)
+
+            self._mark(sid, status, error_code, None)
+
+        self._schedule()
+
+        return failed
+
+    def status(self, sid):
+        '''
+        Returns (status, error code), or None for an unknown sid.
+        '''
+        value = self._statuses.get(encode_sid(sid), None)
+
+        return unpack(value) if value is not None else None
+
+    @property
+    def outstanding(self):
+        return len(self._outstanding)
+
+    @property
+    def pending(self):
+        return len(self._dirty)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = {}
+
+            if dirty and self.backend is not None:
+                try:
+                    self.backend.save_many([(sid,) + row
+                                            for sid, row in dirty.items()])
+                except Exception:
+                    # Kept for the next flush, unless changed again since.
+                    with self._lock:
+                        for sid, row in dirty.items():
+                            self._dirty.setdefault(sid, row)
+                    raise
+
+            return len(dirty)
+
+    def clear(self):
+        with self._lock:
+            self._statuses.clear()
+            self._outstanding.clear()
+            self._dirty.clear()
+
+    def close(self):
+        self.flush()
+
+    def __len__(self):
+        return len(self._statuses)
+
+    def _set(self, key, value):
+        self._statuses[key] = value
+        self._statuses.move_to_end(key)
+
+        while len(self._statuses) > self.max_entries:
+            self._statuses.popitem(last=False)
+
+    def _recorded(self, sid, message):
+        if self.backend is None:
+            return message
+
+        if sid in self._dirty and self._dirty[sid][2] is not None:
+            return self._dirty[sid][2]
+
+        # Sent by another worker or evicted here - or already failed
+        # through another worker, which resends it.
+        row = self.backend.load(sid)
+
+        if row is None:
+            return message
+        elif row[0] in FINAL:
+            return None
+
+        return row[2] or message
+
+    def _mark(self, sid, status, error_code, message):
+        if self.backend is None:
+            return
+
+        if message is None and sid in self._dirty:
+            message = self._dirty[sid][2]
+
+        self._dirty[sid] = (status, error_code, message, time.time())
+
+    def _schedule(self):
+        if self.backend is None:
+            return
+
+        if self.flush_interval is None:
+            self.flush()
+            return
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flusher,
+                                                    name="status-flush",
+                                                    daemon=True)
+                    self._thread.start()
+
+        if len(self._dirty) >= self.batch_size:
+            self._wake.set()
+
+    def _flusher(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Status flush failed, retrying.")
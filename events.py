@@ -0,0 +1,200 @@
+'''
+Append-only log of game events for offline analytics.
+
+Events are flat dicts buffered in memory and written in batches by a
+background thread, to a JSON lines file or a SQLite table:
+
+    {"ts": 1700000000.0, "game": "game", "player": "game:+15559990000",
+     "type": "clue", "stop": "Fish", "clue": 0}
+
+Types are start, video, clue, photo (with the next stop), stuck, command,
+reset and restart. read_events() streams either format back in order for
+analyze_events.py.
+'''
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+COLUMNS = ('ts', 'game', 'player', 'type', 'stop')
+
+
+class JSONLWriter(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write_many(self, events):
+        self._file.write("".join(json.dumps(event, separators=(',', ':')) +
+                                 "\n" for event in events))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SQLiteWriter(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS events "
+                                     "(id INTEGER PRIMARY KEY, ts REAL, "
+                                     "game TEXT, player TEXT, type TEXT, "
+                                     "stop TEXT, data TEXT)")
+
+    def write_many(self, events):
+        rows = []
+        for event in events:
+            extra = {key: value for key, value in event.items()
+                     if key not in COLUMNS}
+            rows.append(tuple(event.get(column, None) for column in COLUMNS)
+                        + (json.dumps(extra) if extra else None,))
+
+        with self._connection:
+            self._connection.executemany("INSERT INTO events (ts, game, "
+                                         "player, type, stop, data) "
+                                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        self._connection.close()
+
+
+def open_writer(path):
+    if not path:
+        return None
+
+    if path.endswith(SQLITE_SUFFIXES):
+        return SQLiteWriter(path)
+
+    return JSONLWriter(path)
+
+
+def read_events(path):
+    '''
+    Yields the events in a log one at a time, oldest first.
+    '''
+    if path.endswith(SQLITE_SUFFIXES):
+        connection = sqlite3.connect(path)
+
+        try:
+            cursor = connection.execute("SELECT ts, game, player, type, "
+                                        "stop, data FROM events "
+                                        "ORDER BY id")
+
+            for row in cursor:
+                event = {column: value
+                         for column, value in zip(COLUMNS, row)
+                         if value is not None}
+                if row[-1]:
+                    event.update(json.loads(row[-1]))
+                yield event
+        finally:
+            connection.close()
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class EventLog(object):
+    '''
+    Buffers events and hands them to the writer in batches. With no writer
+    events are dropped, so logging costs nothing when it is off.
+    '''
+    def __init__(self, writer=None, batch_size=500, flush_interval=1.0,
+                 max_pending=100000):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.written = 0
+        self.dropped = 0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, type, **fields):
+        if self.writer is None:
+            return
+
+        event = {'ts': time.time(), 'type': type}
+        event.update(fields)
+
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+
+            self._pending.append(event)
+            pending = len(self._pending)
+
+        self._schedule(pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = []
+
+            if not pending or self.writer is None:
+                return 0
+
+            try:
+                self.writer.write_many(pending)
+            except Exception:
+                logger.exception("Dropped %d events.", len(pending))
+                self.dropped += len(pending)
+                return 0
+
+            self.written += len(pending)
+
+            return len(pending)
+
+    def close(self):
+        self.flush()
+
+    def _schedule(self, pending):
+        if self.flush_interval is None:
+            self.flush()
+            return
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flusher,
+                                                    name="event-flush",
+                                                    daemon=True)
+                    self._thread.start()
+
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _flusher(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            self.flush()
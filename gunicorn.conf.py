@@ -0,0 +1,67 @@
+'''
+Gunicorn settings for production - see Procfile.
+
+Workers and threads scale with WEB_CONCURRENCY and WEB_THREADS. Player
+sessions live in each worker's memory unless SESSION_DATABASE is set, so
+without it there is one worker and WEB_CONCURRENCY is ignored. Send HUP to
+the master for a graceful reload: new workers start before old ones finish
+their in-flight webhooks.
+'''
+import multiprocessing
+import os
+import sys
+
+
+bind = "0.0.0.0:{0}".format(os.environ.get('PORT', 5000))
+
+if os.environ.get('SESSION_DATABASE'):
+    workers = int(os.environ.get('WEB_CONCURRENCY',
+                                 min(multiprocessing.cpu_count() * 2 + 1, 8)))
+else:
+    if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        sys.stderr.write("WEB_CONCURRENCY needs a SESSION_DATABASE to share "
+                         "sessions between workers - running one.\n")
+    workers = 1
+
+# Tells the app, e.g. to read sessions through from the database.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Twilio gives up on a webhook after 15 seconds.
+timeout = int(os.environ.get('WEB_TIMEOUT', 15))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 20))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 75))
+
+# Recycle workers now and then so slow leaks can't build up mid-hunt - but
+# only by default when all the state a worker holds is on disk. Otherwise
+# a recycle loses team sessions, pending hints and timers, replies kept
+# for Twilio retries, and messages still waiting for a delivery status.
+DURABLE = ('SESSION_DATABASE', 'TIMER_DATABASE', 'DEDUPE_DATABASE',
+           'STATUS_DATABASE')
+
+max_requests = int(os.environ.get(
+    'WEB_MAX_REQUESTS',
+    5000 if all(os.environ.get(name) for name in DURABLE) else 0))
+max_requests_jitter = max_requests // 10
+
+# The Heroku router terminates TLS - trust its X-Forwarded-Proto so
+# external URLs and request signatures use https.
+forwarded_allow_ips = '*'
+
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # Load games and the Twilio client before the worker takes traffic,
+    # so the first webhook after a scale-up doesn't pay for them.
+    from app import warm_up
+
+    warm_up()
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+
+    shutdown()
@@ -0,0 +1,71 @@
+'''
+Pooled HTTP transport for the Twilio REST client.
+
+Kept apart from outbound.py so requests and the Twilio REST modules are
+only imported once the first message is sent.
+'''
+import threading
+
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+
+
+class PooledHttpClient(TwilioHttpClient):
+    '''
+    Keep-alive HTTP client for the Twilio REST API with a bounded connection
+    pool and separate connect and read timeouts.
+    '''
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                 **kwargs):
+        super(PooledHttpClient, self).__init__(pool_connections=True,
+                                               **kwargs)
+
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.adapter = HTTPAdapter(pool_connections=1,
+                                   pool_maxsize=pool_size,
+                                   pool_block=True)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+
+        self._lock = threading.Lock()
+
+    def request(self, *args, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+            if self.in_flight > self.pool_size:
+                self.saturated += 1
+
+        try:
+            return super(PooledHttpClient, self).request(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def connections(self):
+        pools = self.adapter.poolmanager.pools
+        total = 0
+
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                total += pool.num_connections
+
+        return total
+
+    def stats(self):
+        return {'pool_size': self.pool_size,
+                'requests': self.requests,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'saturated': self.saturated,
+                'connections': self.connections()}
@@ -0,0 +1,42 @@
+'''
+Thread-safe lazy initialization for things too slow to build at import.
+'''
+import threading
+
+
+class Lazy(object):
+    '''
+    Calls factory() once, on the first get(), even when several request
+    threads race for it.
+    '''
+    def __init__(self, factory):
+        self.factory = factory
+
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+
+        return self._value
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._loaded = False
@@ -9,3 +9,138 @@ TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', None)
 TWILIO_CALLER_ID = os.environ.get('TWILIO_CALLER_ID', None)
 TWILIO_PLAYER = os.environ.get('TWILIO_PLAYER', None)
 TWILIO_GM = os.environ.get('TWILIO_GM', None)
+
+# Reject webhooks without a valid X-Twilio-Signature. Only turn off for
+# local testing.
+TWILIO_VALIDATE_SIGNATURES = \
+    os.environ.get('TWILIO_VALIDATE_SIGNATURES', 'true') == 'true'
+
+# Outbound dispatch - 0 workers sends inline on the request thread.
+TWILIO_DISPATCH_WORKERS = int(os.environ.get('TWILIO_DISPATCH_WORKERS', 4))
+TWILIO_DISPATCH_RETRIES = int(os.environ.get('TWILIO_DISPATCH_RETRIES', 3))
+TWILIO_DISPATCH_BACKOFF = float(os.environ.get('TWILIO_DISPATCH_BACKOFF',
+                                               0.5))
+TWILIO_FAKE_CLIENT = os.environ.get('TWILIO_FAKE_CLIENT', None)
+
+# Public URL of the app, e.g. https://example.herokuapp.com/ - lets TwiML
+# be precompiled at startup.
+BASE_URL = os.environ.get('BASE_URL', None)
+
+# Player sessions - set SESSION_DATABASE to a SQLite path to persist them.
+# Sessions are cached in each process, so gunicorn only runs more than one
+# worker (WEB_CONCURRENCY, set by gunicorn.conf.py) with a SESSION_DATABASE,
+# and the workers then read and write through to it.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+SESSION_DATABASE = os.environ.get('SESSION_DATABASE', None)
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 3600))
+SESSION_FLUSH_INTERVAL = float(os.environ.get('SESSION_FLUSH_INTERVAL', 1.0))
+
+# Replies to webhooks are kept for DEDUPE_TTL seconds and replayed when
+# Twilio retries the same MessageSid. Set DEDUPE_DATABASE to a SQLite path
+# to share them between workers.
+DEDUPE_DATABASE = os.environ.get('DEDUPE_DATABASE', None)
+DEDUPE_CACHE_SIZE = int(os.environ.get('DEDUPE_CACHE_SIZE', 10000))
+DEDUPE_TTL = int(os.environ.get('DEDUPE_TTL', 600))
+
+# With BASE_URL set, outbound texts ask Twilio for delivery callbacks at
+# /status. Undelivered texts are resent up to STATUS_RETRIES times and
+# the GM is told about players' failed texts. The last STATUS_CACHE_SIZE
+# statuses are kept in memory; set STATUS_DATABASE to a SQLite path to
+# keep them on disk and share them between workers.
+STATUS_CALLBACKS = os.environ.get('STATUS_CALLBACKS', 'true') == 'true'
+STATUS_DATABASE = os.environ.get('STATUS_DATABASE', None)
+STATUS_CACHE_SIZE = int(os.environ.get('STATUS_CACHE_SIZE', 100000))
+STATUS_FLUSH_INTERVAL = float(os.environ.get('STATUS_FLUSH_INTERVAL', 1))
+STATUS_RETRIES = int(os.environ.get('STATUS_RETRIES', 2))
+
+# With BASE_URL set, games with HintAfter or Timers text players on their
+# own - a clue after a while without progress, or a message partway
+# through. Set TIMER_DATABASE to a SQLite path to keep pending timers
+# through restarts and share them between workers. Timers that come due
+# more than TIMER_MAX_LATENESS seconds late, e.g. after downtime, are
+# dropped.
+TIMER_DATABASE = os.environ.get('TIMER_DATABASE', None)
+TIMER_FLUSH_INTERVAL = float(os.environ.get('TIMER_FLUSH_INTERVAL', 1))
+TIMER_MAX_LATENESS = float(os.environ.get('TIMER_MAX_LATENESS', 600))
+
+# Set ARCHIVE_FOLDER, relative to the app directory unless absolute, to
+# keep the photos players send. ARCHIVE_WORKERS download at a time, files
+# over ARCHIVE_MAX_BYTES are skipped, and with ffmpeg installed each photo
+# gets an ARCHIVE_THUMBNAIL_SIZE pixel wide thumbnail. The GM texts ADMIN
+# GALLERY [team] for a link to a player or team's photos.
+ARCHIVE_FOLDER = os.environ.get('ARCHIVE_FOLDER', None)
+ARCHIVE_WORKERS = int(os.environ.get('ARCHIVE_WORKERS', 4))
+ARCHIVE_MAX_BYTES = int(os.environ.get('ARCHIVE_MAX_BYTES', 20 << 20))
+ARCHIVE_THUMBNAIL_SIZE = int(os.environ.get('ARCHIVE_THUMBNAIL_SIZE', 320))
+
+# Game definitions to load, comma separated, relative to the app directory
+# unless absolute. The first is the default hunt and picks up the
+# TWILIO_CALLER_ID, TWILIO_GM and TWILIO_PLAYER numbers. They are read on
+# first use.
+GAMES = os.environ.get('GAMES', 'static/data/game.json').split(',')
+
+# Games are checked as they load and refused if invalid. compile_games.py
+# writes a .snapshot beside each checked file, loaded instead of the JSON
+# until the JSON changes.
+GAME_SNAPSHOTS = os.environ.get('GAME_SNAPSHOTS', 'true') == 'true'
+
+# Each worker checks the GAMES files every GAME_RELOAD_INTERVAL seconds and
+# swaps in the new games when they change and load cleanly. 0 turns the
+# watch off; the GM can still text ADMIN RELOAD, which reloads only the
+# worker that receives it.
+GAME_RELOAD_INTERVAL = float(os.environ.get('GAME_RELOAD_INTERVAL', 5))
+
+# Seconds players' browsers may reuse a rendered video page.
+VIDEO_CACHE_MAX_AGE = int(os.environ.get('VIDEO_CACHE_MAX_AGE', 3600))
+
+# Static media - fingerprinted URLs are cached for a year, anything else
+# for STATIC_MAX_AGE seconds.
+STATIC_FINGERPRINT = os.environ.get('STATIC_FINGERPRINT', 'true') == 'true'
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 300))
+
+# Photos forwarded to the GM are batched into MMS of up to
+# MEDIA_BATCH_SIZE attachments, optionally collecting for
+# MEDIA_BATCH_WINDOW seconds.
+MEDIA_BATCH_WINDOW = float(os.environ.get('MEDIA_BATCH_WINDOW', 0))
+MEDIA_BATCH_SIZE = int(os.environ.get('MEDIA_BATCH_SIZE', 10))
+
+# Twilio REST client - keep-alive pool size, timeouts in seconds and a
+# per-sending-number token bucket of TWILIO_SEND_RATE messages a second.
+# The buckets are per process, so the rate and burst are split evenly
+# between the WEB_CONCURRENCY workers.
+TWILIO_POOL_SIZE = int(os.environ.get('TWILIO_POOL_SIZE', 10))
+TWILIO_CONNECT_TIMEOUT = float(os.environ.get('TWILIO_CONNECT_TIMEOUT', 3.05))
+TWILIO_READ_TIMEOUT = float(os.environ.get('TWILIO_READ_TIMEOUT', 10))
+TWILIO_SEND_RATE = float(os.environ.get('TWILIO_SEND_RATE', 10))
+TWILIO_SEND_BURST = int(os.environ.get('TWILIO_SEND_BURST', 20))
+
+# GM BROADCAST texts go out BROADCAST_PARALLELISM at a time across all
+# broadcasts, and the GM hears how it's going every BROADCAST_REPORT_EVERY
+# players (0 for just the final count).
+BROADCAST_PARALLELISM = int(os.environ.get('BROADCAST_PARALLELISM', 8))
+BROADCAST_REPORT_EVERY = int(os.environ.get('BROADCAST_REPORT_EVERY', 25))
+
+# GM notifications are collected per team for GM_DIGEST_WINDOW seconds
+# and sent as one summary - 0 sends each as it happens. STUCK always goes
+# straight out.
+GM_DIGEST_WINDOW = float(os.environ.get('GM_DIGEST_WINDOW', 0))
+GM_DIGEST_MAX_LINES = int(os.environ.get('GM_DIGEST_MAX_LINES', 20))
+GM_DIGEST_MAX_GROUPS = int(os.environ.get('GM_DIGEST_MAX_GROUPS', 500))
+
+# Append-only game event log for analyze_events.py - a .db/.sqlite path
+# writes SQLite, anything else JSON lines. Unset turns logging off.
+EVENT_LOG = os.environ.get('EVENT_LOG', None)
+EVENT_LOG_BATCH_SIZE = int(os.environ.get('EVENT_LOG_BATCH_SIZE', 500))
+EVENT_LOG_FLUSH_INTERVAL = float(os.environ.get('EVENT_LOG_FLUSH_INTERVAL',
+                                                1.0))
+
+# Prometheus metrics are served at /metrics - with METRICS_TOKEN set, only
+# to requests with an "Authorization: Bearer <token>" header.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', None)
+
+# Requests taking PROFILE_SLOW_REQUESTS seconds or more log the stacks they
+# spent their time in, sampled every PROFILE_INTERVAL seconds. Sampling
+# costs a little on every request, so it is off (0) by default.
+PROFILE_SLOW_REQUESTS = float(os.environ.get('PROFILE_SLOW_REQUESTS', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
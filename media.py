@@ -0,0 +1,156 @@
+'''
+Static media serving with content-hash fingerprinted URLs.
+
+url_for('static', filename='images/fish.gif') becomes
+/static/images/fish.<hash>.gif. Fingerprinted requests are served with a
+far-future immutable Cache-Control; Range requests get 206 partial content
+from Werkzeug's conditional send_file. A .gz sibling written by
+build_media.py is served to clients accepting gzip.
+'''
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+
+from flask import request
+from flask import send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+
+FINGERPRINT = re.compile(r'^(?P<name>.+)\.(?P<hash>[0-9a-f]{12})'
+                         r'(?P<ext>\.[A-Za-z0-9]+)$')
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html', '.txt')
+
+IMMUTABLE = 365 * 24 * 3600
+
+
+def poster_path(video):
+    '''Where build_media.py puts the poster frame for a static video.'''
+    directory, name = posixpath.split(video)
+
+    return posixpath.join(directory, 'posters',
+                          posixpath.splitext(name)[0] + '.jpg')
+
+
+def file_hash(path, chunk_size=1 << 16):
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:12]
+
+
+class StaticFiles(object):
+    def __init__(self, app, max_age=300):
+        self.app = app
+        self.directory = app.static_folder
+        self.max_age = max_age
+
+        self.hashes = {}
+
+        self._lock = threading.Lock()
+
+        app.url_defaults(self.url_defaults)
+        app.view_functions['static'] = self.serve
+
+    def digest(self, filename):
+        path = safe_join(self.directory, filename)
+
+        if path is None:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self.hashes.get(filename, None)
+
+        if entry is None or entry[0] != key:
+            entry = (key, file_hash(path))
+
+            with self._lock:
+                self.hashes[filename] = entry
+
+        return entry[1]
+
+    def fingerprint(self, filename):
+        digest = self.digest(filename)
+
+        if digest is None:
+            return filename
+
+        name, ext = os.path.splitext(filename)
+
+        return "{0}.{1}{2}".format(name, digest, ext)
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values \
+                and self.app.config.get('STATIC_FINGERPRINT', True):
+            values['filename'] = self.fingerprint(values['filename'])
+
+    def resolve(self, filename):
+        match = FINGERPRINT.match(filename)
+
+        if match:
+            original = match.group('name') + match.group('ext')
+
+            if os.path.isfile(safe_join(self.directory, original) or ''):
+                return original, match.group('hash')
+
+        return filename, None
+
+    def serve(self, filename):
+        filename, requested = self.resolve(filename)
+
+        # A stale fingerprint still gets the current file, just not cached
+        # forever.
+        digest = self.digest(filename)
+        immutable = requested is not None and requested == digest
+
+        max_age = IMMUTABLE if immutable else self.max_age
+
+        resp = self.send_compressed(filename, max_age, digest)
+
+        if resp is None:
+            resp = send_from_directory(self.directory, filename,
+                                       max_age=max_age, conditional=True,
+                                       etag=digest or True)
+
+        resp.cache_control.public = True
+        if immutable:
+            resp.cache_control.immutable = True
+
+        return resp
+
+    def send_compressed(self, filename, max_age, digest):
+        if not filename.endswith(COMPRESSIBLE) or request.range \
+                or 'gzip' not in request.accept_encodings:
+            return None
+
+        path = safe_join(self.directory, filename + '.gz')
+
+        if path is None or not os.path.isfile(path):
+            return None
+
+        try:
+            resp = send_from_directory(self.directory, filename + '.gz',
+                                       max_age=max_age, conditional=True,
+                                       etag="{0}-gz".format(digest))
+        except NotFound:
+            return None
+
+        resp.mimetype = mimetypes.guess_type(filename)[0] or \
+            'application/octet-stream'
+
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.vary.add('Accept-Encoding')
+
+        return resp
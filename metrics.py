@@ -0,0 +1,320 @@
+'''
+Counters, histograms and gauges served in the Prometheus text format.
+
+Histograms keep cumulative-free bucket counts per label set and are only
+summed into Prometheus' cumulative form when /metrics is scraped, so an
+observation is a bisect and a few additions under a lock. Gauges are
+functions called at scrape time - queue depths cost nothing between
+scrapes.
+
+RequestTimer times every request by endpoint. SlowRequestProfiler, when
+turned on, samples the stacks of requests in flight and logs where the
+slow ones spent their time.
+'''
+import bisect
+import collections
+import logging
+import sys
+import threading
+import time
+
+from flask import g
+from flask import request
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds - webhook handlers should answer well inside Twilio's 15s timeout.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ""
+
+    return "{" + ",".join('{0}="{1}"'.format(name, escape(value))
+                          for name, value in pairs) + "}"
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self.values = {}
+
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self.values.items())
+
+        for labels, value in values:
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+
+        # labels -> [count per bucket..., count above, sum]
+        self.values = {}
+
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts = self.values.get(labels, None)
+
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts))
+                            for labels, counts in self.values.items())
+
+        bounds = self.buckets + (float('inf'),)
+
+        for labels, counts in values:
+            total = 0
+
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield (self.name + "_bucket",
+                       format_labels(self.labels, labels,
+                                     [('le', format_value(bound))]),
+                       total)
+
+            yield (self.name + "_sum", format_labels(self.labels, labels),
+                   counts[-1])
+            yield (self.name + "_count", format_labels(self.labels, labels),
+                   total)
+
+
+class Timer(object):
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start,
+                               *self.labels)
+
+
+class Gauge(object):
+    '''
+    Reads its value from function() when scraped. A running total kept
+    elsewhere, like DispatchQueue.sent, is a gauge of type 'counter'.
+    '''
+    def __init__(self, name, help, function, type='gauge'):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.type = type
+
+    def samples(self):
+        yield self.name, "", self.function()
+
+
+class Metrics(object):
+    def __init__(self):
+        self.metrics = collections.OrderedDict()
+
+    def add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("Duplicate metric {0}.".format(metric.name))
+
+        self.metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, function, type='gauge'):
+        return self.add(Gauge(name, help, function, type))
+
+    def render(self):
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append("# HELP {0} {1}".format(metric.name, metric.help))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.type))
+
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append("{0}{1} {2}".format(name, labels,
+                                                     format_value(value)))
+            except Exception:
+                logger.exception("Could not collect %s.", metric.name)
+
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer(object):
+    '''
+    Observes each request's duration by endpoint, method and status.
+    Registered before the other request hooks so it times them too.
+    '''
+    def __init__(self, app, histogram, profiler=None):
+        self.histogram = histogram
+        self.profiler = profiler
+
+        app.before_request_funcs.setdefault(None, []).insert(0, self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.teardown)
+
+    def start(self):
+        g.request_started = time.perf_counter()
+
+        if self.profiler is not None:
+            self.profiler.begin()
+
+    def finish(self, response):
+        started = g.pop('request_started', None)
+
+        if started is not None:
+            elapsed = time.perf_counter() - started
+
+            self.histogram.observe(elapsed, request.endpoint or "",
+                                   request.method, response.status_code)
+
+            if self.profiler is not None:
+                self.profiler.end(elapsed, request.endpoint)
+
+        return response
+
+    def teardown(self, exception=None):
+        # Only left when the request failed before a response was made.
+        if g.pop('request_started', None) is not None and \
+                self.profiler is not None:
+            self.profiler.end(0, request.endpoint)
+
+
+class SlowRequestProfiler(object):
+    '''
+    Samples the stack of every request in flight every interval seconds.
+    When a request has taken threshold seconds or more, the stacks seen
+    most often are logged; faster requests' samples are thrown away.
+    '''
+    def __init__(self, threshold=1.0, interval=0.005, max_depth=30,
+                 top=5):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_depth = max_depth
+        self.top = top
+
+        self.slow = 0
+        self.profiles = collections.deque(maxlen=20)
+
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample,
+                                                name="request-profiler",
+                                                daemon=True)
+                self._thread.start()
+
+    def end(self, elapsed, endpoint):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+
+        if stacks is None or elapsed < self.threshold:
+            return None
+
+        self.slow += 1
+
+        profile = (endpoint, elapsed, stacks.most_common(self.top),
+                   sum(stacks.values()))
+        self.profiles.append(profile)
+
+        logger.warning("Slow request to %s took %.3fs:\n%s", endpoint,
+                       elapsed, format_profile(profile))
+
+        return profile
+
+    def stack(self, frame):
+        stack = []
+
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append("{0}:{1}".format(code.co_filename.rsplit('/', 1)[-1],
+                                          code.co_name))
+            frame = frame.f_back
+
+        return ";".join(reversed(stack))
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+
+            with self._lock:
+                if not self._active:
+                    continue
+
+                frames = sys._current_frames()
+
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident, None)
+
+                    if frame is not None:
+                        stacks[self.stack(frame)] += 1
+
+
+def format_profile(profile):
+    _, _, stacks, samples = profile
+
+    return "\n".join("  {0:>5.1f}% {1}".format(count * 100.0 / samples,
+                                               stack)
+                     for stack, count in stacks)
@@ -0,0 +1,514 @@
+'''
+Outbound message dispatch - keeps Twilio REST calls off the webhook path.
+'''
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from twilio.base.exceptions import TwilioRestException
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DispatchQueue(object):
+    def __init__(self, workers=4, max_retries=3, backoff=0.5, maxsize=1000):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.threads = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+
+        atexit.register(self.stop)
+
+    def start(self):
+        with self._lock:
+            if self.threads:
+                return
+
+            for n in range(0, self.workers):
+                thread = threading.Thread(target=self._work,
+                                          name="dispatch-{0}".format(n),
+                                          daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def put(self, send, *args, **kwargs):
+        if self.workers == 0:
+            return self.deliver(send, args, kwargs)
+
+        if not self.threads:
+            self.start()
+
+        # Callers are webhooks, which can't wait for a backlog to clear.
+        try:
+            self.queue.put_nowait((send, args, kwargs))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Dispatch queue full, dropping message to %s.",
+                           kwargs.get('to', None))
+
+    def drain(self, timeout=None):
+        if not self.threads:
+            return True
+
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while self.queue.unfinished_tasks:
+            if deadline and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+        return True
+
+    def stop(self, timeout=10):
+        with self._lock:
+            threads = self.threads
+            self.threads = []
+
+        if not threads:
+            return
+
+        for _ in threads:
+            self.queue.put(_STOP)
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+
+            try:
+                if job is _STOP:
+                    return
+
+                self.deliver(*job)
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, send, args, kwargs):
+        '''
+        Sends on the calling thread, retrying like the workers do.
+        '''
+        attempt = 0
+
+        while True:
+            try:
+                msg = send(*args, **kwargs)
+                self.sent += 1
+                return msg
+            except Exception as e:
+                if attempt >= self.max_retries or not retryable(e):
+                    self.failed += 1
+                    logger.exception("Giving up on outbound message after "
+                                     "{0} attempts.".format(attempt + 1))
+                    return None
+
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+
+class MediaBatcher(object):
+    '''
+    Folds media URLs bound for the same recipient into MMS of up to
+    max_media attachments. With a window, URLs arriving within that many
+    seconds of the first are folded into the same send.
+    '''
+    def __init__(self, dispatcher, window=0, max_media=10):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.max_media = max_media
+
+        self.media = 0
+        self.messages = 0
+
+        self.pending = {}
+
+        self._lock = threading.Lock()
+
+        atexit.register(self.flush_all)
+
+    @property
+    def saved(self):
+        return self.media - self.messages
+
+    def add(self, send, body, media_urls, **kwargs):
+        key = (send, body, tuple(sorted(kwargs.items())))
+
+        with self._lock:
+            self.media += len(media_urls)
+
+            batch = self.pending.get(key, None)
+
+            if batch is None:
+                batch = self.pending[key] = []
+
+                if self.window:
+                    timer = threading.Timer(self.window, self.flush,
+                                            args=(key,))
+                    timer.daemon = True
+                    timer.start()
+
+            batch.extend(media_urls)
+
+            full = len(batch) >= self.max_media
+
+        if full or not self.window:
+            self.flush(key)
+
+    def flush(self, key):
+        with self._lock:
+            batch = self.pending.pop(key, None)
+
+        if not batch:
+            return
+
+        send, body, kwargs = key[0], key[1], dict(key[2])
+
+        for n in range(0, len(batch), self.max_media):
+            chunk = batch[n:n + self.max_media]
+
+            with self._lock:
+                self.messages += 1
+
+            self.dispatcher.put(send, body,
+                                media_url=chunk if len(chunk) > 1
+                                else chunk[0],
+                                **kwargs)
+
+    def flush_all(self):
+        for key in list(self.pending):
+            self.flush(key)
+
+
+class Digest(object):
+    '''
+    Collects notification lines per recipient and group (a team, or None
+    for solo players) for window seconds and sends them as one message.
+    Memory stays bounded: a group flushes early at max_lines lines or
+    max_length characters, and past max_groups pending groups the oldest
+    is flushed to make room.
+    '''
+    def __init__(self, dispatcher, window=0, max_lines=20, max_length=1500,
+                 max_groups=500):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.max_lines = max_lines
+        self.max_length = max_length
+        self.max_groups = max_groups
+
+        self.lines = 0
+        self.messages = 0
+
+        self.pending = {}
+
+        self._lock = threading.Lock()
+
+        atexit.register(self.flush_all)
+
+    @property
+    def saved(self):
+        return self.lines - self.messages
+
+    def key(self, send, group, **kwargs):
+        return (send, group, tuple(sorted(kwargs.items())))
+
+    def add(self, send, group, line, **kwargs):
+        key = self.key(send, group, **kwargs)
+        evicted = None
+
+        with self._lock:
+            self.lines += 1
+
+            batch = self.pending.get(key, None)
+
+            if batch is None:
+                if len(self.pending) >= self.max_groups:
+                    evicted = next(iter(self.pending))
+
+                batch = self.pending[key] = []
+
+                if self.window:
+                    timer = threading.Timer(self.window, self.flush,
+                                            args=(key, batch))
+                    timer.daemon = True
+                    timer.start()
+
+            batch.append(line)
+
+            full = len(batch) >= self.max_lines or \
+                sum(len(line) + 3 for line in batch) >= self.max_length
+
+        if evicted is not None:
+            self.flush(evicted)
+
+        if full or not self.window:
+            self.flush(key)
+
+    def flush(self, key, batch=None):
+        with self._lock:
+            # A timer only flushes the batch it was started for.
+            if batch is not None and self.pending.get(key, None) is not batch:
+                return
+
+            batch = self.pending.pop(key, None)
+
+            if not batch:
+                return
+
+            self.messages += 1
+
+        send, group, kwargs = key[0], key[1], dict(key[2])
+
+        self.dispatcher.put(send, self.compose(group, batch), **kwargs)
+
+    def flush_all(self):
+        for key in list(self.pending):
+            self.flush(key)
+
+    def compose(self, group, lines):
+        prefix = "[{0}] ".format(group) if group else ""
+
+        if len(lines) == 1:
+            return prefix + lines[0]
+
+        return "{0}{1} updates:\n{2}".format(
+            prefix, len(lines), "\n".join("- " + line for line in lines))
+
+
+class Broadcast(object):
+    __slots__ = ('body', 'total', 'sent', 'failed', 'done')
+
+    def __init__(self, body, total):
+        self.body = body
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.done = threading.Event()
+
+    @property
+    def delivered(self):
+        return self.sent + self.failed
+
+
+class Broadcaster(object):
+    '''
+    Sends one body to many recipients, at most parallelism at a time
+    across every broadcast in flight, retrying like the dispatcher.
+    progress(sent, failed, total) is called every report_every deliveries
+    and once when all are done. The sends run on their own threads, so start()
+    returns at once - unless the dispatcher has no workers, when they run
+    in the caller. stop() waits for those in flight, e.g. at shutdown.
+    '''
+    def __init__(self, dispatcher, parallelism=8, report_every=0):
+        self.dispatcher = dispatcher
+        self.parallelism = parallelism
+        self.report_every = report_every
+
+        self.broadcasts = 0
+        self.threads = []
+
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._lock = threading.Lock()
+
+    def start(self, send, body, recipients, progress=None, **kwargs):
+        broadcast = Broadcast(body, len(recipients))
+        pending = iter(recipients)
+        lock = threading.Lock()
+
+        self.broadcasts += 1
+
+        def work():
+            while True:
+                with lock:
+                    recipient = next(pending, None)
+
+                if recipient is None:
+                    return
+
+                with self._slots:
+                    msg = self.dispatcher.deliver(
+                        send, (body,), dict(kwargs, to=recipient))
+
+                with lock:
+                    if msg is None:
+                        broadcast.failed += 1
+                    else:
+                        broadcast.sent += 1
+
+                    sent, failed = broadcast.sent, broadcast.failed
+                    delivered = sent + failed
+                    report = delivered == broadcast.total or \
+                        (self.report_every and
+                         delivered % self.report_every == 0)
+
+                if delivered == broadcast.total:
+                    broadcast.done.set()
+
+                if report and progress is not None:
+                    progress(sent, failed, broadcast.total)
+
+        if not recipients:
+            broadcast.done.set()
+        elif self.dispatcher.workers == 0:
+            work()
+        else:
+            threads = [threading.Thread(target=work,
+                                        name="broadcast-{0}".format(n),
+                                        daemon=True)
+                       for n in range(0, min(self.parallelism,
+                                             len(recipients)))]
+
+            with self._lock:
+                self.threads = [thread for thread in self.threads
+                                if thread.is_alive()] + threads
+
+            for thread in threads:
+                thread.start()
+
+        return broadcast
+
+    def stop(self, timeout=10):
+        '''
+        Waits for the broadcasts in flight to finish sending.
+        '''
+        with self._lock:
+            threads = self.threads
+            self.threads = []
+
+        deadline = time.monotonic() + timeout
+
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+
+def retryable(exception):
+    if isinstance(exception, TwilioRestException):
+        return exception.status == 429 or exception.status >= 500
+
+    return True
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+        self._lock = threading.Lock()
+
+    def take(self):
+        '''
+        Takes a token if one is available, otherwise returns the seconds
+        until the next one.
+        '''
+        with self._lock:
+            now = time.monotonic()
+
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter(object):
+    '''
+    A token bucket per sending number, so one busy number can't eat into
+    Twilio's limits for the others.
+    '''
+    def __init__(self, rate=10, burst=20, timeout=30):
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+
+        self.buckets = {}
+        self.throttled = 0
+        self.waited = 0.0
+
+        self._lock = threading.Lock()
+
+    def acquire(self, sender):
+        bucket = self.buckets.get(sender, None)
+
+        if bucket is None:
+            with self._lock:
+                bucket = self.buckets.setdefault(sender,
+                                                 TokenBucket(self.rate,
+                                                             self.burst))
+
+        deadline = time.monotonic() + self.timeout
+        wait = bucket.take()
+
+        if wait:
+            self.throttled += 1
+
+        while wait:
+            if time.monotonic() + wait > deadline:
+                raise TwilioRestException(429, "/Messages.json",
+                                          msg="Send rate for {0} exceeded."
+                                              "".format(sender))
+
+            time.sleep(wait)
+            self.waited += wait
+
+            wait = bucket.take()
+
+
+class FakeMessage(object):
+    def __init__(self, sid, **kwargs):
+        self.sid = sid
+        self.status = "queued"
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class FakeMessageList(object):
+    def __init__(self, failures=0, latency=0):
+        self.failures = failures
+        self.latency = latency
+        self.created = []
+
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise TwilioRestException(503, "/Messages.json",
+                                          msg="Fake outage.")
+
+            self.created.append(kwargs)
+            sid = "SMfake{0:026d}".format(len(self.created))
+
+        return FakeMessage(sid, **kwargs)
+
+
+class FakeClient(object):
+    '''
+    Stands in for twilio.rest.Client locally - records messages instead of
+    sending them.
+    '''
+    def __init__(self, failures=0, latency=0):
+        self.messages = FakeMessageList(failures=failures, latency=latency)
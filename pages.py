@@ -0,0 +1,71 @@
+'''
+Rendered page cache with strong ETags.
+'''
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from flask import make_response
+
+
+class Page(object):
+    __slots__ = ('body', 'status', 'etag', 'version')
+
+    def __init__(self, body, status, version):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.version = version
+
+    def response(self, request, max_age=3600):
+        resp = make_response(self.body, self.status)
+
+        resp.set_etag(self.etag)
+        resp.cache_control.public = True
+        resp.cache_control.max_age = max_age
+
+        if self.status == 200:
+            resp.make_conditional(request)
+
+        return resp
+
+
+class PageCache(object):
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, render):
+        '''
+        Returns the cached page for key, calling render() for a (body,
+        status) pair when missing or built from a different version.
+        '''
+        page = self._pages.get(key, None)
+
+        if page is not None and page.version is version:
+            self.hits += 1
+            return page
+
+        self.misses += 1
+
+        body, status = render()
+        page = Page(body, status, version)
+
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,243 @@
+'''
+Registry of running hunts, indexed by Twilio number and player number.
+
+A game definition may declare who plays it alongside its stops:
+
+    "Id": "lillie",
+    "Numbers": ["+15558675309"],
+    "GM": ["+15556667777"],
+    "Teams": {"Scavengers": ["+15559990000", "+15559990001"]},
+    "Start": "Fish"
+
+Stops are played in the order their Victory Next pointers chain. Without
+Start, the first stop is the one no other stop leads to.
+
+Players texting a game's number who are not on a declared team play solo.
+"Players" lists solo players the GM's messages are relayed to. "Commands"
+adds keywords - see commands.py. Game files are checked by schema.py as
+they load.
+
+Games can also push messages on their own:
+
+    "HintAfter": 10,
+    "Timers": [{"After": 90, "Messages": [{"Body": "30 minutes left!"}]}]
+
+After HintAfter minutes at a stop without finding it, players are sent
+their next clue, and again every HintAfter minutes until the clues run
+out. A stop's own HintAfter overrides the game's; 0 turns hints off. Each
+Timers entry is sent After minutes into the game.
+'''
+import os
+
+from commands import CommandParser
+
+
+class GameError(Exception):
+    pass
+
+
+class GameGraph(object):
+    '''
+    The stops of a game in play order, following each Victory's Next.
+    '''
+    def __init__(self, stops, start=None):
+        self.next = {}
+        self.previous = {}
+
+        for stop, data in stops.items():
+            following = data['Victory']['Next']
+
+            if following in stops:
+                if following in self.previous:
+                    raise GameError("Stops {0} and {1} both lead to {2}."
+                                    "".format(self.previous[following],
+                                              stop, following))
+                self.next[stop] = following
+                self.previous[following] = stop
+            else:
+                self.next[stop] = None
+
+        if start is None:
+            starts = [stop for stop in stops if stop not in self.previous]
+
+            if len(starts) > 1:
+                raise GameError("Game has more than one first stop: {0}."
+                                "".format(", ".join(starts)))
+
+            start = starts[0] if starts else None
+
+        if stops and start not in stops:
+            raise GameError("Game has no first stop.")
+
+        order = []
+        seen = set()
+        stop = start if stops else None
+        while stop is not None:
+            if stop in seen:
+                raise GameError("Stops loop back to {0}.".format(stop))
+            order.append(stop)
+            seen.add(stop)
+            stop = self.next[stop]
+
+        unreachable = [stop for stop in stops if stop not in seen]
+        if unreachable:
+            raise GameError("Stops never reached: {0}."
+                            "".format(", ".join(unreachable)))
+
+        self.order = tuple(order)
+        self.index = {stop: n for n, stop in enumerate(self.order)}
+        self.start = self.order[0] if self.order else None
+        self.terminal = self.order[-1] if self.order else None
+
+        # Where players are after the last stop's Victory - not a stop.
+        self.end = stops[self.terminal]['Victory']['Next'] \
+            if self.terminal else None
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, stop):
+        return stop in self.index
+
+    def stop_at(self, position):
+        if position < 0 or position >= len(self.order):
+            raise GameError("No stop {0} - game has {1} stops."
+                            "".format(position, len(self.order)))
+
+        return self.order[position]
+
+    def position(self, stop):
+        return self.index.get(stop, None)
+
+    def progress(self, stop):
+        position = self.index.get(stop, None)
+
+        if position is None:
+            return "{0}".format(stop)
+
+        return "{0} ({1} of {2})".format(stop, position + 1,
+                                         len(self.order))
+
+
+class Game(object):
+    def __init__(self, id, definition, numbers=(), gms=(), teams=None,
+                 players=()):
+        self.id = id
+        self.definition = definition
+        self.numbers = tuple(n for n in numbers if n)
+        self.gms = frozenset(n for n in gms if n)
+        self.solo = tuple(n for n in players if n)
+        self.teams = {name: tuple(players)
+                      for name, players in (teams or {}).items()}
+        self.graph = GameGraph(definition.get('Stop', {}),
+                               start=definition.get('Start', None))
+        self.commands = CommandParser(definition.get('Commands', None))
+
+        self.warnings = []
+
+        self._compiled = None
+
+        self.player_index = {}
+        for name, players in self.teams.items():
+            for player in players:
+                if player in self.player_index:
+                    raise GameError("Player {0} is on more than one team "
+                                    "in {1}.".format(player, id))
+                self.player_index[player] = name
+
+    @property
+    def compiled(self):
+        '''
+        The definition as immutable structures, rebuilt if it is replaced.
+        '''
+        # schema imports this module.
+        from schema import compile_definition
+
+        entry = self._compiled
+
+        if entry is None or entry[0] is not self.definition:
+            entry = self._compiled = (self.definition,
+                                      compile_definition(self.definition))
+
+        return entry[1]
+
+    @property
+    def number(self):
+        return self.numbers[0] if self.numbers else None
+
+    def players(self, team=None):
+        if team:
+            return self.teams.get(team, ())
+
+        return tuple(self.player_index) + self.solo
+
+    def session_key(self, number):
+        return "{0}:{1}".format(self.id, self.player_index.get(number,
+                                                               number))
+
+    def __repr__(self):
+        return "<Game {0}>".format(self.id)
+
+
+class GameRegistry(object):
+    def __init__(self):
+        self.games = {}
+        self.by_number = {}
+        self.default = None
+
+    def add(self, game, default=False):
+        if game.id in self.games:
+            raise GameError("Duplicate game id {0}.".format(game.id))
+
+        for number in game.numbers:
+            if number in self.by_number:
+                raise GameError("Number {0} already serves {1}."
+                                "".format(number, self.by_number[number].id))
+
+        self.games[game.id] = game
+
+        for number in game.numbers:
+            self.by_number[number] = game
+
+        if default or self.default is None:
+            self.default = game
+
+        return game
+
+    def load(self, path, numbers=(), gms=(), players=(), static_folder=None,
+             endpoints=None, snapshots=True):
+        '''
+        Adds the game in path, raising SchemaError if it is invalid. The
+        game's warnings lists anything else validation found.
+        '''
+        from schema import load_definition
+
+        definition, warnings = load_definition(path, static_folder,
+                                               endpoints, snapshots)
+
+        id = definition.get('Id',
+                            os.path.splitext(os.path.basename(path))[0])
+
+        game = Game(id, definition,
+                    numbers=definition.get('Numbers', numbers),
+                    gms=definition.get('GM', gms),
+                    teams=definition.get('Teams', None),
+                    players=definition.get('Players', players))
+
+        game.warnings = warnings
+
+        return self.add(game)
+
+    def get(self, id):
+        return self.games.get(id, None)
+
+    def resolve(self, to, from_):
+        game = self.by_number.get(to, self.default)
+
+        if game is None:
+            return None, None, None
+
+        if from_ in game.gms:
+            return game, 'gm', None
+
+        return game, 'player', game.player_index.get(from_, None)
@@ -0,0 +1,147 @@
+'''
+Reloads game files while the app is serving.
+
+The new games are read and validated off to the side, then swapped in
+with one registry.set(). A request holds the Game it resolved for its
+whole run, so in-flight requests finish against the old definition.
+Caches built from a definition - rendered TwiML, video pages, compiled
+stops - are keyed on its identity and rebuild for the new one. A file
+that fails to load is reported and the running games are kept.
+
+Each worker polls the files' mtime and size every interval seconds when
+watching; reload() can also be called directly, as ADMIN RELOAD does.
+'''
+import logging
+import os
+import threading
+
+from registry import GameError
+
+
+logger = logging.getLogger(__name__)
+
+
+def file_stamps(paths):
+    stamps = []
+
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append((path, None, None))
+
+    return tuple(stamps)
+
+
+class GameReloader(object):
+    def __init__(self, registry, load, paths, interval=0, on_reload=None):
+        self.registry = registry
+        self.load = load
+        self.paths = paths
+        self.interval = interval
+        self.on_reload = on_reload
+
+        self.reloads = 0
+        self.failures = 0
+        self.error = None
+
+        self._stamps = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload(self):
+        '''
+        Loads the games and swaps them in. Returns None, or why the games
+        were kept.
+        '''
+        with self._lock:
+            stamps = file_stamps(self.paths())
+
+            try:
+                games = self.load()
+            except Exception as e:
+                # Not retried until the files change again.
+                self._stamps = stamps
+                self.failures += 1
+
+                if isinstance(e, (GameError, OSError, ValueError)):
+                    self.error = str(e)
+                    logger.warning("Keeping the running games: %s", e)
+                else:
+                    # A bug rather than a bad file - still keep them.
+                    self.error = "{0}: {1}".format(type(e).__name__, e)
+                    logger.exception("Keeping the running games.")
+
+                return self.error
+
+            self.registry.set(games)
+            self._stamps = stamps
+            self.reloads += 1
+            self.error = None
+
+        if self.on_reload is not None:
+            self.on_reload(games)
+
+        return None
+
+    def reload_async(self, callback=None):
+        def run():
+            try:
+                error = self.reload()
+            except Exception as e:
+                # From on_reload - the games were swapped in, but the
+                # caller should still hear about it.
+                logger.exception("Reload hook failed.")
+                error = "{0}: {1}".format(type(e).__name__, e)
+
+            if callback is not None:
+                callback(error)
+
+        thread = threading.Thread(target=run, name="game-reload",
+                                  daemon=True)
+        thread.start()
+
+        return thread
+
+    def changed(self):
+        return self._stamps is not None and \
+            file_stamps(self.paths()) != self._stamps
+
+    def check(self):
+        if self.changed():
+            return self.reload()
+
+        return None
+
+    def start(self):
+        '''
+        Remembers the files as they are now and, with an interval, starts
+        watching them.
+        '''
+        with self._lock:
+            if self._stamps is None:
+                self._stamps = file_stamps(self.paths())
+
+            if self.interval and self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._watch,
+                                                name="game-watch",
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Game reload failed.")
@@ -0,0 +1,439 @@
+'''
+Timers for pushed hints and timed game events.
+
+Each timer belongs to a key - a player or team's session key - and has a
+name, so a key holds at most one "hint" and one of each timed event, and
+scheduling a name again replaces it. Pending timers sit in a heap ordered
+by due time; a cancelled or replaced timer is only marked and skipped when
+it reaches the top, and the heap is compacted once most of it is dead.
+Scheduling and cancelling are O(log n) and O(1) for any number of players.
+
+A background thread sleeps until the earliest timer is due and hands it to
+fire(timer). fire should only queue work - sends go through the dispatch
+queue - since every timer waits on it.
+
+With a backend, timers are written in batches like the session store and
+restore() picks them up again after a restart. Every worker restores every
+timer, so before firing one a worker claims it from the backend: only the
+worker whose claim removes the row fires it, and a timer replaced or
+cancelled by another worker can no longer be claimed.
+'''
+import atexit
+import heapq
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_DELETED = object()
+
+
+class SQLiteTimerBackend(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS timers "
+                                     "(key TEXT, name TEXT, due REAL, "
+                                     "payload TEXT, "
+                                     "PRIMARY KEY (key, name))")
+
+    def load_all(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT key, name, due, payload "
+                                            "FROM timers").fetchall()
+
+        return [(key, name, due, json.loads(payload))
+                for key, name, due, payload in rows]
+
+    def save_many(self, rows):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO timers "
+                                         "(key, name, due, payload) "
+                                         "VALUES (?, ?, ?, ?)",
+                                         [(key, name, due, json.dumps(payload))
+                                          for key, name, due, payload
+                                          in rows])
+
+    def delete_many(self, idents):
+        '''
+        Deletes (key, name) timers - every one of key's for a name of None.
+        '''
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM timers "
+                                         "WHERE key = ? AND name = ?",
+                                         [ident for ident in idents
+                                          if ident[1] is not None])
+            self._connection.executemany("DELETE FROM timers "
+                                         "WHERE key = ?",
+                                         [(ident[0],) for ident in idents
+                                          if ident[1] is None])
+
+    def claim_many(self, timers):
+        '''
+        Removes each (key, name, due) timer still due then, in one
+        transaction. Returns the ones that were.
+        '''
+        claimed = []
+
+        with self._lock, self._connection:
+            for timer in timers:
+                cursor = self._connection.execute("DELETE FROM timers "
+                                                  "WHERE key = ? AND "
+                                                  "name = ? AND due = ?",
+                                                  timer)
+                if cursor.rowcount == 1:
+                    claimed.append(timer)
+
+        return claimed
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM timers")
+
+
+class Timer(object):
+    __slots__ = ('key', 'name', 'due', 'payload', 'cancelled')
+
+    def __init__(self, key, name, due, payload=None):
+        self.key = key
+        self.name = name
+        self.due = due
+        self.payload = payload
+        self.cancelled = False
+
+    def __repr__(self):
+        return "<Timer {0} {1} at {2}>".format(self.key, self.name, self.due)
+
+
+class Scheduler(object):
+    def __init__(self, fire, backend=None, max_lateness=None,
+                 flush_interval=1.0, batch_size=500):
+        self.fire = fire
+        self.backend = backend
+        self.max_lateness = max_lateness
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.fired = 0
+        self.dropped = 0
+
+        self._heap = []
+        self._keys = {}
+        self._sequence = 0
+        self._cancelled = 0
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._thread = None
+        self._flusher_thread = None
+        self._running = False
+
+        atexit.register(self.close)
+
+    def schedule(self, key, name, due, payload=None):
+        '''
+        Fires payload for key at due, a time.time() - replacing any timer
+        key already has by that name.
+        '''
+        timer = Timer(key, name, due, payload)
+
+        with self._lock:
+            self._discard(key, name)
+            self._keys.setdefault(key, {})[name] = timer
+
+            earliest = not self._heap or due < self._heap[0][0]
+            self._sequence += 1
+            heapq.heappush(self._heap, (due, self._sequence, timer))
+
+            self._mark((key, name), timer)
+
+            if earliest:
+                self._wakeup.notify()
+
+        self._schedule_flush()
+
+        return timer
+
+    def cancel(self, key, name=None):
+        '''
+        Cancels key's timer by name, or all of them. Returns how many.
+        '''
+        with self._lock:
+            names = [name] if name else list(self._keys.get(key, ()))
+            cancelled = sum(1 for each in names if self._discard(key, each))
+
+            for each in names:
+                self._mark((key, each), _DELETED)
+
+            # Including any another worker set.
+            if name is None:
+                self._mark((key, None), _DELETED)
+
+        self._schedule_flush()
+
+        return cancelled
+
+    def get(self, key, name):
+        return self._keys.get(key, {}).get(name, None)
+
+    def restore(self):
+        '''
+        Loads the backend's timers, keeping any scheduled here since.
+        '''
+        if self.backend is None:
+            return 0
+
+        restored = 0
+
+        for key, name, due, payload in self.backend.load_all():
+            with self._lock:
+                if name in self._keys.get(key, ()) or \
+                        (key, name) in self._dirty or \
+                        (key, None) in self._dirty:
+                    continue
+
+                timer = Timer(key, name, due, payload)
+                self._keys.setdefault(key, {})[name] = timer
+                self._sequence += 1
+                heapq.heappush(self._heap, (due, self._sequence, timer))
+                restored += 1
+
+        with self._lock:
+            self._wakeup.notify()
+
+        return restored
+
+    def due(self, now=None):
+        '''
+        Removes and returns the timers due by now.
+        '''
+        now = time.time() if now is None else now
+        timers = []
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                timer = heapq.heappop(self._heap)[2]
+
+                if timer.cancelled:
+                    self._cancelled -= 1
+                    continue
+
+                names = self._keys[timer.key]
+                del names[timer.name]
+                if not names:
+                    del self._keys[timer.key]
+
+                timers.append(timer)
+
+        return timers
+
+    def run_due(self, now=None):
+        '''
+        Fires every timer due by now. Returns how many were fired.
+        '''
+        now = time.time() if now is None else now
+        fired = 0
+
+        for timer in self._claim(self.due(now)):
+            if self.max_lateness is not None and \
+                    now - timer.due > self.max_lateness:
+                self.dropped += 1
+                logger.info("Dropped %r, %.0f seconds late.", timer,
+                            now - timer.due)
+                continue
+
+            try:
+                self.fire(timer)
+            except Exception:
+                logger.exception("Timer %r failed.", timer)
+
+            self.fired += 1
+            fired += 1
+
+        return fired
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="scheduler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+
+        with self._lock:
+            self._running = False
+            self._thread = None
+            self._wakeup.notify()
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+        self.flush()
+
+    def flush(self):
+        if self.backend is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = {}
+
+            if not dirty:
+                return 0
+
+            saves = [(timer.key, timer.name, timer.due, timer.payload)
+                     for timer in dirty.values() if timer is not _DELETED]
+            deletes = [ident for ident, timer in dirty.items()
+                       if timer is _DELETED]
+
+            # Deletes first - a key's timers cancelled and then set again
+            # keep the new ones.
+            try:
+                if deletes:
+                    self.backend.delete_many(deletes)
+                if saves:
+                    self.backend.save_many(saves)
+            except Exception:
+                # Kept for the next flush, unless changed again since, or
+                # the timer has fired.
+                with self._lock:
+                    for ident, timer in dirty.items():
+                        if timer is _DELETED or self.get(*ident) is timer:
+                            self._dirty.setdefault(ident, timer)
+                raise
+
+            return len(dirty)
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._keys.clear()
+            self._dirty.clear()
+            self._cancelled = 0
+
+        if self.backend is not None:
+            self.backend.clear()
+
+    def close(self):
+        self.flush()
+
+    @property
+    def pending(self):
+        '''
+        Changes not yet written to the backend.
+        '''
+        return len(self._dirty)
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def _discard(self, key, name):
+        names = self._keys.get(key, None)
+        timer = names.pop(name, None) if names else None
+
+        if timer is None:
+            return False
+
+        if not names:
+            del self._keys[key]
+
+        timer.cancelled = True
+        self._cancelled += 1
+
+        # Mostly dead - rebuild rather than carry them.
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap
+                          if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+        return True
+
+    def _mark(self, ident, timer):
+        if self.backend is not None:
+            self._dirty[ident] = timer
+
+    def _claim(self, timers):
+        if self.backend is None or not timers:
+            return timers
+
+        claimed = []
+        written = {}
+
+        with self._flush_lock:
+            with self._lock:
+                for timer in timers:
+                    ident = (timer.key, timer.name)
+
+                    if self._dirty.get(ident, None) is timer:
+                        # Never written, so only this worker has it - but
+                        # an earlier row by the same name may have been.
+                        self._dirty[ident] = _DELETED
+                        claimed.append(timer)
+                    else:
+                        written[(timer.key, timer.name, timer.due)] = timer
+
+            if written:
+                claimed.extend(written[row] for row in
+                               self.backend.claim_many(list(written)))
+
+        return sorted(claimed, key=lambda timer: timer.due)
+
+    def _schedule_flush(self):
+        if self.backend is None:
+            return
+
+        if self.flush_interval is None:
+            self.flush()
+            return
+
+        if self._flusher_thread is None:
+            with self._lock:
+                if self._flusher_thread is None:
+                    self._flusher_thread = threading.Thread(
+                        target=self._flusher, name="timer-flush", daemon=True)
+                    self._flusher_thread.start()
+
+        if len(self._dirty) >= self.batch_size:
+            self._wake.set()
+
+    def _flusher(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Timer flush failed, retrying.")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+
+                delay = self._heap[0][0] - time.time() if self._heap \
+                    else None
+
+                if delay is None or delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+
+            self.run_due()
@@ -0,0 +1,352 @@
+'''
+Game definition validator and compiler.
+
+validate() checks a parsed game.json up front and reports every problem at
+once, instead of a KeyError or IndexError mid-game:
+
+    - each stop has Introduction and Victory messages, at least one clue,
+      and a Victory Next (the stop graph is checked by GameGraph)
+    - messages have a Body; a Path names a route and its Body has a {0}
+      for the link; Media and video files exist in the static folder
+    - Videos, Commands, Teams and the number lists are well formed
+    - HintAfter, for the game or a stop, and each Timers entry's After are
+      minutes; Timers messages can't have a Path
+
+Missing media files are warnings, since large videos may be deployed
+separately. Everything else is an error.
+
+compile_definition() turns a definition into immutable, tuple-backed
+structures for the handlers. save_snapshot() writes the validated
+definition with marshal next to its JSON; load_definition() reads that
+instead of parsing and validating the JSON again while the snapshot is
+newer than its source.
+'''
+import json
+import marshal
+import os
+
+from collections import namedtuple
+from types import MappingProxyType
+
+from registry import GameError
+from registry import GameGraph
+
+
+SNAPSHOT_VERSION = 1
+
+MESSAGE_KEYS = frozenset(('Body', 'Path', 'Media', 'Title'))
+
+
+Message = namedtuple('Message', ('body', 'path', 'media', 'title'))
+
+# hint_after is in seconds, None for no pushed hints.
+Stop = namedtuple('Stop', ('name', 'introduction', 'clues', 'victory',
+                           'next', 'hint_after'))
+
+# A message sent after seconds in play.
+TimedMessage = namedtuple('TimedMessage', ('after', 'messages'))
+
+Video = namedtuple('Video', ('title', 'video', 'thumbnail'))
+
+CompiledGame = namedtuple('CompiledGame', ('stops', 'videos', 'commands',
+                                           'timers'))
+
+
+class SchemaError(GameError):
+    def __init__(self, source, problems):
+        self.source = source
+        self.problems = problems
+
+        super(SchemaError, self).__init__(
+            "{0} has {1} problem{2}:\n{3}".format(
+                source, len(problems), "" if len(problems) == 1 else "s",
+                "\n".join("  " + problem for problem in problems)))
+
+
+class Validator(object):
+    def __init__(self, static_folder=None, endpoints=None):
+        self.static_folder = static_folder
+        self.endpoints = endpoints
+
+        self.errors = []
+        self.warnings = []
+
+    def error(self, where, problem):
+        self.errors.append("{0}: {1}".format(where, problem))
+
+    def warn(self, where, problem):
+        self.warnings.append("{0}: {1}".format(where, problem))
+
+    def mapping(self, value, where):
+        if not isinstance(value, dict):
+            self.error(where, "expected an object")
+            return {}
+
+        return value
+
+    def strings(self, value, where):
+        if not isinstance(value, list) or \
+                not all(isinstance(item, str) for item in value):
+            self.error(where, "expected a list of strings")
+
+    def minutes(self, value, where, positive=False):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or value < 0 or (positive and value == 0):
+            self.error(where, "expected a number of minutes")
+
+    def media(self, filename, where):
+        if not isinstance(filename, str):
+            self.error(where, "expected a file name")
+        elif self.static_folder and not os.path.isfile(
+                os.path.join(self.static_folder, filename)):
+            self.warn(where, "{0} is not in the static folder"
+                             "".format(filename))
+
+    def messages(self, value, where, paths=True):
+        if not isinstance(value, list) or not value:
+            self.error(where, "expected a list of messages")
+            return
+
+        for n, message in enumerate(value):
+            # Most messages are just a Body.
+            if type(message) is dict and len(message) == 1 and \
+                    type(message.get('Body', None)) is str:
+                continue
+
+            here = "{0}[{1}]".format(where, n)
+            message = self.mapping(message, here)
+
+            if not isinstance(message.get('Body', None), str):
+                self.error(here, "has no Body")
+
+            for key in set(message) - MESSAGE_KEYS:
+                self.warn(here, "unknown key {0}".format(key))
+
+            if 'Path' in message:
+                if not paths:
+                    self.error(here, "Path is not allowed here")
+                elif self.endpoints is not None and \
+                        message['Path'] not in self.endpoints:
+                    self.error(here, "Path {0} is not a route"
+                                     "".format(message['Path']))
+                elif isinstance(message.get('Body', None), str) and \
+                        "{0}" not in message['Body']:
+                    self.error(here, "Body has no {0} for the Path link")
+
+            if 'Media' in message:
+                self.media(message['Media'], here + ".Media")
+
+    def section(self, stop, data, name):
+        section = self.mapping(data.get(name, None),
+                               "Stop {0}.{1}".format(stop, name))
+
+        self.messages(section.get('Messages', None),
+                      "Stop {0}.{1}.Messages".format(stop, name))
+
+        return section
+
+    def definition(self, definition):
+        definition = self.mapping(definition, "Game")
+        stops = self.mapping(definition.get('Stop', None), "Stop")
+        videos = self.mapping(definition.get('Videos', {}), "Videos")
+
+        if not stops:
+            self.error("Stop", "game has no stops")
+
+        for stop, data in stops.items():
+            data = self.mapping(data, "Stop {0}".format(stop))
+
+            self.section(stop, data, 'Introduction')
+
+            clues = data.get('Clues', None)
+            if not isinstance(clues, list) or not clues:
+                self.error("Stop {0}.Clues".format(stop),
+                           "expected at least one clue")
+            else:
+                for n, clue in enumerate(clues):
+                    here = "Stop {0}.Clues[{1}]".format(stop, n)
+                    self.messages(self.mapping(clue, here).get('Messages',
+                                                               None),
+                                  here + ".Messages")
+
+            victory = self.section(stop, data, 'Victory')
+            if not isinstance(victory.get('Next', None), str):
+                self.error("Stop {0}.Victory".format(stop), "has no Next")
+
+            if 'HintAfter' in data:
+                self.minutes(data['HintAfter'],
+                             "Stop {0}.HintAfter".format(stop))
+
+        if not self.errors:
+            try:
+                GameGraph(stops, start=definition.get('Start', None))
+            except GameError as e:
+                self.error("Stop", str(e))
+
+        for location, video in videos.items():
+            here = "Videos {0}".format(location)
+            video = self.mapping(video, here)
+
+            if not isinstance(video.get('Title', None), str):
+                self.error(here, "has no Title")
+
+            for key in ('Video', 'Thumbnail'):
+                if key not in video:
+                    self.error(here, "has no {0}".format(key))
+                else:
+                    self.media(video[key], "{0}.{1}".format(here, key))
+
+        # Victory links show the next stop's video, the last stop's the
+        # closing one - both 404 without a Videos entry.
+        if videos:
+            for stop in stops:
+                if stop not in videos:
+                    self.warn("Videos", "no video for {0}".format(stop))
+
+        commands = self.mapping(definition.get('Commands', {}), "Commands")
+        for name, command in commands.items():
+            here = "Commands {0}".format(name)
+            command = self.mapping(command, here)
+
+            if 'Aliases' in command:
+                self.strings(command['Aliases'], here + ".Aliases")
+            if 'Messages' in command:
+                self.messages(command['Messages'], here + ".Messages",
+                              paths=False)
+            if not isinstance(command.get('Notify', ""), str):
+                self.error(here + ".Notify", "expected a string")
+
+        if 'HintAfter' in definition:
+            self.minutes(definition['HintAfter'], "HintAfter")
+
+        timers = definition.get('Timers', [])
+        if not isinstance(timers, list):
+            self.error("Timers", "expected a list")
+            timers = []
+
+        for n, timer in enumerate(timers):
+            here = "Timers[{0}]".format(n)
+            timer = self.mapping(timer, here)
+
+            self.minutes(timer.get('After', None), here + ".After",
+                         positive=True)
+            self.messages(timer.get('Messages', None), here + ".Messages",
+                          paths=False)
+
+        for key in ('Numbers', 'GM', 'Players'):
+            if key in definition:
+                self.strings(definition[key], key)
+
+        for team, players in self.mapping(definition.get('Teams', {}),
+                                          "Teams").items():
+            self.strings(players, "Teams {0}".format(team))
+
+        return self
+
+
+def validate(definition, static_folder=None, endpoints=None):
+    '''
+    Returns (errors, warnings) for a parsed definition.
+    '''
+    validator = Validator(static_folder, endpoints).definition(definition)
+
+    return validator.errors, validator.warnings
+
+
+def compile_messages(messages):
+    return tuple(Message(message['Body'], message.get('Path', None),
+                         message.get('Media', None),
+                         message.get('Title', None))
+                 for message in messages)
+
+
+def seconds(minutes):
+    return minutes * 60 if minutes else None
+
+
+def compile_definition(definition):
+    stops = {}
+    hint_after = definition.get('HintAfter', None)
+
+    for name, data in definition['Stop'].items():
+        stops[name] = Stop(
+            name,
+            compile_messages(data['Introduction']['Messages']),
+            tuple(compile_messages(clue['Messages'])
+                  for clue in data['Clues']),
+            compile_messages(data['Victory']['Messages']),
+            data['Victory']['Next'],
+            seconds(data.get('HintAfter', hint_after)))
+
+    videos = {location: Video(video['Title'], video['Video'],
+                              video['Thumbnail'])
+              for location, video in definition.get('Videos', {}).items()}
+
+    commands = {name.upper(): compile_messages(command['Messages'])
+                for name, command in definition.get('Commands', {}).items()
+                if command.get('Messages', None)}
+
+    timers = tuple(TimedMessage(seconds(timer['After']),
+                                compile_messages(timer['Messages']))
+                   for timer in definition.get('Timers', ()))
+
+    return CompiledGame(MappingProxyType(stops), MappingProxyType(videos),
+                        MappingProxyType(commands), timers)
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + '.snapshot'
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def save_snapshot(path, definition):
+    target = snapshot_path(path)
+    temporary = target + '.tmp'
+
+    with open(temporary, 'wb') as f:
+        marshal.dump((SNAPSHOT_VERSION, source_stamp(path), definition), f)
+
+    os.replace(temporary, target)
+
+    return target
+
+
+def read_snapshot(path):
+    try:
+        with open(snapshot_path(path), 'rb') as f:
+            version, stamp, definition = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if version != SNAPSHOT_VERSION or tuple(stamp) != source_stamp(path):
+        return None
+
+    return definition
+
+
+def load_definition(path, static_folder=None, endpoints=None,
+                    snapshots=True):
+    '''
+    Returns (definition, warnings) for a game file, raising SchemaError if
+    it is invalid. A current snapshot is trusted without revalidating.
+    '''
+    if snapshots:
+        definition = read_snapshot(path)
+
+        if definition is not None:
+            return definition, []
+
+    with open(path) as f:
+        definition = json.load(f)
+
+    errors, warnings = validate(definition, static_folder, endpoints)
+
+    if errors:
+        raise SchemaError(path, errors)
+
+    return definition, warnings
@@ -0,0 +1,321 @@
+'''
+Server-side player sessions keyed by phone number.
+
+A bounded in-memory LRU sits in front of a durable backend. Writes land in
+memory immediately and are flushed to the backend in batches by a
+background thread.
+
+A shared store is for several worker processes on one backend: nothing is
+cached, reads go to the backend and writes go straight through, so every
+worker sees the latest state.
+'''
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+_DELETED = object()
+
+
+class MemoryBackend(object):
+    def __init__(self):
+        self.data = {}
+
+    def load(self, key):
+        state = self.data.get(key, None)
+
+        return dict(state) if state is not None else None
+
+    def merge(self, key, changes):
+        state = dict(self.data.get(key, None) or {}, **changes)
+        self.data[key] = state
+
+        return dict(state)
+
+    def save_many(self, items):
+        for key, state in items:
+            self.data[key] = dict(state)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+class SQLiteBackend(object):
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                                     "(key TEXT PRIMARY KEY, state TEXT, "
+                                     "updated REAL)")
+
+    def load(self, key):
+        with self._lock:
+            row = self._connection.execute("SELECT state FROM sessions "
+                                           "WHERE key = ?",
+                                           (key,)).fetchone()
+
+        if row:
+            return json.loads(row[0])
+
+        return None
+
+    def merge(self, key, changes):
+        '''
+        Applies changes to key's state in one transaction, so workers
+        sharing the database can't undo each other's updates.
+        '''
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            row = self._connection.execute("SELECT state FROM sessions "
+                                           "WHERE key = ?",
+                                           (key,)).fetchone()
+
+            state = json.loads(row[0]) if row else {}
+            state.update(changes)
+
+            self._connection.execute("INSERT OR REPLACE INTO sessions "
+                                     "(key, state, updated) "
+                                     "VALUES (?, ?, ?)",
+                                     (key, json.dumps(state), time.time()))
+
+        return state
+
+    def save_many(self, items):
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO sessions "
+                                         "(key, state, updated) "
+                                         "VALUES (?, ?, ?)",
+                                         [(key, json.dumps(state), now)
+                                          for key, state in items])
+
+    def delete_many(self, keys):
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM sessions "
+                                         "WHERE key = ?",
+                                         [(key,) for key in keys])
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM sessions")
+
+
+class SessionStore(object):
+    def __init__(self, backend, max_entries=10000, ttl=3600,
+                 flush_interval=1.0, batch_size=500, shared=False):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.shared = shared
+
+        self.hits = 0
+        self.misses = 0
+
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._flushing = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        atexit.register(self.close)
+
+    def get(self, key):
+        if self.shared:
+            self.misses += 1
+            return self.backend.load(key)
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._cache.get(key, None)
+
+            if entry and entry[1] > now:
+                self._cache[key] = (entry[0], now + self.ttl)
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+
+            self.misses += 1
+
+            state = self._dirty.get(key, self._flushing.get(key, None))
+
+        if state is None:
+            state = self.backend.load(key)
+        elif state is _DELETED:
+            state = None
+
+        if state is None:
+            return None
+
+        with self._lock:
+            self._remember(key, state, now)
+
+        return dict(state)
+
+    def update(self, key, **changes):
+        '''
+        Merges changes into key's current state. Teammates share a key, so
+        this is one locked step - a concurrent update can't undo it.
+        '''
+        if self.shared:
+            return self.backend.merge(key, changes)
+
+        with self._lock:
+            state = self.get(key) or {}
+            state.update(changes)
+
+            self._store(key, state)
+
+        self._schedule()
+
+        return state
+
+    def set(self, key, state):
+        if self.shared:
+            self.backend.save_many([(key, dict(state))])
+            return
+
+        with self._lock:
+            self._store(key, state)
+
+        self._schedule()
+
+    def delete(self, key):
+        if self.shared:
+            self.backend.delete_many([key])
+            return
+
+        with self._lock:
+            self._cache.pop(key, None)
+            self._dirty[key] = _DELETED
+
+        self._schedule()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = {}
+                self._flushing = dirty
+
+            if not dirty:
+                return 0
+
+            saves = [(key, state) for key, state in dirty.items()
+                     if state is not _DELETED]
+            deletes = [key for key, state in dirty.items()
+                       if state is _DELETED]
+
+            try:
+                if saves:
+                    self.backend.save_many(saves)
+                if deletes:
+                    self.backend.delete_many(deletes)
+            except Exception:
+                # Kept for the next flush, unless changed again since.
+                with self._lock:
+                    for key, state in dirty.items():
+                        self._dirty.setdefault(key, state)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+            return len(dirty)
+
+    def expire(self):
+        now = time.monotonic()
+        expired = 0
+
+        with self._lock:
+            while self._cache:
+                key, entry = next(iter(self._cache.items()))
+
+                if entry[1] > now:
+                    break
+
+                self._cache.popitem(last=False)
+                expired += 1
+
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._dirty.clear()
+
+        self.backend.clear()
+
+    def close(self):
+        self.flush()
+
+    @property
+    def pending(self):
+        '''
+        Changes not yet written to the backend.
+        '''
+        return len(self._dirty) + len(self._flushing)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _store(self, key, state):
+        self._remember(key, dict(state), time.monotonic())
+        self._dirty[key] = dict(state)
+
+    def _remember(self, key, state, now):
+        self._cache[key] = (state, now + self.ttl)
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _schedule(self):
+        if self.flush_interval is None:
+            self.flush()
+            return
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flusher,
+                                                    name="session-flush",
+                                                    daemon=True)
+                    self._thread.start()
+
+        if len(self._dirty) >= self.batch_size:
+            self._wake.set()
+
+    def _flusher(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Session flush failed, retrying.")
+
+            self.expire()
@@ -0,0 +1,113 @@
+'''
+Twilio webhook signature checks.
+
+Webhook requests are rejected with a 403 before any game logic runs
+unless X-Twilio-Signature matches. The signed URL is BASE_URL, or the
+request's own scheme and host (gunicorn trusts X-Forwarded-Proto), plus
+the path and query. Twilio signs some requests with the port in the host
+and some without, so both forms are tried. Each URL's forms are built
+once and cached.
+'''
+import hmac
+
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+from flask import make_response
+from flask import request
+from twilio.request_validator import RequestValidator
+
+
+def url_variants(url):
+    '''
+    The URL as given, then with the port added or removed.
+    '''
+    parts = urlsplit(url)
+
+    if parts.port:
+        netloc = parts.hostname
+    else:
+        netloc = "{0}:{1}".format(parts.hostname,
+                                  443 if parts.scheme == 'https' else 80)
+
+    return (url, urlunsplit(parts._replace(netloc=netloc)))
+
+
+class SignatureCheck(object):
+    def __init__(self, app, endpoints, max_entries=1024):
+        self.app = app
+        self.endpoints = frozenset(endpoints)
+        self.max_entries = max_entries
+
+        self.checked = 0
+        self.rejected = 0
+
+        self.urls = {}
+
+        self._validator = None
+
+        app.before_request(self.check)
+
+    @property
+    def validator(self):
+        token = self.app.config.get('TWILIO_AUTH_TOKEN', None) or ""
+        entry = self._validator
+
+        # Rebuilt only if the token is rotated.
+        if entry is None or entry[0] != token:
+            entry = self._validator = (token, RequestValidator(token))
+
+        return entry[1]
+
+    def variants(self, base, path, query):
+        key = (base, path, query)
+        urls = self.urls.get(key, None)
+
+        if urls is None:
+            url = base.rstrip('/') + path
+
+            if query:
+                url = url + '?' + query
+
+            urls = url_variants(url)
+
+            if len(self.urls) >= self.max_entries:
+                self.urls = {}
+
+            self.urls[key] = urls
+
+        return urls
+
+    def valid(self, signature, urls, params):
+        validator = self.validator
+        signature = signature.encode('utf-8')
+
+        for url in urls:
+            computed = validator.compute_signature(url, params)
+
+            if hmac.compare_digest(computed.encode('utf-8'), signature):
+                return True
+
+        return False
+
+    def check(self):
+        if request.endpoint not in self.endpoints or \
+                not self.app.config.get('TWILIO_VALIDATE_SIGNATURES', True):
+            return None
+
+        self.checked += 1
+
+        signature = request.headers.get('X-Twilio-Signature', None)
+
+        if signature:
+            base = self.app.config.get('BASE_URL', None) or \
+                request.host_url + request.script_root.lstrip('/')
+            urls = self.variants(base, request.path,
+                                 request.query_string.decode('latin-1'))
+
+            if self.valid(signature, urls, request.form):
+                return None
+
+        self.rejected += 1
+
+        return make_response("Invalid signature.", 403)
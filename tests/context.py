@@ -5,3 +5,20 @@ sys.path.insert(0, os.path.abspath('..'))
 from app import send_player_message
 from app import send_gm_message
 from app import app
+from app import dispatcher
+from app import twiml
+from app import sessions
+from app import load_games
+from app import pages
+from app import static_files
+from app import rate_limiter
+from app import create_app
+from app import registry
+from app import events
+from app import gm_digest
+from app import signatures
+from app import replies
+from app import reloader
+from app import delivery
+from app import scheduler
+from app import archive
@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from analyze_events import analyze
+from analyze_events import Reservoir
+
+
+def event(ts, type, player, stop=None, **fields):
+    return dict(ts=ts, type=type, game="game", player=player, stop=stop,
+                **fields)
+
+
+def hunt(player, start=0, solve=60, clues=0, stops=('Fish', 'Bridge')):
+    ts = start
+    yield event(ts, 'start', player, stops[0])
+
+    for n, stop in enumerate(stops):
+        for clue in range(0, clues):
+            yield event(ts + 1, 'clue', player, stop, clue=clue)
+
+        ts += solve
+        following = stops[n + 1] if n + 1 < len(stops) else None
+        yield event(ts, 'photo', player, stop, next=following, media=1)
+
+
+class AnalyzeTest(TestCase):
+    def test_funnel(self):
+        def events():
+            yield from hunt("game:Red", solve=60, clues=2)
+            yield from hunt("game:Blue", solve=120)
+            # Green gives up at the bridge.
+            yield from hunt("game:Green", solve=30, stops=('Fish',))
+            yield event(200, 'clue', "game:Green", "Fish")
+
+        rows = analyze(events(), order=('Fish', 'Bridge'))
+
+        self.assertEqual(['Fish', 'Bridge'], [row['stop'] for row in rows])
+
+        fish = rows[0]
+        self.assertEqual(3, fish['reached'])
+        self.assertEqual(3, fish['solved'])
+        self.assertEqual(0, fish['drop_off'])
+        self.assertEqual(60, fish['median_s'])
+        self.assertEqual(2 / 3, fish['clues_per_visit'])
+        self.assertEqual(1 / 3, fish['clued'])
+
+    def test_drop_off(self):
+        def events():
+            yield from hunt("game:Red")
+            yield event(0, 'start', "game:Blue", "Fish")
+            yield event(10, 'photo', "game:Blue", "Fish", next="Bridge")
+            yield event(20, 'restart', "game:Blue")
+            yield event(30, 'photo', "game:Blue", "Bridge", next=None)
+
+        rows = {row['stop']: row for row in analyze(events())}
+
+        self.assertEqual(2, rows['Bridge']['reached'])
+        self.assertEqual(1, rows['Bridge']['solved'])
+        self.assertEqual(0.5, rows['Bridge']['drop_off'])
+
+    def test_streaming(self):
+        events = (e for n in range(0, 2000)
+                  for e in hunt("game:{0}".format(n), solve=n % 100))
+
+        rows = analyze(events, sample=100)
+
+        self.assertEqual(2000, rows[0]['reached'])
+        self.assertTrue(30 <= rows[0]['median_s'] <= 70)
+
+
+class ReservoirTest(TestCase):
+    def test_bounded(self):
+        reservoir = Reservoir(size=10, seed=1)
+
+        for n in range(0, 1000):
+            reservoir.add(n)
+
+        self.assertEqual(10, len(reservoir.values))
+        self.assertEqual(1000, reservoir.count)
+
+    def test_exact_when_small(self):
+        reservoir = Reservoir(size=10)
+
+        for n in (5, 1, 3):
+            reservoir.add(n)
+
+        self.assertEqual(3, reservoir.percentile(0.5))
+        self.assertEqual(5, reservoir.percentile(1))
@@ -1,9 +1,39 @@
+import copy
+import html
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
 from unittest import mock
 from unittest import TestCase
 
+from twilio.request_validator import RequestValidator
+
+from archive import PhotoArchive
+
 from .context import app
 from .context import send_gm_message
 from .context import send_player_message
+from .context import dispatcher
+from .context import sessions
+from .context import load_games
+from .context import pages
+from .context import rate_limiter
+from .context import create_app
+from .context import registry
+from .context import events
+from .context import gm_digest
+from .context import signatures
+from .context import replies
+from .context import reloader
+from .context import delivery
+from .context import scheduler
+from .context import static_files
 
 app.config['TWILIO_ACCOUNT_SID'] = 'ACxxxxxx'
 app.config['TWILIO_AUTH_TOKEN'] = 'yyyyyyyyy'
@@ -11,10 +41,19 @@ app.config['TWILIO_CALLER_ID'] = '+15558675309'
 app.config['TWILIO_PLAYER'] = '15559990000'
 app.config['TWILIO_GM'] = '+15556667777'
 
+load_games()
+
+dispatcher.workers = 0
+rate_limiter.rate = rate_limiter.burst = 1000
+
+# Every test message needs its own sid, or it is replayed as a retry.
+sids = itertools.count()
+
 
 class TwiMLTest(TestCase):
     def setUp(self):
         self.app = app.test_client()
+        sessions.clear()
 
     def assertTwiML(self, response):
         self.assertTrue(b"</Response>" in response.data, "Did not find "
@@ -24,7 +63,7 @@ class TwiMLTest(TestCase):
     def sms(self, body, url='/sms', to=app.config['TWILIO_CALLER_ID'],
             from_='+15558675309', extra_params=None):
         params = {
-            'SmsSid': 'SMtesting',
+            'SmsSid': "SM{0:032d}".format(next(sids)),
             'AccountSid': app.config['TWILIO_ACCOUNT_SID'],
             'To': to,
             'From': from_,
@@ -36,7 +75,7 @@ class TwiMLTest(TestCase):
         if extra_params:
             params = {**params, **extra_params}
 
-        return self.app.post(url, data=params)
+        return self.app.post(url, data=params, headers=self.sign(url, params))
 
     def call(self, url='/voice', to=app.config['TWILIO_CALLER_ID'],
              from_='+15558675309', digits=None, extra_params=None):
@@ -55,7 +94,14 @@ class TwiMLTest(TestCase):
             params['Digits'] = digits
         if extra_params:
             params = {**params, **extra_params}
-        return self.app.post(url, data=params)
+        return self.app.post(url, data=params, headers=self.sign(url, params))
+
+    def sign(self, url, params):
+        validator = RequestValidator(app.config['TWILIO_AUTH_TOKEN'])
+
+        return {'X-Twilio-Signature':
+                validator.compute_signature(
+                    "http://localhost/" + url.lstrip('/'), params)}
 
 
 class VoiceTest(TwiMLTest):
@@ -67,12 +113,28 @@ class VoiceTest(TwiMLTest):
 
 
 class GMTest(TwiMLTest):
-    def test_sms(self):
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_sms(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
         response = self.sms("Test.", from_="+15556667777")
 
+        self.assertTrue("<Response />" in str(response.data))
+
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_PLAYER'],
+            body="Test.")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_sms_admin(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.sms("ADMIN 1", from_="+15556667777")
+
         self.assertTwiML(response)
-        self.assertTrue("Redirect" in str(response.data))
-        self.assertTrue("/gm" in str(response.data))
+        self.assertFalse("Redirect" in str(response.data))
+        self.assertTrue("Game reset to Bridge." in str(response.data))
 
     @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
     def test_start(self, create_message_mock):
@@ -98,6 +160,18 @@ class GMTest(TwiMLTest):
                                                to=app.config['TWILIO_PLAYER'],
                                                body="Testing a reply.")
 
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_relay_starting_with_start(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        body = "Start heading to the bridge, I'll meet you there"
+
+        response = self.sms(body, from_="+15556667777", url="/gm")
+
+        self.assertTrue("<Response />" in str(response.data))
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_PLAYER'], body=body)
+
     def test_gm_admin_command(self):
         response = self.sms("ADMIN 2", url="/gm")
 
@@ -110,8 +184,32 @@ class PlayerTest(TwiMLTest):
     def test_sms(self):
         response = self.sms("Test")
         self.assertTwiML(response)
-        self.assertTrue("Redirect" in str(response.data))
-        self.assertTrue("/player" in str(response.data))
+        self.assertFalse("Redirect" in str(response.data))
+        self.assertTrue("Text YES to start" in str(response.data))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_sms_game(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        self.app.set_cookie('localhost', 'Stop', 'Fish')
+
+        response = self.sms("YES")
+
+        self.assertTwiML(response)
+        self.assertFalse("Redirect" in str(response.data))
+        self.assertTrue("/video/Fish" in str(response.data))
+
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Video for Fish delivered.")
+
+    def test_sms_help_in_game(self):
+        self.app.set_cookie('localhost', 'Stop', 'Fish')
+
+        response = self.sms("HELP")
+
+        self.assertTwiML(response)
+        self.assertTrue("CLUE" in str(response.data))
 
     def test_player_help(self):
         response = self.sms("HELP", url="/player")
@@ -235,7 +333,7 @@ class PlayerTestGame(TwiMLTest):
     def test_game_clue_0(self, create_message_mock):
         for stop in [n[0] for n in app.config['Game']['Stop'].items()]:
             create_message_mock.return_value.sid = "SM718"
-            self.app.set_cookie('localhost', 'Clue', '0')
+            sessions.update('game:+15558675309', Stop=stop, Clue=0)
             response = self.sms("CLUE", url="/player/{0}".format(stop))
 
             self.assertTwiML(response)
@@ -253,7 +351,7 @@ class PlayerTestGame(TwiMLTest):
     def test_game_clue_1(self, create_message_mock):
         for stop in [n[0] for n in app.config['Game']['Stop'].items()]:
             create_message_mock.return_value.sid = "SM718"
-            self.app.set_cookie('localhost', 'Clue', '1')
+            sessions.update('game:+15558675309', Stop=stop, Clue=1)
             response = self.sms("CLUE", url="/player/{0}".format(stop))
 
             self.assertTwiML(response)
@@ -272,7 +370,7 @@ class PlayerTestGame(TwiMLTest):
     def test_game_clue_2(self, create_message_mock):
         for stop in [n[0] for n in app.config['Game']['Stop'].items()]:
             create_message_mock.return_value.sid = "SM718"
-            self.app.set_cookie('localhost', 'Clue', '2')
+            sessions.update('game:+15558675309', Stop=stop, Clue=2)
             response = self.sms("CLUE", url="/player/{0}".format(stop))
 
             self.assertTwiML(response)
@@ -397,6 +495,1071 @@ class TestPlayerEdges(TwiMLTest):
                                                          "Bridge.")
 
 
+class MediaTest(TwiMLTest):
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_photos_batched(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        response = self.sms("Photos.",
+                            extra_params={'NumMedia': '3',
+                                          'MediaUrl0': 'https://a.com/0.jpg',
+                                          'MediaUrl1': 'https://a.com/1.jpg',
+                                          'MediaUrl2': 'https://a.com/2.jpg'})
+
+        self.assertTwiML(response)
+        self.assertTrue("trout" in str(response.data))
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Photo received for Fish.",
+            media_url=['https://a.com/0.jpg',
+                       'https://a.com/1.jpg',
+                       'https://a.com/2.jpg'])
+
+
+class SessionTest(TwiMLTest):
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_progress_without_cookies(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        self.app.cookie_jar.clear()
+
+        response = self.sms("CLUE")
+        self.app.cookie_jar.clear()
+
+        self.assertTrue("Willow" in str(response.data))
+
+        response = self.sms("CLUE")
+
+        self.assertTrue("Fly Fishing" in str(response.data))
+        self.assertEqual({'Stop': "Fish", 'Clue': 2},
+                         sessions.get('game:+15558675309'))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_independent_players(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15551110000', Stop="Bridge", Clue=0)
+        sessions.update('game:+15552220000', Stop="Farm", Clue=1)
+
+        response = self.sms("CLUE", from_='+15551110000')
+        self.assertTrue("1850" in str(response.data))
+
+        response = self.sms("CLUE", from_='+15552220000')
+        self.assertTrue("wool" in str(response.data))
+
+        self.assertEqual(1, sessions.get('game:+15551110000')['Clue'])
+        self.assertEqual(2, sessions.get('game:+15552220000')['Clue'])
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_finished(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        last = registry.get().default.graph.order[-1]
+        sessions.update('game:+15558675309', Stop=last, Clue=0)
+
+        self.sms("", extra_params={'NumMedia': '1',
+                                   'MediaUrl0': 'https://a.com/0.jpg'})
+
+        for body in ("CLUE", "YES", "Thanks!"):
+            response = self.sms(body)
+
+            self.assertEqual(200, response.status_code)
+            self.assertTrue("finished the scavenger hunt" in
+                            str(response.data))
+
+        create_message_mock.assert_called_with(
+            from_=app.config['TWILIO_CALLER_ID'], to=app.config['TWILIO_GM'],
+            body="Thanks!")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_clue_past_the_end(self, create_message_mock):
+        # e.g. after a reload dropped some of the stop's clues.
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Fish", Clue=99)
+
+        response = self.sms("CLUE")
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue("Willow" in str(response.data))
+        self.assertEqual(1, sessions.get('game:+15558675309')['Clue'])
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_stop_reloaded_away(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Gone", Clue=0)
+
+        response = self.sms("CLUE")
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue("Hang tight" in str(response.data))
+        self.assertTrue(any("Gone, which is no longer in the game" in
+                            call[1]['body'] for call in
+                            create_message_mock.call_args_list))
+        self.assertEqual({'Stop': "Gone", 'Clue': 0},
+                         sessions.get('game:+15558675309'))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_gm_admin_targets_player(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("ADMIN 2", from_=app.config['TWILIO_GM'])
+
+        self.assertEqual({'Stop': "Farm", 'Clue': 0},
+                         sessions.get('game:' + app.config['TWILIO_PLAYER']))
+
+        self.sms("ADMIN RESTART", from_=app.config['TWILIO_GM'])
+
+        self.assertEqual(None,
+                         sessions.get('game:' + app.config['TWILIO_PLAYER']))
+
+
+class MultiGameTest(TwiMLTest):
+    def setUp(self):
+        super(MultiGameTest, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'relay.json')
+
+        definition = copy.deepcopy(app.config['Game'])
+        definition.update({'Id': "relay",
+                           'Numbers': ['+15551230000'],
+                           'GM': ['+15551239999'],
+                           'Teams': {'Red': ['+15550000001',
+                                             '+15550000002'],
+                                     'Blue': ['+15550000003']}})
+
+        with open(path, 'w') as f:
+            json.dump(definition, f)
+
+        self.games = app.config['GAMES']
+        app.config['GAMES'] = self.games + [path]
+        load_games()
+
+    def tearDown(self):
+        app.config['GAMES'] = self.games
+        load_games()
+
+        self.directory.cleanup()
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_team_progress(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES", to='+15551230000', from_='+15550000001')
+        response = self.sms("CLUE", to='+15551230000', from_='+15550000002')
+
+        self.assertTrue("Willow" in str(response.data))
+        self.assertEqual({'Stop': "Fish", 'Clue': 1},
+                         sessions.get('relay:Red'))
+
+        create_message_mock.assert_called_with(from_='+15551230000',
+                                               to='+15551239999',
+                                               body="[Red] Clue 0 for Fish "
+                                                    "requested.")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_gm_relay(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("Hurry up!", to='+15551230000', from_='+15551239999')
+
+        self.assertEqual(3, create_message_mock.call_count)
+        create_message_mock.assert_called_with(from_='+15551230000',
+                                               to='+15550000003',
+                                               body="Hurry up!")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_gm_relay_team(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("red: Left at the fountain.", to='+15551230000',
+                 from_='+15551239999')
+
+        self.assertEqual(['+15550000001', '+15550000002'],
+                         self.sent_to(create_message_mock,
+                                      "Left at the fountain."))
+
+        # Not a team, so everyone gets all of it.
+        self.sms("Note: five minutes.", to='+15551230000',
+                 from_='+15551239999')
+
+        self.assertEqual(3, len(self.sent_to(create_message_mock,
+                                             "Note: five minutes.")))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_start_team(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.sms("START Blue", to='+15551230000',
+                            from_='+15551239999')
+
+        self.assertTrue("Message sent" in str(response.data))
+        create_message_mock.assert_called_once()
+        self.assertEqual('+15550000003',
+                         create_message_mock.call_args[1]['to'])
+
+        # Not a team, so relayed as typed.
+        self.sms("START Green", to='+15551230000', from_='+15551239999')
+
+        self.assertEqual(['+15550000001', '+15550000002', '+15550000003'],
+                         self.sent_to(create_message_mock, "START Green"))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_gm_admin_team(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("ADMIN 3 Red", to='+15551230000', from_='+15551239999')
+
+        self.assertEqual({'Stop': "Synagogue", 'Clue': 0},
+                         sessions.get('relay:Red'))
+        self.assertEqual(None, sessions.get('game:Red'))
+
+    def test_gm_admin_unknown_team(self):
+        response = self.sms("ADMIN 3 Rde", to='+15551230000',
+                            from_='+15551239999')
+
+        self.assertTrue("No team called Rde. Text ADMIN 3 followed by one "
+                        "of: Blue, Red." in str(response.data))
+        self.assertEqual(None, sessions.get('relay:Rde'))
+
+    def test_gm_admin_needs_team(self):
+        response = self.sms("ADMIN STATUS", to='+15551230000',
+                            from_='+15551239999')
+
+        self.assertTrue("Text ADMIN STATUS followed by one of: Blue, Red."
+                        in str(response.data))
+
+    def broadcast(self, body):
+        return self.sms(body, to='+15551230000', from_='+15551239999')
+
+    def sent_to(self, create_message_mock, body):
+        return sorted(call[1]['to'] for call in
+                      create_message_mock.call_args_list
+                      if call[1]['body'] == body)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_broadcast_all(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.broadcast("BROADCAST Ten  minutes left!")
+
+        self.assertTrue("Broadcasting to 3 players." in str(response.data))
+        self.assertEqual(['+15550000001', '+15550000002', '+15550000003'],
+                         self.sent_to(create_message_mock,
+                                      "Ten  minutes left!"))
+        create_message_mock.assert_called_with(from_='+15551230000',
+                                               to='+15551239999',
+                                               body="Broadcast done: sent "
+                                                    "to 3.")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_broadcast_team(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.broadcast("broadcast team red Regroup at the bar.")
+
+        self.assertTrue("Broadcasting to 2 players." in str(response.data))
+        self.assertEqual(['+15550000001', '+15550000002'],
+                         self.sent_to(create_message_mock,
+                                      "Regroup at the bar."))
+
+        response = self.broadcast("BROADCAST TEAM Green Hi")
+
+        self.assertTrue("Text BROADCAST followed by" in str(response.data))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_broadcast_stop(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.broadcast("BROADCAST STOP Farm Nearly there.")
+        self.assertTrue("No players to send to." in str(response.data))
+
+        sessions.update('relay:Red', Stop="Farm", Clue=0)
+
+        response = self.broadcast("BROADCAST STOP Farm Nearly there.")
+
+        self.assertTrue("Broadcasting to 2 players." in str(response.data))
+        self.assertEqual(['+15550000001', '+15550000002'],
+                         self.sent_to(create_message_mock, "Nearly there."))
+
+    def test_broadcast_without_message(self):
+        response = self.broadcast("BROADCAST ALL")
+
+        self.assertTrue("Text BROADCAST followed by" in str(response.data))
+
+
+class CommandTest(TwiMLTest):
+    def setUp(self):
+        super(CommandTest, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'game.json')
+
+        definition = copy.deepcopy(app.config['Game'])
+        definition['Commands'] = {
+            'CLUE': {'Aliases': ["PISTA"]},
+            'RULES': {'Messages': [{'Body': "Stay off the tracks."}],
+                      'Notify': "Rules requested."}}
+
+        with open(path, 'w') as f:
+            json.dump(definition, f)
+
+        self.games = app.config['GAMES']
+        app.config['GAMES'] = [path]
+        load_games()
+
+    def tearDown(self):
+        app.config['GAMES'] = self.games
+        load_games()
+
+        self.directory.cleanup()
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_declared_reply(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        response = self.sms("rules")
+
+        self.assertTwiML(response)
+        self.assertTrue("Stay off the tracks." in str(response.data))
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Rules requested.")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_declared_alias(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        response = self.sms("pista")
+
+        self.assertTrue("Willow" in str(response.data))
+        self.assertEqual(1, sessions.get('game:+15558675309')['Clue'])
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_typo(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        response = self.sms("Cleu")
+
+        self.assertTrue("Willow" in str(response.data))
+
+
+class EventLogTest(TwiMLTest):
+    def setUp(self):
+        super(EventLogTest, self).setUp()
+
+        self.logged = []
+        self.writer = events.writer
+        events.writer = mock.Mock(write_many=self.logged.extend)
+
+    def tearDown(self):
+        events.writer = self.writer
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_progress(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        self.sms("CLUE")
+        self.sms("", extra_params={'NumMedia': '1',
+                                   'MediaUrl0': "https://example.com/0.jpg"})
+        events.flush()
+
+        self.assertEqual(['start', 'clue', 'photo'],
+                         [event['type'] for event in self.logged])
+        self.assertEqual({'game': "game", 'player': "game:+15558675309",
+                          'stop': "Fish", 'next': "Bridge", 'media': 1},
+                         {key: value for key, value in self.logged[2].items()
+                          if key not in ('ts', 'type')})
+
+
+class DigestTest(TwiMLTest):
+    def setUp(self):
+        super(DigestTest, self).setUp()
+
+        gm_digest.window = 60
+
+    def tearDown(self):
+        gm_digest.flush_all()
+        gm_digest.window = 0
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_digest(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        self.sms("CLUE")
+        self.sms("Which willow?")
+
+        create_message_mock.assert_not_called()
+
+        gm_digest.flush_all()
+
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="3 updates:\n- Game started.\n- Clue 0 for Fish "
+                 "requested.\n- Which willow?")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_stuck_bypasses(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        self.sms("STUCK")
+
+        self.assertEqual(2, create_message_mock.call_count)
+        create_message_mock.assert_called_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Player is indicating she is stuck.")
+
+
+class SignatureTest(TwiMLTest):
+    def post(self, url, headers=None):
+        return self.app.post(url, data={'From': '+15558675309',
+                                        'To': app.config['TWILIO_CALLER_ID'],
+                                        'Body': "ADMIN 3"},
+                             headers=headers)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_unsigned(self, create_message_mock):
+        rejected = signatures.rejected
+
+        for url in ('/sms', '/gm', '/player', '/player/Fish', '/gm/admin',
+                    '/voice'):
+            response = self.post(url)
+
+            self.assertEqual(403, response.status_code)
+
+        self.assertEqual(rejected + 6, signatures.rejected)
+        self.assertEqual(None, sessions.get('game:+15558675309'))
+        create_message_mock.assert_not_called()
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_forged(self, create_message_mock):
+        headers = self.sign('/gm/admin', {'Body': "ADMIN 1"})
+
+        response = self.post('/gm/admin', headers=headers)
+
+        self.assertEqual(403, response.status_code)
+        create_message_mock.assert_not_called()
+
+    def test_port_variant(self):
+        validator = RequestValidator(app.config['TWILIO_AUTH_TOKEN'])
+        params = {'From': '+15558675309', 'To': app.config['TWILIO_CALLER_ID'],
+                  'Body': "HELP"}
+
+        signature = validator.compute_signature("http://localhost:80/sms",
+                                                params)
+        response = self.app.post('/sms', data=params,
+                                 headers={'X-Twilio-Signature': signature})
+
+        self.assertTwiML(response)
+
+    def test_base_url(self):
+        app.config['BASE_URL'] = "https://hunt.example.com/"
+
+        try:
+            validator = RequestValidator(app.config['TWILIO_AUTH_TOKEN'])
+            params = {'From': '+15558675309', 'Body': "HELP",
+                      'To': app.config['TWILIO_CALLER_ID']}
+
+            signature = validator.compute_signature(
+                "https://hunt.example.com/sms", params)
+            response = self.app.post('/sms', data=params,
+                                     headers={'X-Twilio-Signature':
+                                              signature})
+
+            self.assertTwiML(response)
+            self.assertEqual(403, self.sms("HELP").status_code)
+        finally:
+            app.config['BASE_URL'] = None
+
+    def test_pages_exempt(self):
+        self.assertEqual(200, self.app.get('/video/Fish').status_code)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_disabled(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        app.config['TWILIO_VALIDATE_SIGNATURES'] = False
+
+        try:
+            self.assertTwiML(self.post('/sms'))
+        finally:
+            app.config['TWILIO_VALIDATE_SIGNATURES'] = True
+
+
+class DedupeTest(TwiMLTest):
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_retried_photo(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        params = {'SmsSid': "SMretried", 'NumMedia': '1',
+                  'MediaUrl0': "https://example.com/0.jpg"}
+
+        first = self.sms("", extra_params=params)
+        retry = self.sms("", extra_params=params)
+
+        self.assertEqual(first.data, retry.data)
+        self.assertEqual(first.headers.getlist('Set-Cookie'),
+                         retry.headers.getlist('Set-Cookie'))
+        self.assertEqual("Bridge", sessions.get('game:+15558675309')['Stop'])
+        self.assertEqual(1, create_message_mock.call_count)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_in_flight(self, create_message_mock):
+        replies.begin("SMinflight:/sms")
+
+        response = self.sms("STUCK", extra_params={'SmsSid': "SMinflight"})
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(b"<Response />" in response.data)
+        create_message_mock.assert_not_called()
+
+
+class ReloadTest(TwiMLTest):
+    def setUp(self):
+        super(ReloadTest, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'game.json')
+        self.definition = copy.deepcopy(app.config['Game'])
+        self.write(self.definition)
+
+        self.games = app.config['GAMES']
+        app.config['GAMES'] = [self.path]
+        load_games()
+
+        # Runs the reload in the request, so it's done when the reply is.
+        patcher = mock.patch.object(reloader, 'reload_async',
+                                    lambda callback: callback(
+                                        reloader.reload()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        app.config['GAMES'] = self.games
+        load_games()
+
+        self.directory.cleanup()
+
+    def write(self, definition):
+        with open(self.path, 'w') as f:
+            json.dump(definition, f)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_admin_reload(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        self.definition['Stop']['Fish']['Clues'][0]['Messages'][0]['Body'] = \
+            "Look under the bench."
+        self.write(self.definition)
+
+        response = self.sms("ADMIN RELOAD", from_="+15556667777")
+
+        self.assertTrue("Reloading game." in str(response.data))
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Game reloaded.")
+
+        response = self.sms("CLUE")
+
+        self.assertTrue("Look under the bench." in str(response.data))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_invalid_game_kept(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        games = registry.get()
+
+        self.definition['Stop']['Fish']['Clues'] = []
+        self.write(self.definition)
+
+        self.sms("ADMIN RELOAD", from_="+15556667777")
+
+        self.assertTrue(registry.get() is games)
+        body = create_message_mock.call_args[1]['body']
+        self.assertTrue(body.startswith("Reload failed, game unchanged:"))
+        self.assertTrue("Stop Fish.Clues: expected at least one clue"
+                        in body)
+
+    def test_players_cannot_reload(self):
+        games = registry.get()
+
+        response = self.sms("ADMIN RELOAD")
+
+        self.assertTrue("ADMIN RESTART" in str(response.data))
+        self.assertTrue(registry.get() is games)
+
+    def test_in_flight_request_keeps_game(self):
+        game = registry.get().default
+
+        self.definition['Stop']['Synagogue']['Victory']['Next'] = "Done"
+        del self.definition['Stop']['Brewery']
+        self.write(self.definition)
+
+        self.assertEqual(None, reloader.reload())
+
+        # A request that resolved the old game still sees all its stops.
+        self.assertTrue('Brewery' in game.compiled.stops)
+        self.assertFalse('Brewery' in registry.get().default.compiled.stops)
+
+
+class MetricsTest(TwiMLTest):
+    def tearDown(self):
+        app.config['METRICS_TOKEN'] = None
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_metrics(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        self.sms("CLUE")
+
+        response = self.app.get('/metrics')
+        text = response.data.decode('utf-8')
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertTrue('http_request_duration_seconds_count{endpoint='
+                        '"player_game",method="POST",status="200"}' in text)
+        self.assertTrue('game_events_total{type="clue"}' in text)
+        self.assertTrue('twilio_request_duration_seconds_count'
+                        '{recipient="gm"}' in text)
+        self.assertTrue("\ndispatch_queue_depth 0\n" in text)
+        self.assertTrue("\ntwilio_pool_size {0}\n".format(
+            app.config['TWILIO_POOL_SIZE']) in text)
+        self.assertTrue("\ntwilio_pool_saturated_total 0\n" in text)
+        self.assertTrue("\nmedia_batch_saved_total " in text)
+
+    def test_token(self):
+        app.config['METRICS_TOKEN'] = "s3cret"
+
+        self.assertEqual(401, self.app.get('/metrics').status_code)
+        self.assertEqual(200, self.app.get(
+            '/metrics',
+            headers={'Authorization': "Bearer s3cret"}).status_code)
+
+
+class StatusTest(TwiMLTest):
+    def setUp(self):
+        super(StatusTest, self).setUp()
+
+        app.config['BASE_URL'] = "http://localhost/"
+        delivery.clear()
+
+    def tearDown(self):
+        app.config['BASE_URL'] = None
+
+    def status(self, sid, status, error_code=None):
+        params = {'MessageSid': sid,
+                  'AccountSid': app.config['TWILIO_ACCOUNT_SID'],
+                  'From': app.config['TWILIO_CALLER_ID'],
+                  'To': app.config['TWILIO_PLAYER'],
+                  'MessageStatus': status}
+        if error_code:
+            params['ErrorCode'] = error_code
+
+        return self.app.post('/status', data=params,
+                             headers=self.sign('/status', params))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def send(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM" + "a" * 32
+
+        self.sms("Meet at the bridge.", from_="+15556667777")
+
+        create_message_mock.assert_called_once_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_PLAYER'],
+            body="Meet at the bridge.",
+            status_callback="http://localhost/status")
+
+        return "SM" + "a" * 32
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_delivered(self, create_message_mock):
+        sid = self.send()
+
+        self.assertEqual(204, self.status(sid, 'sent').status_code)
+        self.assertEqual(204, self.status(sid, 'delivered').status_code)
+
+        self.assertEqual(('delivered', None), delivery.status(sid))
+        create_message_mock.assert_not_called()
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_undelivered_resent(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM" + "b" * 32
+        sid = self.send()
+
+        self.status(sid, 'undelivered', "30003")
+
+        create_message_mock.assert_any_call(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_PLAYER'],
+            body="Meet at the bridge.",
+            status_callback="http://localhost/status")
+        create_message_mock.assert_called_with(
+            from_=app.config['TWILIO_CALLER_ID'],
+            to=app.config['TWILIO_GM'],
+            body="Text to {0} failed (30003): \"Meet at the bridge.\" "
+                 "Resending.".format(app.config['TWILIO_PLAYER']),
+            status_callback="http://localhost/status")
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_retries_limited(self, create_message_mock):
+        app.config['STATUS_RETRIES'] = 0
+        self.addCleanup(app.config.update, STATUS_RETRIES=2)
+        create_message_mock.return_value.sid = "SM" + "b" * 32
+
+        self.status(self.send(), 'failed', "30003")
+
+        self.assertEqual(1, create_message_mock.call_count)
+        self.assertTrue("Not resent." in
+                        create_message_mock.call_args[1]['body'])
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_permanent_error(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM" + "b" * 32
+
+        self.status(self.send(), 'undelivered', "30006")
+
+        self.assertEqual(1, create_message_mock.call_count)
+        self.assertEqual(app.config['TWILIO_GM'],
+                         create_message_mock.call_args[1]['to'])
+
+    def test_not_replayed(self):
+        sid = self.send()
+
+        self.status(sid, 'sent')
+        self.status(sid, 'delivered')
+
+        self.assertEqual(('delivered', None), delivery.status(sid))
+
+    def test_unsigned(self):
+        response = self.app.post('/status', data={'MessageSid': "SM1",
+                                                  'MessageStatus': 'failed'})
+
+        self.assertEqual(403, response.status_code)
+
+
+class TimerTest(TwiMLTest):
+    def setUp(self):
+        super(TimerTest, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'game.json')
+
+        definition = copy.deepcopy(app.config['Game'])
+        definition['HintAfter'] = 10
+        definition['Stop']['Bridge']['HintAfter'] = 0
+        definition['Timers'] = [{'After': 60, 'Messages': [
+            {'Body': "30 minutes left!"}]}]
+
+        with open(path, 'w') as f:
+            json.dump(definition, f)
+
+        self.games = app.config['GAMES']
+        app.config['GAMES'] = [path]
+        app.config['BASE_URL'] = "http://localhost/"
+        load_games()
+
+        scheduler.clear()
+        self.key = 'game:+15558675309'
+
+    def tearDown(self):
+        app.config['GAMES'] = self.games
+        app.config['BASE_URL'] = None
+        load_games()
+
+        scheduler.clear()
+        self.directory.cleanup()
+
+    def bodies(self, create_message_mock, to):
+        return [call[1]['body'] for call in create_message_mock.call_args_list
+                if call[1]['to'] == to]
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_hint_pushed(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        hint = scheduler.get(self.key, 'hint')
+
+        self.assertEqual('Fish', hint.payload['stop'])
+        self.assertAlmostEqual(time.time() + 600, hint.due, delta=5)
+
+        create_message_mock.reset_mock()
+        self.assertEqual(1, scheduler.run_due(hint.due))
+
+        self.assertTrue("Willow" in self.bodies(create_message_mock,
+                                                "+15558675309")[0])
+        self.assertEqual(["Clue 0 for Fish sent, no progress."],
+                         self.bodies(create_message_mock,
+                                     app.config['TWILIO_GM']))
+        self.assertEqual(1, sessions.get(self.key)['Clue'])
+
+        # Again until the clues run out.
+        self.assertTrue(scheduler.get(self.key, 'hint').due > hint.due)
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_clue_resets_hint(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        hint = scheduler.get(self.key, 'hint')
+
+        self.sms("CLUE")
+
+        self.assertEqual(0, scheduler.run_due(hint.due))
+        self.assertEqual(1, sessions.get(self.key)['Clue'])
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_progress(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        hint = scheduler.get(self.key, 'hint')
+
+        self.sms("", extra_params={'NumMedia': "1",
+                                   'MediaUrl0': "http://example.com/1.jpg"})
+
+        # No hints at Bridge.
+        self.assertEqual(None, scheduler.get(self.key, 'hint'))
+        create_message_mock.reset_mock()
+        self.assertEqual(0, scheduler.run_due(hint.due))
+        create_message_mock.assert_not_called()
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_timed_message(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        timer = scheduler.get(self.key, 'timer0')
+
+        self.assertAlmostEqual(time.time() + 3600, timer.due, delta=5)
+
+        create_message_mock.reset_mock()
+        scheduler.run_due(timer.due)
+
+        self.assertTrue("30 minutes left!" in
+                        self.bodies(create_message_mock, "+15558675309"))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_restart_cancels(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        self.assertEqual(2, len(scheduler))
+
+        self.sms("ADMIN RESTART")
+
+        self.assertEqual(0, len(scheduler))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_restarted_player_skipped(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+
+        self.sms("YES")
+        hint = scheduler.get(self.key, 'hint')
+        sessions.delete(self.key)
+
+        create_message_mock.reset_mock()
+        scheduler.run_due(hint.due)
+
+        create_message_mock.assert_not_called()
+
+    def test_needs_base_url(self):
+        app.config['BASE_URL'] = None
+
+        self.sms("YES")
+
+        self.assertEqual(0, len(scheduler))
+
+
+class GalleryTest(TwiMLTest):
+    def setUp(self):
+        super(GalleryTest, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = PhotoArchive(self.directory.name, workers=0)
+
+        patcher = mock.patch('app.archive', self.archive)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add(self, stop, digest):
+        object = "objects/{0}/{1}.jpg".format(digest[:2], digest)
+        path = os.path.join(self.directory.name, object)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b"\xff\xd8\xff\xe0")
+
+        # The GM's ADMIN commands default to the only player.
+        self.archive.index.add('game', app.config['TWILIO_PLAYER'], stop,
+                               digest, object, None, 'image/jpeg', 4,
+                               "https://a.com/" + digest, time.time())
+
+        return object
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_photos_archived(self, create_message_mock):
+        create_message_mock.return_value.sid = "SM718"
+        sessions.update('game:+15558675309', Stop="Fish", Clue=0)
+
+        with mock.patch.object(self.archive, 'put') as put:
+            self.sms("", extra_params={'NumMedia': '2',
+                                       'MediaUrl0': 'https://a.com/0.jpg',
+                                       'MediaUrl1': 'https://a.com/1.jpg'})
+
+        put.assert_has_calls([
+            mock.call('https://a.com/0.jpg', 'game', '+15558675309', 'Fish'),
+            mock.call('https://a.com/1.jpg', 'game', '+15558675309',
+                      'Fish')])
+
+    def test_gallery(self):
+        object = self.add('Bridge', "b" * 64)
+        self.add('Fish', "a" * 64)
+
+        response = self.sms("ADMIN GALLERY", from_=app.config['TWILIO_GM'])
+        url = html.unescape(re.search(r"http://localhost(/gallery/[^<]+)",
+                                      response.data.decode('utf-8')).group(1))
+
+        response = self.app.get(url)
+        page = response.data.decode('utf-8')
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(page.index("Fish") < page.index("Bridge"))
+        self.assertTrue("/archive/" + object in page)
+
+        response = self.app.get("/archive/" + object)
+        self.assertEqual(b"\xff\xd8\xff\xe0", response.data)
+        response.close()
+
+    def test_gallery_signed(self):
+        response = self.app.get("/gallery/game/%2B15558675309?sig=forged")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_index_not_served(self):
+        response = self.app.get("/archive/archive.db")
+
+        self.assertEqual(404, response.status_code)
+
+    def test_players_cant_ask(self):
+        response = self.sms("ADMIN GALLERY")
+
+        self.assertFalse("/gallery/" in str(response.data))
+
+
+class VideoTest(TwiMLTest):
+    def test_video(self):
+        response = self.app.get('/video/Farm')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("Camelids Have More Fun" in str(response.data))
+        self.assertTrue("video/dylanplayfair.mp4" in str(response.data))
+        self.assertTrue("images/jimihendrix." in str(response.data))
+
+    @mock.patch.object(static_files, 'digest')
+    def test_poster(self, digest_mock):
+        digest_mock.side_effect = lambda path: \
+            "0" * 12 if "posters" in path else None
+        pages.clear()
+
+        response = self.app.get('/video/Farm')
+        pages.clear()
+
+        self.assertTrue("video/posters/dylanplayfair." in str(response.data))
+        self.assertFalse("images/jimihendrix." in str(response.data))
+
+    def test_cache_headers(self):
+        response = self.app.get('/video/Fish')
+
+        self.assertTrue(response.headers.get('ETag'))
+        self.assertTrue("public" in response.headers['Cache-Control'])
+        self.assertTrue("max-age=" in response.headers['Cache-Control'])
+
+    def test_not_modified(self):
+        response = self.app.get('/video/Bridge')
+
+        response = self.app.get('/video/Bridge',
+                                headers={'If-None-Match':
+                                         response.headers['ETag']})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(b"", response.data)
+
+    def test_cached(self):
+        self.app.get('/video/Synagogue')
+        hits = pages.hits
+
+        response = self.app.get('/video/Synagogue')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hits + 1, pages.hits)
+
+    def test_game_parameter(self):
+        response = self.app.get('/video/Final?game=game')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("Happy Berfday" in str(response.data))
+
+    def test_404_not_conditional(self):
+        response = self.app.get('/video/doesnotexist')
+
+        response = self.app.get('/video/doesnotexist',
+                                headers={'If-None-Match':
+                                         response.headers['ETag']})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AdminTest(TwiMLTest):
+    def test_status(self):
+        sessions.update('game:+15558675309', Stop="Farm", Clue=2)
+
+        response = self.sms("ADMIN STATUS")
+
+        self.assertTwiML(response)
+        self.assertTrue("At Farm (3 of 5), next clue 2." in str(response.data))
+
+    def test_status_not_started(self):
+        response = self.sms("ADMIN STATUS")
+
+        self.assertTrue("Game not started." in str(response.data))
+
+    @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
+    def test_stop_out_of_range(self, create_message_mock):
+        response = self.sms("ADMIN 9")
+
+        self.assertTwiML(response)
+        self.assertTrue("No stop 9" in str(response.data))
+
+        create_message_mock.assert_not_called()
+
+    def test_unknown_command(self):
+        response = self.sms("ADMIN")
+
+        self.assertTwiML(response)
+        self.assertTrue("ADMIN RESTART" in str(response.data))
+
+
 class UtilitiesTest(TwiMLTest):
     @mock.patch('twilio.rest.api.v2010.account.message.MessageList.create')
     def test_send_player_message(self, create_message_mock):
@@ -449,3 +1612,47 @@ class UtilitiesTest(TwiMLTest):
                                                     body="Testing GM "
                                                          "message.",
                                                     media_url="/booger.jpg")
+
+
+class StartupTest(TestCase):
+    def test_create_app(self):
+        other = create_app({'VIDEO_CACHE_MAX_AGE': 60})
+
+        self.assertEqual(60, other.config['VIDEO_CACHE_MAX_AGE'])
+        self.assertEqual(app.config['GAMES'], other.config['GAMES'])
+        self.assertTrue('Game' not in other.config)
+        self.assertEqual(
+            sorted(rule.rule for rule in app.url_map.iter_rules()),
+            sorted(rule.rule for rule in other.url_map.iter_rules()))
+
+        # Each app serves with its own settings.
+        response = other.test_client().get('/video/Fish')
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue("max-age=60" in response.headers['Cache-Control'])
+        self.assertTrue("max-age=3600" in
+                        app.test_client().get('/video/Fish')
+                        .headers['Cache-Control'])
+
+    def test_games_path_independent_of_cwd(self):
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+
+            try:
+                games = load_games()
+            finally:
+                os.chdir(cwd)
+
+        self.assertTrue(registry.get() is games)
+        self.assertEqual("Fish", games.default.graph.start)
+
+    def test_import_defers_requests(self):
+        # A fresh interpreter - this one has imported it already.
+        output = subprocess.check_output(
+            [sys.executable, '-c', "import sys, app; "
+             "print('requests' in sys.modules)"],
+            cwd=app.root_path)
+
+        self.assertEqual(b"False", output.strip())
@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest import skipUnless
+from unittest import TestCase
+
+from archive import PhotoArchive
+
+
+# A JPEG header is enough for the archive - it only looks at Content-Type.
+PHOTO = b"\xff\xd8\xff\xe0" + os.urandom(200000)
+OTHER = b"\xff\xd8\xff\xe0" + os.urandom(1000)
+
+AUTH = "Basic " + base64.b64encode(b"ACxxxx:yyyyyyy").decode('ascii')
+
+
+class MediaHost(BaseHTTPRequestHandler):
+    '''
+    Stands in for Twilio's media URLs: /Media/<name> checks the account's
+    credentials and redirects to the file, like Twilio does to its CDN.
+    The first request for flaky fails.
+    '''
+    files = {'photo': ('image/jpeg', PHOTO), 'other': ('image/jpeg', OTHER),
+             'card': ('text/vcard', b"BEGIN:VCARD\r\nEND:VCARD\r\n")}
+
+    def do_GET(self):
+        server = self.server
+        name = self.path.rsplit('/', 1)[-1]
+
+        if self.path.startswith('/Media/'):
+            if self.headers.get('Authorization', None) != AUTH:
+                self.send_response(401)
+                self.end_headers()
+                return
+
+            self.send_response(307)
+            self.send_header('Location', '/cdn/' + name)
+            self.end_headers()
+            return
+
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            server.requests += 1
+
+        try:
+            if name.startswith('flaky') and server.requests <= 1:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            # photo-1, photo-2 ... are all the same picture.
+            content_type, body = self.files[name.split('-')[0]
+                                            .replace('flaky', 'photo')]
+
+            time.sleep(server.delay)
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+
+            for start in range(0, len(body), 8192):
+                self.wfile.write(body[start:start + 8192])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class PhotoArchiveTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHost)
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.peak = self.server.requests = 0
+        self.server.delay = 0
+
+        threading.Thread(target=self.server.serve_forever, args=(0.01,),
+                         daemon=True).start()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = PhotoArchive(self.directory.name,
+                                    auth=("ACxxxx", "yyyyyyy"), workers=0,
+                                    chunk_size=4096, backoff=0)
+
+    def tearDown(self):
+        self.archive.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def url(self, name):
+        return "http://127.0.0.1:{0}/Media/{1}".format(
+            self.server.server_address[1], name)
+
+    def test_archived(self):
+        object = self.archive.put(self.url('photo'), 'game', 'Red', 'Fish')
+
+        digest = hashlib.sha256(PHOTO).hexdigest()
+
+        self.assertEqual("objects/{0}/{1}.jpg".format(digest[:2], digest),
+                         object)
+
+        with open(os.path.join(self.directory.name, object), 'rb') as f:
+            self.assertEqual(PHOTO, f.read())
+
+        self.assertEqual([], os.listdir(os.path.join(self.directory.name,
+                                                     'tmp')))
+        self.assertEqual(1, self.archive.archived)
+
+    def test_deduped(self):
+        self.archive.put(self.url('photo-1'), 'game', 'Red', 'Fish')
+        self.archive.put(self.url('photo-2'), 'game', 'Red', 'Fish')
+        self.archive.put(self.url('photo-3'), 'game', 'Red', 'Bridge')
+        self.archive.put(self.url('photo-3'), 'game', 'Red', 'Bridge')
+
+        objects = [name for _, _, names in
+                   os.walk(os.path.join(self.directory.name, 'objects'))
+                   for name in names]
+
+        self.assertEqual(1, len(objects))
+        self.assertEqual(2, self.archive.index.count())
+        self.assertEqual(3, self.archive.duplicates)
+        self.assertEqual(3, self.server.requests)
+
+    def test_gallery(self):
+        self.archive.put(self.url('photo'), 'game', 'Red', 'Bridge',
+                         received=2)
+        self.archive.put(self.url('other'), 'game', 'Red', 'Fish',
+                         received=1)
+        self.archive.put(self.url('photo-2'), 'game', 'Blue', 'Fish')
+
+        gallery = self.archive.gallery('game', 'Red', order=('Fish',
+                                                             'Bridge'))
+
+        self.assertEqual(['Fish', 'Bridge'], [stop for stop, _ in gallery])
+        self.assertEqual(1, len(gallery[0][1]))
+
+    @skipUnless(not shutil.which('ffmpeg'), "ffmpeg installed")
+    def test_no_thumbnail(self):
+        self.archive.put(self.url('photo'), 'game', 'Red', 'Fish')
+
+        photo = self.archive.gallery('game', 'Red')[0][1][0]
+
+        # The original stands in.
+        self.assertEqual(photo['object'], photo['thumbnail'])
+
+    @skipUnless(shutil.which('ffmpeg'), "needs ffmpeg")
+    def test_thumbnail(self):
+        self.archive.put(self.url('photo'), 'game', 'Red', 'Fish')
+
+        photo = self.archive.gallery('game', 'Red')[0][1][0]
+
+        self.assertTrue(photo['thumbnail'].startswith('thumbs/'))
+
+    def test_not_a_photo(self):
+        with self.assertLogs('archive', 'WARNING'):
+            self.assertEqual(None, self.archive.put(self.url('card'), 'game',
+                                                    'Red', 'Fish'))
+
+        self.assertEqual(1, self.archive.failed)
+
+    def test_too_large(self):
+        self.archive.max_bytes = 50000
+
+        with self.assertLogs('archive', 'WARNING'):
+            self.archive.put(self.url('photo'), 'game', 'Red', 'Fish')
+
+        self.assertEqual(0, self.archive.index.count())
+        self.assertEqual([], os.listdir(os.path.join(self.directory.name,
+                                                     'tmp')))
+
+    def test_unauthorized(self):
+        self.archive.auth = ("ACxxxx", "wrong")
+        self.archive.max_retries = 0
+
+        with self.assertLogs('archive', 'ERROR'):
+            self.archive.put(self.url('photo'), 'game', 'Red', 'Fish')
+
+        self.assertEqual(1, self.archive.failed)
+
+    def test_retried(self):
+        self.assertTrue(self.archive.put(self.url('flaky'), 'game', 'Red',
+                                         'Fish'))
+
+    def test_bounded_concurrency(self):
+        self.archive.workers = 2
+        self.server.delay = 0.05
+
+        for n in range(0, 8):
+            self.archive.put(self.url('photo-{0}'.format(n)), 'game', 'Red',
+                             'Fish')
+
+        self.assertTrue(self.archive.drain(10))
+
+        self.assertEqual(8, self.server.requests)
+        self.assertEqual(2, self.server.peak)
+        self.assertEqual(1, self.archive.index.count())
@@ -0,0 +1,81 @@
+from unittest import TestCase
+from unittest import mock
+
+from commands import Command
+from commands import CommandParser
+
+
+class CommandParserTest(TestCase):
+    def setUp(self):
+        self.parser = CommandParser()
+
+    def assertCommand(self, name, body, args=()):
+        command = self.parser.parse(body)
+
+        self.assertEqual(name, command.name, "{0!r} parsed as {1!r}"
+                                             "".format(body, command))
+        self.assertEqual(args, command.args)
+
+    def test_keywords(self):
+        self.assertCommand('YES', "yes")
+        self.assertCommand('YES', "  YES!!!! ")
+        self.assertCommand('CLUE', "Clue?")
+        self.assertCommand('NO', "no.")
+        self.assertCommand('HELP', "help me", args=("me",))
+        self.assertCommand('ADMIN', "ADMIN 3 Red", args=("3", "Red"))
+
+    def test_trailing_words(self):
+        self.assertCommand(None, "Clue me in")
+        self.assertCommand(None, "No idea where the bridge is")
+
+    def test_aliases(self):
+        self.assertCommand('CLUE', "hint")
+        self.assertCommand('YES', "Yep!")
+        self.assertCommand('NO', "nope")
+        self.assertCommand(None, "hint please")
+
+    def test_typos(self):
+        self.assertCommand('CLUE', "CLEU")
+        self.assertCommand('CLUE', "clu")
+        self.assertCommand('CLUE', "clues")
+        self.assertCommand('HELP', "hlep")
+        self.assertCommand('STUCK', "stuk")
+        self.assertCommand('ADMIN', "admn")
+        self.assertCommand(None, "hello")
+        self.assertCommand(None, "not")
+
+    def test_exact(self):
+        self.assertEqual(Command('CLUE', (), "Clue"),
+                         self.parser.parse("Clue"))
+        self.assertEqual(Command('NO', (), "nah"), self.parser.parse("nah"))
+        self.assertCommand('CLUE', "cLuE")
+
+    @mock.patch('commands.FUZZY_CACHE', 2)
+    def test_typo_cache(self):
+        self.assertCommand('CLUE', "cleu")
+        self.assertCommand(None, "hello")
+        self.assertEqual({'CLEU': 'CLUE', 'HELLO': None}, self.parser.typos)
+
+        self.assertCommand('HELP', "hlep")
+        self.assertCommand('CLUE', "cleu")
+        self.assertEqual({'HLEP': 'HELP', 'CLEU': 'CLUE'}, self.parser.typos)
+
+    def test_free_text(self):
+        command = self.parser.parse(" Where is the bridge? ")
+
+        self.assertEqual(Command(None, (), "Where is the bridge?"), command)
+        self.assertEqual(None, self.parser.parse("").name)
+        self.assertEqual(None, self.parser.parse(None).name)
+
+    def test_declared(self):
+        self.parser = CommandParser({
+            'clue': {'Aliases': ["pista"]},
+            'Rules': {'Aliases': ["rule"],
+                      'Messages': [{'Body': "Stay off the tracks."}]}})
+
+        self.assertCommand('CLUE', "PISTA")
+        self.assertCommand('CLUE', "hint")
+        self.assertCommand('RULES', "rules")
+        self.assertCommand('RULES', "Rule")
+        self.assertCommand('RULES', "rulse")
+        self.assertEqual(['RULES'], list(self.parser.replies))
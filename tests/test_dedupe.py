@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+
+from unittest import TestCase
+
+from flask import Flask
+
+from dedupe import MemoryReplyBackend
+from dedupe import PENDING
+from dedupe import ReplyCache
+from dedupe import SQLiteReplyBackend
+
+
+class BackendTests(object):
+    def test_claim(self):
+        expires = time.time() + 60
+
+        self.assertEqual(None, self.backend.claim('SM1:/sms', expires))
+        self.assertTrue(self.backend.claim('SM1:/sms', expires) is PENDING)
+        self.assertEqual(None, self.backend.claim('SM1:/player/Fish',
+                                                  expires))
+
+    def test_store(self):
+        expires = time.time() + 60
+        reply = (200, [('Content-Type', "text/xml; charset=utf-8"),
+                       ('Set-Cookie', "Stop=Bridge; Path=/")],
+                 b"<Response />")
+
+        self.backend.claim('SM1:/sms', expires)
+        self.backend.store('SM1:/sms', reply, expires)
+
+        self.assertEqual(reply, self.backend.claim('SM1:/sms', expires))
+
+    def test_release(self):
+        expires = time.time() + 60
+
+        self.backend.claim('SM1:/sms', expires)
+        self.backend.release('SM1:/sms')
+
+        self.assertEqual(None, self.backend.claim('SM1:/sms', expires))
+
+    def test_expired(self):
+        self.backend.claim('SM1:/sms', time.time() - 1)
+
+        self.assertEqual(None, self.backend.claim('SM1:/sms',
+                                                  time.time() + 60))
+
+
+class MemoryReplyBackendTest(BackendTests, TestCase):
+    def setUp(self):
+        self.backend = MemoryReplyBackend(max_entries=3)
+
+    def test_bounded(self):
+        for n in range(0, 5):
+            self.backend.claim('SM{0}:/sms'.format(n), time.time() + 60)
+
+        self.assertEqual(3, len(self.backend))
+        self.assertEqual(None, self.backend.claim('SM0:/sms',
+                                                  time.time() + 60))
+
+
+class SQLiteReplyBackendTest(BackendTests, TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'replies.db')
+        self.backend = SQLiteReplyBackend(self.path, max_entries=3,
+                                          prune_every=1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared(self):
+        # A second connection stands in for another gunicorn worker.
+        other = SQLiteReplyBackend(self.path)
+        expires = time.time() + 60
+
+        self.assertEqual(None, self.backend.claim('SM1:/sms', expires))
+        self.assertTrue(other.claim('SM1:/sms', expires) is PENDING)
+
+        self.backend.store('SM1:/sms', (200, [], b"<Response />"), expires)
+
+        self.assertEqual((200, [], b"<Response />"),
+                         other.claim('SM1:/sms', expires))
+
+    def test_bounded(self):
+        for n in range(0, 5):
+            self.backend.claim('SM{0}:/sms'.format(n), time.time() + 60 + n)
+
+        self.assertEqual(3, len(self.backend))
+
+
+class ReplyCacheTest(TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ReplyCache(MemoryReplyBackend(), ttl=60)
+
+    def test_replay(self):
+        with self.app.test_request_context():
+            response = self.app.make_response(("<Response />", 200))
+            response.set_cookie('Stop', "Bridge")
+
+        self.assertEqual(None, self.cache.begin('SM1:/sms'))
+        self.cache.finish('SM1:/sms', response)
+
+        status, headers, body = self.cache.begin('SM1:/sms')
+
+        self.assertEqual(200, status)
+        self.assertEqual(b"<Response />", body)
+        self.assertTrue(('Set-Cookie', "Stop=Bridge; Path=/") in headers)
+        self.assertEqual(1, self.cache.duplicates)
+
+    def test_error_not_kept(self):
+        response = self.app.response_class("Oops", status=500)
+
+        self.cache.begin('SM1:/sms')
+        self.cache.finish('SM1:/sms', response)
+
+        self.assertEqual(None, self.cache.begin('SM1:/sms'))
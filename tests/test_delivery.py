@@ -0,0 +1,161 @@
+import os
+import tempfile
+
+from unittest import TestCase
+
+from delivery import DeliveryIndex
+from delivery import encode_sid
+from delivery import OutboundMessage
+from delivery import SQLiteStatusBackend
+
+
+def sid(n):
+    return "SM{0:032x}".format(n)
+
+
+def message(body="Clue 1.", attempt=0):
+    return OutboundMessage('player', "+15559990000", "+15558675309", body,
+                           attempt=attempt)
+
+
+class DeliveryIndexTest(TestCase):
+    def setUp(self):
+        self.index = DeliveryIndex(flush_interval=None)
+
+    def test_compact_sid(self):
+        self.assertEqual(18, len(encode_sid(sid(1))))
+        self.assertEqual(b"SMfake1", encode_sid("SMfake1"))
+
+    def test_delivered(self):
+        self.index.sent(sid(1), message())
+
+        self.assertEqual(1, self.index.outstanding)
+        self.assertEqual(None, self.index.update(sid(1), 'sent'))
+        self.assertEqual(None, self.index.update(sid(1), 'delivered'))
+
+        self.assertEqual(('delivered', None), self.index.status(sid(1)))
+        self.assertEqual(0, self.index.outstanding)
+
+    def test_failed(self):
+        sent = message()
+        self.index.sent(sid(1), sent)
+
+        self.assertTrue(self.index.update(sid(1), 'undelivered', "30003")
+                        is sent)
+        self.assertEqual(('undelivered', "30003"), self.index.status(sid(1)))
+        self.assertEqual(1, self.index.failures)
+
+        # Twilio can post the same status twice.
+        self.assertEqual(None, self.index.update(sid(1), 'failed', "30003"))
+
+    def test_out_of_order(self):
+        self.index.sent(sid(1), message())
+
+        self.index.update(sid(1), 'delivered')
+        self.index.update(sid(1), 'sent')
+
+        self.assertEqual(('delivered', None), self.index.status(sid(1)))
+
+    def test_callback_first(self):
+        # Before messages.create returned.
+        self.index.update(sid(1), 'failed', "30003")
+        self.index.update(sid(2), 'delivered')
+
+        sent = message()
+
+        self.assertTrue(self.index.sent(sid(1), sent) is sent)
+        self.assertEqual(None, self.index.sent(sid(2), message()))
+
+        self.assertEqual(('failed', "30003"), self.index.status(sid(1)))
+        self.assertEqual(('delivered', None), self.index.status(sid(2)))
+        self.assertEqual(0, self.index.outstanding)
+
+    def test_unknown(self):
+        self.assertEqual(None, self.index.update(sid(2), 'failed', "30008"))
+        self.assertEqual(('failed', "30008"), self.index.status(sid(2)))
+        self.assertEqual(None, self.index.update(sid(2), 'nonsense'))
+
+    def test_bounded(self):
+        self.index.max_entries = 10
+        self.index.max_outstanding = 5
+
+        for n in range(0, 20):
+            self.index.sent(sid(n), message())
+
+        self.assertEqual(10, len(self.index))
+        self.assertEqual(5, self.index.outstanding)
+        self.assertEqual(None, self.index.status(sid(0)))
+
+
+class SQLiteStatusBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = SQLiteStatusBackend(os.path.join(self.directory.name,
+                                                        'status.db'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_flush(self):
+        index = DeliveryIndex(self.backend, flush_interval=60)
+
+        index.sent(sid(1), message("Victory!"))
+        index.update(sid(1), 'sent')
+
+        self.assertEqual(None, self.backend.load(sid(1)))
+        self.assertEqual(1, index.pending)
+        self.assertEqual(1, index.flush())
+
+        status, error_code, sent = self.backend.load(sid(1))
+
+        self.assertEqual('sent', status)
+        self.assertEqual("Victory!", sent.body)
+
+        index.update(sid(1), 'delivered')
+        index.flush()
+
+        # The message is kept alongside the final status.
+        self.assertEqual("Victory!", self.backend.load(sid(1))[2].body)
+
+    def test_failed_flush(self):
+        index = DeliveryIndex(self.backend, flush_interval=60)
+        save_many = self.backend.save_many
+        self.backend.save_many = lambda rows: 1 / 0
+
+        index.sent(sid(1), message("Victory!"))
+
+        with self.assertRaises(ZeroDivisionError):
+            index.flush()
+
+        index.update(sid(1), 'delivered')
+        self.backend.save_many = save_many
+
+        self.assertEqual(1, index.flush())
+        self.assertEqual('delivered', self.backend.load(sid(1))[0])
+
+    def test_other_worker(self):
+        sender = DeliveryIndex(self.backend, flush_interval=None)
+        receiver = DeliveryIndex(self.backend, flush_interval=None)
+
+        sender.sent(sid(1), message("Clue 2.", attempt=1))
+
+        failed = receiver.update(sid(1), 'failed', "30003")
+
+        self.assertEqual("Clue 2.", failed.body)
+        self.assertEqual(1, failed.attempt)
+
+        # Already handled, so the sender doesn't resend it too.
+        self.assertEqual(None, sender.update(sid(1), 'failed', "30003"))
+
+    def test_other_worker_first(self):
+        sender = DeliveryIndex(self.backend, flush_interval=None)
+        receiver = DeliveryIndex(self.backend, flush_interval=None)
+
+        receiver.update(sid(1), 'delivered')
+        sender.sent(sid(1), message("Clue 2."))
+
+        # The sender's queued doesn't replace the later status.
+        status, _, sent = self.backend.load(sid(1))
+
+        self.assertEqual('delivered', status)
+        self.assertEqual("Clue 2.", sent.body)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+
+from unittest import TestCase
+
+from events import EventLog
+from events import JSONLWriter
+from events import open_writer
+from events import read_events
+from events import SQLiteWriter
+
+
+class ListWriter(object):
+    def __init__(self):
+        self.batches = []
+
+    def write_many(self, events):
+        self.batches.append(list(events))
+
+
+class EventLogTest(TestCase):
+    def setUp(self):
+        self.writer = ListWriter()
+        self.log = EventLog(self.writer, batch_size=3, flush_interval=60)
+
+    def test_buffered(self):
+        self.log.record('clue', player="game:+15559990000", stop="Fish",
+                        clue=0)
+
+        self.assertEqual([], self.writer.batches)
+
+        self.assertEqual(1, self.log.flush())
+        event = self.writer.batches[0][0]
+
+        self.assertEqual('clue', event['type'])
+        self.assertEqual(0, event['clue'])
+        self.assertTrue(event['ts'] > 0)
+
+    def test_batches(self):
+        for n in range(0, 5):
+            self.log.record('clue', clue=n)
+
+        self.log.flush()
+
+        self.assertEqual(1, len(self.writer.batches))
+        self.assertEqual(5, self.log.written)
+
+    def test_bounded(self):
+        self.log.max_pending = 2
+
+        for n in range(0, 5):
+            self.log.record('clue', clue=n)
+
+        self.assertEqual(2, self.log.flush())
+        self.assertEqual(3, self.log.dropped)
+
+    def test_disabled(self):
+        log = EventLog(None)
+        log.record('start')
+
+        self.assertEqual(0, log.flush())
+
+
+class WriterTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def roundtrip(self, name):
+        path = os.path.join(self.directory.name, name)
+        log = EventLog(open_writer(path), flush_interval=None)
+
+        log.record('start', game="game", player="game:Red", stop="Fish")
+        log.record('photo', game="game", player="game:Red", stop="Fish",
+                   next="Bridge", media=2)
+        log.writer.close()
+
+        return list(read_events(path))
+
+    def test_jsonl(self):
+        events = self.roundtrip('events.jsonl')
+
+        self.assertEqual(['start', 'photo'], [e['type'] for e in events])
+        self.assertEqual("Bridge", events[1]['next'])
+
+    def test_open_writer(self):
+        self.assertEqual(None, open_writer(None))
+        self.assertTrue(isinstance(
+            open_writer(os.path.join(self.directory.name, 'events.jsonl')),
+            JSONLWriter))
+        self.assertTrue(isinstance(
+            open_writer(os.path.join(self.directory.name, 'events.db')),
+            SQLiteWriter))
+
+    def test_sqlite(self):
+        events = self.roundtrip('events.db')
+
+        self.assertEqual(['start', 'photo'], [e['type'] for e in events])
+        self.assertEqual({'ts', 'game', 'player', 'type', 'stop', 'next',
+                          'media'}, set(events[1]))
+        self.assertEqual(2, events[1]['media'])
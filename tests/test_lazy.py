@@ -0,0 +1,56 @@
+import threading
+import time
+
+from unittest import TestCase
+
+from lazy import Lazy
+
+
+class LazyTest(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def factory(self):
+        self.calls.append(1)
+        time.sleep(0.01)
+        return object()
+
+    def test_deferred(self):
+        lazy = Lazy(self.factory)
+
+        self.assertFalse(lazy.loaded)
+        self.assertEqual([], self.calls)
+
+        value = lazy.get()
+
+        self.assertTrue(lazy.loaded)
+        self.assertTrue(lazy.get() is value)
+        self.assertEqual(1, len(self.calls))
+
+    def test_race(self):
+        lazy = Lazy(self.factory)
+        values = []
+
+        threads = [threading.Thread(target=lambda: values.append(lazy.get()))
+                   for _ in range(0, 8)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(1, len(set(id(value) for value in values)))
+
+    def test_set_and_reset(self):
+        lazy = Lazy(self.factory)
+
+        self.assertEqual("game", lazy.set("game"))
+        self.assertEqual("game", lazy.get())
+        self.assertEqual([], self.calls)
+
+        lazy.reset()
+
+        self.assertFalse(lazy.loaded)
+        self.assertFalse(lazy.get() == "game")
+        self.assertEqual(1, len(self.calls))
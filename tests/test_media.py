@@ -0,0 +1,124 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from flask import url_for
+
+from .context import app
+from .context import static_files
+
+from build_media import build
+from media import poster_path
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+
+        with app.test_request_context():
+            self.url = url_for('static', filename='images/fish.gif')
+
+    def test_fingerprint(self):
+        digest = static_files.digest('images/fish.gif')
+
+        self.assertEqual(12, len(digest))
+        self.assertEqual("/static/images/fish.{0}.gif".format(digest),
+                         self.url)
+
+    def test_missing_file_not_fingerprinted(self):
+        self.assertEqual("video/missing.mp4",
+                         static_files.fingerprint("video/missing.mp4"))
+
+    def test_immutable(self):
+        response = self.app.get(self.url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue("immutable" in response.headers['Cache-Control'])
+        self.assertTrue("max-age=31536000" in
+                        response.headers['Cache-Control'])
+
+    def test_stale_fingerprint(self):
+        response = self.app.get('/static/images/fish.000000000000.gif')
+
+        self.assertEqual(200, response.status_code)
+        self.assertFalse("immutable" in response.headers['Cache-Control'])
+
+    def test_plain_path(self):
+        response = self.app.get('/static/images/fish.gif')
+
+        self.assertEqual(200, response.status_code)
+        self.assertFalse("immutable" in response.headers['Cache-Control'])
+
+    def test_range(self):
+        response = self.app.get(self.url, headers={'Range': 'bytes=0-99'})
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(100, len(response.data))
+        self.assertTrue(response.headers['Content-Range']
+                        .startswith("bytes 0-99/"))
+
+    def test_not_modified(self):
+        response = self.app.get(self.url)
+
+        response = self.app.get(self.url,
+                                headers={'If-None-Match':
+                                         response.headers['ETag']})
+
+        self.assertEqual(304, response.status_code)
+
+    def test_poster_path(self):
+        self.assertEqual("video/posters/farm.jpg",
+                         poster_path("video/farm.mp4"))
+        self.assertEqual("posters/farm.jpg", poster_path("farm.mp4"))
+
+    def test_not_found(self):
+        response = self.app.get('/static/images/missing.gif')
+
+        self.assertEqual(404, response.status_code)
+
+
+class PrecompressedTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'bench.css')
+
+        with open(self.path, 'w') as f:
+            f.write("body { color: red; }\n" * 500)
+
+        self.static_folder = static_files.directory
+        static_files.directory = self.directory
+
+        self.app = app.test_client()
+
+    def tearDown(self):
+        static_files.directory = self.static_folder
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        self.assertEqual([self.path + '.gz'], build(self.directory))
+        self.assertEqual([], build(self.directory))
+
+        with gzip.open(self.path + '.gz') as f:
+            self.assertEqual(10500, len(f.read()))
+
+    def test_serve_gzip(self):
+        build(self.directory)
+
+        response = self.app.get('/static/bench.css',
+                                headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertTrue(response.mimetype == 'text/css')
+        self.assertTrue('Accept-Encoding' in response.headers['Vary'])
+
+    def test_serve_identity(self):
+        build(self.directory)
+
+        response = self.app.get('/static/bench.css')
+
+        self.assertFalse('Content-Encoding' in response.headers)
+        self.assertEqual(10500, len(response.data))
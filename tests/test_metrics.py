@@ -0,0 +1,137 @@
+import threading
+import time
+
+from unittest import TestCase
+
+from flask import Flask
+
+from metrics import Metrics
+from metrics import RequestTimer
+from metrics import SlowRequestProfiler
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counter(self):
+        counter = self.metrics.counter('events_total', "Events.", ('type',))
+
+        counter.inc('clue')
+        counter.inc('clue')
+        counter.inc('photo', amount=3)
+
+        text = self.metrics.render()
+
+        self.assertTrue("# TYPE events_total counter" in text)
+        self.assertTrue('events_total{type="clue"} 2\n' in text)
+        self.assertTrue('events_total{type="photo"} 3\n' in text)
+
+    def test_histogram(self):
+        histogram = self.metrics.histogram('latency_seconds', "Latency.",
+                                           buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        text = self.metrics.render()
+
+        self.assertTrue('latency_seconds_bucket{le="0.1"} 2\n' in text)
+        self.assertTrue('latency_seconds_bucket{le="1.0"} 3\n' in text)
+        self.assertTrue('latency_seconds_bucket{le="+Inf"} 4\n' in text)
+        self.assertTrue('latency_seconds_count 4\n' in text)
+        self.assertTrue('latency_seconds_sum 2.65\n' in text)
+
+    def test_timer(self):
+        histogram = self.metrics.histogram('work_seconds', "Work.",
+                                           ('kind',))
+
+        with histogram.time('gm'):
+            pass
+
+        self.assertEqual(1, sum(histogram.values[('gm',)][:-1]))
+
+    def test_gauge(self):
+        queue = [1, 2, 3]
+        self.metrics.gauge('queue_depth', "Depth.", lambda: len(queue))
+        self.metrics.gauge('sent_total', "Sent.", lambda: 7, type='counter')
+
+        text = self.metrics.render()
+
+        self.assertTrue("queue_depth 3\n" in text)
+        self.assertTrue("# TYPE sent_total counter" in text)
+
+    def test_failing_gauge(self):
+        self.metrics.gauge('broken', "Broken.", lambda: 1 / 0)
+        self.metrics.gauge('working', "Working.", lambda: 1)
+
+        self.assertTrue("working 1\n" in self.metrics.render())
+
+    def test_escaped_labels(self):
+        counter = self.metrics.counter('stops_total', "Stops.", ('stop',))
+        counter.inc('The "Fish"')
+
+        self.assertTrue('stops_total{stop="The \\"Fish\\""} 1' in
+                        self.metrics.render())
+
+    def test_duplicate(self):
+        self.metrics.counter('events_total', "Events.")
+
+        with self.assertRaises(ValueError):
+            self.metrics.counter('events_total', "Events.")
+
+
+class RequestTimerTest(TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.metrics = Metrics()
+        self.histogram = self.metrics.histogram('request_seconds',
+                                                "Requests.",
+                                                ('endpoint', 'method',
+                                                 'status'))
+        self.profiler = SlowRequestProfiler(threshold=0.05, interval=0.005)
+
+        RequestTimer(self.app, self.histogram, profiler=self.profiler)
+
+        self.app.add_url_rule('/fast', 'fast', lambda: "fast")
+        self.app.add_url_rule('/slow', 'slow', self.slow)
+
+    def slow(self):
+        time.sleep(0.1)
+        return "slow"
+
+    def test_timed(self):
+        self.app.test_client().get('/fast')
+        self.app.test_client().get('/missing')
+
+        self.assertEqual(1, sum(self.histogram.values[('fast', 'GET', 200)]
+                                [:-1]))
+        self.assertEqual(1, sum(self.histogram.values[('', 'GET', 404)]
+                                [:-1]))
+        self.assertEqual(0, self.profiler.slow)
+
+    def test_slow_request_profiled(self):
+        with self.assertLogs('metrics', 'WARNING') as logs:
+            self.app.test_client().get('/slow')
+
+        self.assertEqual(1, self.profiler.slow)
+        self.assertTrue("Slow request to slow" in logs.output[0])
+
+        endpoint, elapsed, stacks, samples = self.profiler.profiles[-1]
+
+        self.assertEqual('slow', endpoint)
+        self.assertTrue(samples > 0)
+        self.assertTrue("test_metrics.py:slow" in stacks[0][0])
+
+    def test_fast_requests_discarded(self):
+        threads = [threading.Thread(target=self.app.test_client().get,
+                                    args=('/fast',))
+                   for _ in range(0, 4)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({}, self.profiler._active)
+        self.assertEqual(0, len(self.profiler.profiles))
@@ -0,0 +1,482 @@
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest import TestCase
+
+from requests.exceptions import ReadTimeout
+from twilio.base.exceptions import TwilioRestException
+
+from http_pool import PooledHttpClient
+from outbound import Broadcaster
+from outbound import Digest
+from outbound import DispatchQueue
+from outbound import FakeClient
+from outbound import MediaBatcher
+from outbound import RateLimiter
+from outbound import TokenBucket
+
+
+class DispatchQueueTest(TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.dispatcher = DispatchQueue(workers=2, backoff=0)
+
+    def tearDown(self):
+        self.dispatcher.stop()
+
+    def test_dispatch(self):
+        for n in range(0, 10):
+            self.dispatcher.put(self.client.messages.create,
+                                to="+15556667777",
+                                body="Message {0}".format(n))
+
+        self.assertTrue(self.dispatcher.drain(timeout=5))
+        self.assertEqual(10, len(self.client.messages.created))
+        self.assertEqual(10, self.dispatcher.sent)
+
+    def test_retry(self):
+        self.client = FakeClient(failures=2)
+
+        self.dispatcher.put(self.client.messages.create, body="Retry.")
+
+        self.assertTrue(self.dispatcher.drain(timeout=5))
+        self.assertEqual([{'body': "Retry."}],
+                         self.client.messages.created)
+        self.assertEqual(0, self.dispatcher.failed)
+
+    def test_retry_exhausted(self):
+        self.client = FakeClient(failures=10)
+
+        self.dispatcher.put(self.client.messages.create, body="Retry.")
+
+        self.assertTrue(self.dispatcher.drain(timeout=5))
+        self.assertEqual([], self.client.messages.created)
+        self.assertEqual(1, self.dispatcher.failed)
+
+    def test_full(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        self.dispatcher = DispatchQueue(workers=1, maxsize=1)
+        self.dispatcher.put(block)
+        started.wait(5)
+
+        self.dispatcher.put(self.client.messages.create, body="Queued.")
+
+        with self.assertLogs('outbound', 'WARNING'):
+            self.dispatcher.put(self.client.messages.create, body="Dropped.")
+
+        release.set()
+
+        self.assertTrue(self.dispatcher.drain(timeout=5))
+        self.assertEqual([{'body': "Queued."}], self.client.messages.created)
+        self.assertEqual(1, self.dispatcher.dropped)
+
+    def test_no_retry_on_client_error(self):
+        calls = []
+
+        def send():
+            calls.append(1)
+            raise TwilioRestException(400, "/Messages.json")
+
+        self.dispatcher.put(send)
+
+        self.assertTrue(self.dispatcher.drain(timeout=5))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, self.dispatcher.failed)
+
+    def test_inline(self):
+        self.dispatcher = DispatchQueue(workers=0)
+
+        msg = self.dispatcher.put(self.client.messages.create, body="Inline.")
+
+        self.assertEqual("SMfake00000000000000000000000001", msg.sid)
+        self.assertEqual([], self.dispatcher.threads)
+
+    def test_stop_drains(self):
+        self.client = FakeClient(latency=0.01)
+
+        for n in range(0, 5):
+            self.dispatcher.put(self.client.messages.create, body=str(n))
+
+        self.dispatcher.stop()
+
+        self.assertEqual(5, len(self.client.messages.created))
+
+
+class MediaBatcherTest(TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.dispatcher = DispatchQueue(workers=0)
+        self.batcher = MediaBatcher(self.dispatcher)
+
+    def send(self, body, **kwargs):
+        return self.client.messages.create(body=body, **kwargs)
+
+    def urls(self, count, start=0):
+        return ["https://example.com/{0}.jpg".format(n)
+                for n in range(start, start + count)]
+
+    def test_single(self):
+        self.batcher.add(self.send, "Photo.", self.urls(1),
+                         to="+15556667777")
+
+        self.assertEqual([{'body': "Photo.", 'to': "+15556667777",
+                           'media_url': "https://example.com/0.jpg"}],
+                         self.client.messages.created)
+        self.assertEqual(0, self.batcher.saved)
+
+    def test_batch(self):
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(3), to="+15556667777")
+
+        self.assertEqual(1, len(self.client.messages.created))
+        self.assertEqual(self.urls(3),
+                         self.client.messages.created[0]['media_url'])
+        self.assertEqual(2, self.batcher.saved)
+
+    def test_mms_limit(self):
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(12), to="+15556667777")
+
+        created = self.client.messages.created
+
+        self.assertEqual(2, len(created))
+        self.assertEqual(self.urls(10), created[0]['media_url'])
+        self.assertEqual(self.urls(2, 10), created[1]['media_url'])
+        self.assertEqual(10, self.batcher.saved)
+
+    def test_window(self):
+        self.batcher.window = 60
+
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(2), to="+15556667777")
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(2, 2), to="+15556667777")
+        self.batcher.add(self.send, "Other.",
+                         self.urls(1, 4), to="+15556667777")
+
+        self.assertEqual([], self.client.messages.created)
+
+        self.batcher.flush_all()
+
+        created = sorted(self.client.messages.created,
+                         key=lambda msg: msg['body'])
+
+        self.assertEqual(2, len(created))
+        self.assertEqual(self.urls(4), created[1]['media_url'])
+        self.assertEqual(3, self.batcher.saved)
+
+    def test_window_full(self):
+        self.batcher.window = 60
+
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(6), to="+15556667777")
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(6, 6), to="+15556667777")
+
+        self.assertEqual(2, len(self.client.messages.created))
+
+    def test_window_timer(self):
+        self.batcher.window = 0.01
+
+        self.batcher.add(self.send, "Photos.",
+                         self.urls(2), to="+15556667777")
+
+        for _ in range(0, 100):
+            if self.client.messages.created:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(1, len(self.client.messages.created))
+
+
+class DigestTest(TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.dispatcher = DispatchQueue(workers=0)
+        self.digest = Digest(self.dispatcher, window=60)
+
+    def send(self, body, **kwargs):
+        return self.client.messages.create(body=body, **kwargs)
+
+    def bodies(self):
+        return sorted(msg['body'] for msg in self.client.messages.created)
+
+    def test_no_window(self):
+        self.digest.window = 0
+
+        self.digest.add(self.send, "Red", "Game started.", to="+15556667777")
+
+        self.assertEqual(["[Red] Game started."], self.bodies())
+
+    def test_coalesce(self):
+        self.digest.add(self.send, "Red", "Game started.", to="+15556667777")
+        self.digest.add(self.send, "Red", "Clue 0 for Fish requested.",
+                        to="+15556667777")
+        self.digest.add(self.send, "Blue", "Game started.",
+                        to="+15556667777")
+
+        self.assertEqual([], self.client.messages.created)
+
+        self.digest.flush_all()
+
+        self.assertEqual(["[Blue] Game started.",
+                          "[Red] 2 updates:\n- Game started.\n"
+                          "- Clue 0 for Fish requested."], self.bodies())
+        self.assertEqual(1, self.digest.saved)
+
+    def test_max_lines(self):
+        self.digest.max_lines = 3
+
+        for n in range(0, 4):
+            self.digest.add(self.send, None, str(n), to="+15556667777")
+
+        self.assertEqual(["3 updates:\n- 0\n- 1\n- 2"], self.bodies())
+        self.assertEqual(1, len(self.digest.pending))
+
+    def test_max_length(self):
+        self.digest.max_length = 100
+
+        for n in range(0, 3):
+            self.digest.add(self.send, None, "x" * 40, to="+15556667777")
+
+        self.assertEqual(1, len(self.client.messages.created))
+
+    def test_max_groups(self):
+        self.digest.max_groups = 2
+
+        for team in ("Red", "Blue", "Green"):
+            self.digest.add(self.send, team, "Game started.",
+                            to="+15556667777")
+
+        self.assertEqual(["[Red] Game started."], self.bodies())
+        self.assertEqual(2, len(self.digest.pending))
+
+    def test_window_timer(self):
+        self.digest.window = 0.01
+
+        self.digest.add(self.send, "Red", "Game started.", to="+15556667777")
+
+        for _ in range(0, 100):
+            if self.client.messages.created:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(["[Red] Game started."], self.bodies())
+
+
+class BroadcasterTest(TestCase):
+    def setUp(self):
+        self.dispatcher = DispatchQueue(workers=4, max_retries=1, backoff=0)
+        self.broadcaster = Broadcaster(self.dispatcher, parallelism=3,
+                                       report_every=4)
+
+        self.sent = []
+        self.reports = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def send(self, body, to=None, from_=None):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+
+        time.sleep(0.01)
+
+        with self.lock:
+            self.active -= 1
+
+        if to == "+15550000013":
+            raise TwilioRestException(400, "/Messages", "Invalid number.")
+
+        self.sent.append((body, to, from_))
+        return to
+
+    def progress(self, sent, failed, total):
+        with self.lock:
+            self.reports.append((sent, failed, total))
+
+    def test_bounded_parallel(self):
+        recipients = ["+1555000{0:04d}".format(n) for n in range(0, 10)]
+
+        broadcast = self.broadcaster.start(self.send, "Time's up!",
+                                           recipients,
+                                           progress=self.progress,
+                                           from_="+15558675309")
+
+        self.assertTrue(broadcast.done.wait(5))
+        self.assertEqual(10, broadcast.sent)
+        self.assertEqual(sorted(recipients),
+                         sorted(to for _, to, _ in self.sent))
+        self.assertEqual({("Time's up!", "+15558675309")},
+                         set((body, from_) for body, _, from_ in self.sent))
+        self.assertTrue(1 < self.most_active <= 3, self.most_active)
+
+        # Reports at 4 and 8 and at the end.
+        self.assertEqual(3, len(self.reports))
+        self.assertTrue((10, 0, 10) in self.reports)
+
+    def test_shared_limit(self):
+        first = self.broadcaster.start(self.send, "One", ["+15550000001",
+                                                          "+15550000002",
+                                                          "+15550000003"])
+        second = self.broadcaster.start(self.send, "Two", ["+15550000004",
+                                                           "+15550000005",
+                                                           "+15550000006"])
+
+        self.assertTrue(first.done.wait(5) and second.done.wait(5))
+        self.assertTrue(self.most_active <= 3, self.most_active)
+
+    def test_stop_waits(self):
+        recipients = ["+1555000{0:04d}".format(n) for n in range(0, 9)]
+
+        broadcast = self.broadcaster.start(self.send, "Bye", recipients)
+        self.broadcaster.stop()
+
+        # Every send finished before stop returned.
+        self.assertTrue(broadcast.done.is_set())
+        self.assertEqual(9, len(self.sent))
+        self.assertEqual([], self.broadcaster.threads)
+
+    def test_failures(self):
+        self.dispatcher.workers = 0
+
+        broadcast = self.broadcaster.start(self.send, "Hi",
+                                           ["+15550000012", "+15550000013"],
+                                           progress=self.progress)
+
+        self.assertTrue(broadcast.done.is_set())
+        self.assertEqual(1, broadcast.failed)
+        self.assertEqual([(1, 1, 2)], self.reports)
+
+    def test_no_recipients(self):
+        broadcast = self.broadcaster.start(self.send, "Hi", [],
+                                           progress=self.progress)
+
+        self.assertTrue(broadcast.done.is_set())
+        self.assertEqual([], self.reports)
+
+
+class TokenBucketTest(TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+
+        self.assertEqual([0, 0, 0], [bucket.take() for _ in range(0, 3)])
+        self.assertTrue(0 < bucket.take() <= 1)
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=100, burst=1)
+
+        self.assertEqual(0, bucket.take())
+        time.sleep(0.02)
+        self.assertEqual(0, bucket.take())
+
+
+class RateLimiterTest(TestCase):
+    def test_per_sender(self):
+        limiter = RateLimiter(rate=1, burst=1)
+
+        limiter.acquire('+15558675309')
+        limiter.acquire('+15551230000')
+
+        self.assertEqual(0, limiter.throttled)
+
+    def test_throttle(self):
+        limiter = RateLimiter(rate=50, burst=1)
+
+        start = time.monotonic()
+        for _ in range(0, 3):
+            limiter.acquire('+15558675309')
+
+        self.assertEqual(2, limiter.throttled)
+        self.assertTrue(time.monotonic() - start >= 0.03)
+
+    def test_timeout(self):
+        limiter = RateLimiter(rate=0.1, burst=1, timeout=1)
+
+        limiter.acquire('+15558675309')
+
+        with self.assertRaises(TwilioRestException) as context:
+            limiter.acquire('+15558675309')
+
+        self.assertEqual(429, context.exception.status)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self.path == '/slow':
+            time.sleep(0.5)
+
+        body = b'{"sid": "SM718"}'
+
+        try:
+            self.send_response(201)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The read timeout test hangs up before the reply.
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHttpClientTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = "http://127.0.0.1:{0}".format(self.server.server_port)
+
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.05},
+                                  daemon=True)
+        thread.start()
+
+        self.client = PooledHttpClient(pool_size=2, read_timeout=0.2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for _ in range(0, 5):
+            response = self.client.request('POST', self.url + '/Messages',
+                                           data={'Body': "Test."})
+            self.assertEqual(201, response.status_code)
+
+        stats = self.client.stats()
+
+        self.assertEqual(5, stats['requests'])
+        self.assertEqual(1, stats['connections'])
+        self.assertEqual(0, stats['in_flight'])
+
+    def test_pool_bounded(self):
+        threads = [threading.Thread(target=self.client.request,
+                                    args=('POST', self.url + '/Messages'))
+                   for _ in range(0, 6)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(self.client.stats()['connections'] <= 2)
+
+    def test_read_timeout(self):
+        with self.assertRaises(ReadTimeout):
+            self.client.request('POST', self.url + '/slow')
+
+        self.assertEqual(0, self.client.stats()['in_flight'])
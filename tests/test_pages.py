@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from pages import PageCache
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        self.cache = PageCache(max_entries=2)
+        self.renders = []
+
+    def render(self, body):
+        def render():
+            self.renders.append(body)
+            return body, 200
+
+        return render
+
+    def test_render_once(self):
+        version = {}
+
+        first = self.cache.get('Fish', version, self.render("Fish"))
+        second = self.cache.get('Fish', version, self.render("Fish"))
+
+        self.assertTrue(first is second)
+        self.assertEqual(["Fish"], self.renders)
+        self.assertEqual(b"Fish", first.body)
+
+    def test_new_version(self):
+        first = self.cache.get('Fish', {}, self.render("Fish"))
+        second = self.cache.get('Fish', {}, self.render("Trout"))
+
+        self.assertNotEqual(first.etag, second.etag)
+        self.assertEqual(["Fish", "Trout"], self.renders)
+
+    def test_bounded(self):
+        version = {}
+
+        for key in ('Fish', 'Bridge', 'Farm'):
+            self.cache.get(key, version, self.render(key))
+
+        self.cache.get('Fish', version, self.render("Fish"))
+
+        self.assertEqual(["Fish", "Bridge", "Farm", "Fish"], self.renders)
@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+
+from registry import Game
+from registry import GameError
+from registry import GameGraph
+from registry import GameRegistry
+
+
+class GameRegistryTest(TestCase):
+    def setUp(self):
+        self.registry = GameRegistry()
+
+        self.lillie = self.registry.add(Game('lillie', {'Stop': {}},
+                                             numbers=['+15558675309'],
+                                             gms=['+15556667777'],
+                                             players=['+15559990000']))
+        self.bob = self.registry.add(Game('bob', {'Stop': {}},
+                                          numbers=['+15551230000',
+                                                   '+15551230001'],
+                                          gms=['+15551239999'],
+                                          teams={'Red': ['+15550000001',
+                                                         '+15550000002'],
+                                                 'Blue': ['+15550000003']}))
+
+    def test_default(self):
+        self.assertEqual(self.lillie, self.registry.default)
+
+    def test_resolve_player(self):
+        self.assertEqual((self.bob, 'player', 'Red'),
+                         self.registry.resolve('+15551230001',
+                                               '+15550000002'))
+
+    def test_resolve_solo(self):
+        self.assertEqual((self.bob, 'player', None),
+                         self.registry.resolve('+15551230000',
+                                               '+15550009999'))
+
+    def test_resolve_gm(self):
+        self.assertEqual((self.bob, 'gm', None),
+                         self.registry.resolve('+15551230000',
+                                               '+15551239999'))
+
+    def test_resolve_unknown_number(self):
+        self.assertEqual((self.lillie, 'gm', None),
+                         self.registry.resolve('+15550000000',
+                                               '+15556667777'))
+
+    def test_session_key(self):
+        self.assertEqual("bob:Red", self.bob.session_key('+15550000001'))
+        self.assertEqual("bob:Red", self.bob.session_key('+15550000002'))
+        self.assertEqual("bob:+15550009999",
+                         self.bob.session_key('+15550009999'))
+
+    def test_players(self):
+        self.assertEqual(('+15559990000',), self.lillie.players())
+        self.assertEqual(('+15550000003',), self.bob.players('Blue'))
+        self.assertEqual(3, len(self.bob.players()))
+
+    def test_duplicate_number(self):
+        with self.assertRaises(GameError):
+            self.registry.add(Game('carol', {}, numbers=['+15551230000']))
+
+    def test_duplicate_player(self):
+        with self.assertRaises(GameError):
+            Game('carol', {}, teams={'Red': ['+15550000001'],
+                                     'Blue': ['+15550000001']})
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'carol.json')
+
+            with open(path, 'w') as f:
+                json.dump({'Numbers': ['+15554440000'],
+                           'GM': ['+15554449999'],
+                           'Teams': {'Green': ['+15554440001']},
+                           'Stop': {'Park': PARK}}, f)
+
+            game = self.registry.load(path)
+
+        self.assertEqual('carol', game.id)
+        self.assertEqual((game, 'player', 'Green'),
+                         self.registry.resolve('+15554440000',
+                                               '+15554440001'))
+
+
+PARK = {'Introduction': {'Messages': [{'Body': "Go to the park."}]},
+        'Clues': [{'Messages': [{'Body': "It's green."}]}],
+        'Victory': {'Messages': [{'Body': "Done!"}], 'Next': "Final"}}
+
+
+def stops(**chain):
+    return {stop: {'Victory': {'Next': following}}
+            for stop, following in chain.items()}
+
+
+class GameGraphTest(TestCase):
+    def setUp(self):
+        self.graph = GameGraph(stops(Bridge="Farm", Fish="Bridge",
+                                     Farm="Done"))
+
+    def test_order(self):
+        self.assertEqual(("Fish", "Bridge", "Farm"), self.graph.order)
+        self.assertEqual("Fish", self.graph.start)
+        self.assertEqual("Farm", self.graph.terminal)
+        self.assertEqual("Done", self.graph.end)
+
+    def test_pointers(self):
+        self.assertEqual("Bridge", self.graph.next["Fish"])
+        self.assertEqual(None, self.graph.next["Farm"])
+        self.assertEqual("Fish", self.graph.previous["Bridge"])
+        self.assertFalse("Fish" in self.graph.previous)
+
+    def test_lookups(self):
+        self.assertEqual("Bridge", self.graph.stop_at(1))
+        self.assertEqual(2, self.graph.position("Farm"))
+        self.assertEqual("Bridge (2 of 3)", self.graph.progress("Bridge"))
+        self.assertTrue("Farm" in self.graph)
+        self.assertFalse("Done" in self.graph)
+
+    def test_stop_out_of_range(self):
+        with self.assertRaises(GameError):
+            self.graph.stop_at(3)
+
+        with self.assertRaises(GameError):
+            self.graph.stop_at(-1)
+
+    def test_cycle(self):
+        with self.assertRaises(GameError):
+            GameGraph(stops(Fish="Bridge", Bridge="Fish"), start="Fish")
+
+    def test_unreachable(self):
+        with self.assertRaises(GameError):
+            GameGraph(stops(Fish="Bridge", Bridge="Done", Farm="Bridge"),
+                      start="Fish")
+
+    def test_detached_loop(self):
+        with self.assertRaises(GameError):
+            GameGraph(stops(Fish="Done", Bridge="Farm", Farm="Bridge"))
+
+    def test_multiple_starts(self):
+        with self.assertRaises(GameError):
+            GameGraph(stops(Fish="Done", Bridge="Done"))
+
+    def test_empty(self):
+        graph = GameGraph({})
+
+        self.assertEqual((), graph.order)
+        self.assertEqual(None, graph.start)
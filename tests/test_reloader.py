@@ -0,0 +1,124 @@
+import os
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from lazy import Lazy
+from registry import GameError
+from reloader import GameReloader
+
+
+class GameReloaderTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'game.json')
+        self.write("one")
+
+        self.loaded = threading.Event()
+        self.registry = Lazy(self.read)
+        self.reloader = GameReloader(self.registry, self.read,
+                                     lambda: [self.path],
+                                     on_reload=lambda _: self.loaded.set())
+
+    def tearDown(self):
+        self.reloader.stop()
+        self.directory.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+        # Some filesystems only keep whole seconds.
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + len(text) * 10 ** 9))
+
+    def read(self):
+        with open(self.path) as f:
+            text = f.read()
+
+        if text == "broken":
+            raise GameError("Stops loop back to Fish.")
+        elif text == "bug":
+            raise TypeError("'NoneType' is not iterable")
+
+        return text
+
+    def test_reload(self):
+        self.assertEqual("one", self.registry.get())
+
+        self.write("two")
+
+        self.assertEqual(None, self.reloader.reload())
+        self.assertEqual("two", self.registry.get())
+        self.assertEqual(1, self.reloader.reloads)
+        self.assertTrue(self.loaded.is_set())
+
+    def test_failure_keeps_games(self):
+        self.registry.get()
+        self.write("broken")
+
+        self.assertEqual("Stops loop back to Fish.", self.reloader.reload())
+        self.assertEqual("one", self.registry.get())
+        self.assertEqual(1, self.reloader.failures)
+        self.assertFalse(self.loaded.is_set())
+
+        # The same broken file isn't loaded again.
+        self.assertFalse(self.reloader.changed())
+
+    def test_check(self):
+        self.reloader.start()
+
+        self.assertEqual(None, self.reloader.check())
+        self.assertEqual(0, self.reloader.reloads)
+
+        self.write("three")
+
+        self.assertTrue(self.reloader.changed())
+        self.reloader.check()
+        self.assertEqual("three", self.registry.get())
+
+    def test_missing_file(self):
+        self.reloader.start()
+        os.remove(self.path)
+
+        self.assertTrue(self.reloader.reload().startswith("[Errno 2]"))
+
+    def test_watch(self):
+        self.reloader.interval = 0.01
+        self.reloader.start()
+
+        self.write("four")
+
+        self.assertTrue(self.loaded.wait(5))
+        self.assertEqual("four", self.registry.get())
+
+    def test_reload_async(self):
+        results = []
+
+        self.write("broken")
+        self.reloader.reload_async(results.append).join()
+
+        self.assertEqual(["Stops loop back to Fish."], results)
+
+    def test_unexpected_error(self):
+        results = []
+        self.registry.get()
+
+        self.write("bug")
+
+        with self.assertLogs('reloader', 'ERROR'):
+            self.reloader.reload_async(results.append).join()
+
+        self.assertEqual(["TypeError: 'NoneType' is not iterable"], results)
+        self.assertEqual("one", self.registry.get())
+
+    def test_hook_error(self):
+        results = []
+        self.reloader.on_reload = lambda _: 1 / 0
+
+        with self.assertLogs('reloader', 'ERROR'):
+            self.reloader.reload_async(results.append).join()
+
+        self.assertEqual(["ZeroDivisionError: division by zero"], results)
@@ -0,0 +1,206 @@
+import os
+import tempfile
+import threading
+import time
+
+from unittest import TestCase
+
+from scheduler import Scheduler
+from scheduler import SQLiteTimerBackend
+
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.fired = []
+        self.scheduler = Scheduler(self.fired.append)
+
+    def test_order(self):
+        self.scheduler.schedule('b', 'hint', 20)
+        self.scheduler.schedule('a', 'hint', 10)
+        self.scheduler.schedule('c', 'hint', 30)
+
+        self.assertEqual(2, self.scheduler.run_due(25))
+        self.assertEqual(['a', 'b'], [timer.key for timer in self.fired])
+        self.assertEqual(1, len(self.scheduler))
+
+    def test_replace(self):
+        self.scheduler.schedule('a', 'hint', 10, {'stop': "Fish"})
+        self.scheduler.schedule('a', 'hint', 40, {'stop': "Bridge"})
+
+        self.assertEqual(1, len(self.scheduler))
+        self.assertEqual(0, self.scheduler.run_due(20))
+        self.assertEqual(1, self.scheduler.run_due(40))
+        self.assertEqual({'stop': "Bridge"}, self.fired[0].payload)
+
+    def test_cancel(self):
+        self.scheduler.schedule('a', 'hint', 10)
+        self.scheduler.schedule('a', 'timer0', 10)
+        self.scheduler.schedule('b', 'hint', 10)
+
+        self.assertEqual(1, self.scheduler.cancel('b', 'hint'))
+        self.assertEqual(2, self.scheduler.cancel('a'))
+        self.assertEqual(0, self.scheduler.cancel('a'))
+
+        self.assertEqual(0, self.scheduler.run_due(10))
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_compacted(self):
+        for n in range(0, 1000):
+            self.scheduler.schedule('a', 'hint', n)
+
+        self.assertEqual(1, len(self.scheduler))
+        self.assertTrue(len(self.scheduler._heap) < 200)
+
+    def test_late_dropped(self):
+        self.scheduler.max_lateness = 60
+        self.scheduler.schedule('a', 'hint', 10)
+        self.scheduler.schedule('b', 'hint', 100)
+
+        self.assertEqual(1, self.scheduler.run_due(120))
+        self.assertEqual(['b'], [timer.key for timer in self.fired])
+        self.assertEqual(1, self.scheduler.dropped)
+
+    def test_failure_logged(self):
+        def fail(timer):
+            raise ValueError("Boom")
+
+        self.scheduler.fire = fail
+        self.scheduler.schedule('a', 'hint', 10)
+        self.scheduler.schedule('b', 'hint', 10)
+
+        with self.assertLogs('scheduler', 'ERROR'):
+            self.assertEqual(2, self.scheduler.run_due(10))
+
+    def test_thread(self):
+        fired = threading.Event()
+        self.scheduler.fire = lambda timer: fired.set()
+        self.scheduler.start()
+        self.addCleanup(self.scheduler.stop)
+
+        self.scheduler.schedule('a', 'hint', time.time() + 60)
+        self.scheduler.schedule('b', 'hint', time.time() + 0.05)
+
+        self.assertTrue(fired.wait(2))
+        self.assertEqual(1, len(self.scheduler))
+
+
+class SQLiteTimerBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = SQLiteTimerBackend(os.path.join(self.directory.name,
+                                                       'timers.db'))
+        self.fired = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scheduler(self):
+        return Scheduler(self.fired.append, self.backend, flush_interval=60)
+
+    def test_restore(self):
+        scheduler = self.scheduler()
+        scheduler.schedule('a', 'hint', 10, {'stop': "Fish"})
+        scheduler.schedule('b', 'hint', 20)
+        scheduler.cancel('b')
+
+        self.assertEqual(3, scheduler.pending)
+        scheduler.close()
+
+        restarted = self.scheduler()
+
+        self.assertEqual(1, restarted.restore())
+        self.assertEqual(1, restarted.run_due(10))
+        self.assertEqual({'stop': "Fish"}, self.fired[0].payload)
+
+        # Fired timers are gone for good.
+        self.assertEqual(0, self.scheduler().restore())
+
+    def test_claimed_once(self):
+        first = self.scheduler()
+        first.schedule('a', 'hint', 10)
+        first.flush()
+
+        second = self.scheduler()
+        second.restore()
+
+        self.assertEqual(1, second.run_due(10))
+        self.assertEqual(0, first.run_due(10))
+        self.assertEqual(1, len(self.fired))
+
+    def test_replaced_elsewhere(self):
+        first = self.scheduler()
+        first.schedule('a', 'hint', 10)
+        first.flush()
+
+        second = self.scheduler()
+        second.restore()
+        second.schedule('a', 'hint', 50)
+        second.flush()
+
+        self.assertEqual(0, first.run_due(10))
+        self.assertEqual(1, second.run_due(50))
+
+    def test_cancelled_elsewhere(self):
+        first = self.scheduler()
+        first.schedule('a', 'hint', 10)
+        first.flush()
+
+        second = self.scheduler()
+        second.cancel('a')
+        second.schedule('a', 'timer0', 20)
+        second.flush()
+
+        self.assertEqual(0, first.run_due(10))
+        self.assertEqual(1, second.run_due(20))
+
+    def test_unflushed(self):
+        scheduler = self.scheduler()
+        scheduler.schedule('a', 'hint', 10)
+        scheduler.flush()
+        scheduler.schedule('a', 'hint', 20)
+
+        self.assertEqual(1, scheduler.run_due(20))
+        scheduler.flush()
+
+        self.assertEqual(0, self.scheduler().restore())
+
+    def test_failed_flush(self):
+        scheduler = self.scheduler()
+        save_many = self.backend.save_many
+        self.backend.save_many = lambda rows: 1 / 0
+
+        scheduler.schedule('a', 'hint', 10)
+        scheduler.schedule('b', 'hint', 20)
+
+        with self.assertRaises(ZeroDivisionError):
+            scheduler.flush()
+
+        scheduler.cancel('b')
+        self.backend.save_many = save_many
+
+        # The pending timer is kept, the cancelled one isn't.
+        scheduler.flush()
+
+        restarted = self.scheduler()
+
+        self.assertEqual(1, restarted.restore())
+        self.assertEqual('a', restarted.get('a', 'hint').key)
+
+    def test_flusher_survives(self):
+        scheduler = Scheduler(self.fired.append, self.backend,
+                              flush_interval=0.01)
+        save_many = self.backend.save_many
+        self.backend.save_many = lambda rows: 1 / 0
+
+        with self.assertLogs('scheduler', 'ERROR'):
+            scheduler.schedule('a', 'hint', 10)
+            time.sleep(0.05)
+
+        self.backend.save_many = save_many
+
+        for _ in range(0, 100):
+            if not scheduler.pending:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(1, self.scheduler().restore())
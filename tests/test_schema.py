@@ -0,0 +1,247 @@
+import copy
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+
+from registry import GameError
+from schema import compile_definition
+from schema import load_definition
+from schema import read_snapshot
+from schema import save_snapshot
+from schema import SchemaError
+from schema import validate
+
+
+STATIC = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+
+with open(os.path.join(STATIC, 'data', 'game.json')) as f:
+    GAME = json.load(f)
+
+
+def messages(*bodies):
+    return {'Messages': [{'Body': body} for body in bodies]}
+
+
+def stop(following, clues=1):
+    return {'Introduction': messages("Go."),
+            'Clues': [messages("Clue {0}.".format(n))
+                      for n in range(0, clues)],
+            'Victory': dict(messages("Found it."), Next=following)}
+
+
+class ValidateTest(TestCase):
+    def test_bundled_game(self):
+        errors, warnings = validate(GAME, STATIC, {'video', 'static'})
+
+        self.assertEqual([], errors)
+
+        # Only the videos, which aren't in the repository.
+        for warning in warnings:
+            self.assertTrue(".mp4 is not in the static folder" in warning,
+                            warning)
+
+    def test_no_stops(self):
+        errors, _ = validate({'Stop': {}})
+
+        self.assertEqual(["Stop: game has no stops"], errors)
+
+    def test_missing_sections(self):
+        definition = {'Stop': {'Fish': {'Clues': []}}}
+
+        errors, _ = validate(definition)
+
+        self.assertTrue("Stop Fish.Introduction: expected an object"
+                        in errors)
+        self.assertTrue("Stop Fish.Clues: expected at least one clue"
+                        in errors)
+        self.assertTrue("Stop Fish.Victory: has no Next" in errors)
+
+    def test_bad_next(self):
+        definition = {'Stop': {'Fish': stop("Bridge"),
+                               'Bridge': stop("Fish")}}
+
+        errors, _ = validate(definition)
+
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].startswith("Stop: "))
+
+    def test_message_body(self):
+        definition = {'Stop': {'Fish': stop("Done")}}
+        definition['Stop']['Fish']['Clues'][0]['Messages'][0] = \
+            {'Text': "It's green."}
+
+        errors, warnings = validate(definition)
+
+        self.assertEqual(["Stop Fish.Clues[0].Messages[0]: has no Body"],
+                         errors)
+        self.assertEqual(["Stop Fish.Clues[0].Messages[0]: unknown key "
+                          "Text"], warnings)
+
+    def test_path(self):
+        definition = {'Stop': {'Fish': stop("Done")}}
+        intro = definition['Stop']['Fish']['Introduction']['Messages']
+        intro.append({'Body': "Watch {0}", 'Path': 'video'})
+        intro.append({'Body': "Watch", 'Path': 'video'})
+        intro.append({'Body': "Watch {0}", 'Path': 'vidoe'})
+        intro.append({'Body': None, 'Path': 'video'})
+
+        errors, _ = validate(definition, endpoints={'video'})
+
+        self.assertEqual(["Stop Fish.Introduction.Messages[2]: Body has no "
+                          "{0} for the Path link",
+                          "Stop Fish.Introduction.Messages[3]: Path vidoe "
+                          "is not a route",
+                          "Stop Fish.Introduction.Messages[4]: has no Body"],
+                         errors)
+
+    def test_missing_media(self):
+        definition = copy.deepcopy(GAME)
+        victory = definition['Stop']['Fish']['Victory']['Messages']
+        victory.append({'Body': "Look.", 'Media': "images/missing.gif"})
+
+        errors, warnings = validate(definition, STATIC)
+
+        self.assertEqual([], errors)
+        self.assertTrue("Stop Fish.Victory.Messages[{0}].Media: "
+                        "images/missing.gif is not in the static folder"
+                        "".format(len(victory) - 1) in warnings)
+
+    def test_commands(self):
+        definition = {'Stop': {'Fish': stop("Done")},
+                      'Commands': {'RULES': {'Messages': [
+                          {'Body': "See {0}", 'Path': 'video'}]},
+                          'PISTA': {'Aliases': "CLUE"}}}
+
+        errors, _ = validate(definition)
+
+        self.assertEqual(["Commands RULES.Messages[0]: Path is not allowed "
+                          "here",
+                          "Commands PISTA.Aliases: expected a list of "
+                          "strings"], errors)
+
+    def test_teams(self):
+        definition = {'Stop': {'Fish': stop("Done")},
+                      'GM': "+15556667777",
+                      'Teams': {'Red': ["+15550000000", 5]}}
+
+        errors, _ = validate(definition)
+
+        self.assertEqual(["GM: expected a list of strings",
+                          "Teams Red: expected a list of strings"], errors)
+
+    def test_timers(self):
+        definition = {'Stop': {'Fish': dict(stop("Done"), HintAfter="5")},
+                      'HintAfter': 10,
+                      'Timers': [{'After': 0, 'Messages': [
+                          {'Body': "See {0}", 'Path': 'video'}]}]}
+
+        errors, _ = validate(definition)
+
+        self.assertEqual(["Stop Fish.HintAfter: expected a number of "
+                          "minutes",
+                          "Timers[0].After: expected a number of minutes",
+                          "Timers[0].Messages[0]: Path is not allowed here"],
+                         errors)
+
+
+class CompileTest(TestCase):
+    def setUp(self):
+        self.compiled = compile_definition(GAME)
+
+    def test_stops(self):
+        fish = self.compiled.stops['Fish']
+
+        self.assertEqual('Bridge', fish.next)
+        self.assertEqual(len(GAME['Stop']['Fish']['Clues']), len(fish.clues))
+        self.assertEqual(GAME['Stop']['Fish']['Introduction']['Messages'][0]
+                         ['Body'], fish.introduction[0].body)
+
+    def test_videos(self):
+        final = self.compiled.videos['Final']
+
+        self.assertEqual(GAME['Videos']['Final']['Video'], final.video)
+
+    def test_immutable(self):
+        with self.assertRaises(TypeError):
+            self.compiled.stops['Fish'] = None
+
+        with self.assertRaises(AttributeError):
+            self.compiled.stops['Fish'].next = 'Farm'
+
+    def test_commands(self):
+        definition = {'Stop': {'Fish': stop("Done")},
+                      'Commands': {'rules': messages("Be nice."),
+                                   'pista': {'Aliases': ["CLUE"]}}}
+
+        compiled = compile_definition(definition)
+
+        self.assertEqual(['RULES'], list(compiled.commands))
+        self.assertEqual("Be nice.", compiled.commands['RULES'][0].body)
+
+    def test_timers(self):
+        definition = {'Stop': {'Fish': stop("Bridge"),
+                               'Bridge': dict(stop("Done"), HintAfter=0)},
+                      'HintAfter': 10,
+                      'Timers': [{'After': 90,
+                                  'Messages': [{'Body': "Hurry!"}]}]}
+
+        compiled = compile_definition(definition)
+
+        self.assertEqual(600, compiled.stops['Fish'].hint_after)
+        self.assertEqual(None, compiled.stops['Bridge'].hint_after)
+        self.assertEqual(5400, compiled.timers[0].after)
+        self.assertEqual("Hurry!", compiled.timers[0].messages[0].body)
+        self.assertEqual(None, self.compiled.stops['Fish'].hint_after)
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'game.json')
+
+        self.write({'Stop': {'Fish': stop("Done", clues=2)}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, definition):
+        with open(self.path, 'w') as f:
+            json.dump(definition, f)
+
+    def test_round_trip(self):
+        definition, _ = load_definition(self.path)
+        target = save_snapshot(self.path, definition)
+
+        self.assertEqual(os.path.join(self.directory.name, 'game.snapshot'),
+                         target)
+        self.assertEqual(definition, read_snapshot(self.path))
+
+    def test_stale(self):
+        definition, _ = load_definition(self.path)
+        save_snapshot(self.path, definition)
+
+        self.write({'Stop': {'Fish': stop("Done", clues=3)}})
+
+        self.assertEqual(None, read_snapshot(self.path))
+        self.assertEqual(3, len(load_definition(self.path)[0]['Stop']
+                                ['Fish']['Clues']))
+
+    def test_corrupt(self):
+        with open(os.path.join(self.directory.name, 'game.snapshot'),
+                  'wb') as f:
+            f.write(b"not a snapshot")
+
+        self.assertEqual(None, read_snapshot(self.path))
+        self.assertEqual(2, len(load_definition(self.path)[0]['Stop']
+                                ['Fish']['Clues']))
+
+    def test_invalid(self):
+        self.write({'Stop': {'Fish': stop("Fish")}})
+
+        with self.assertRaises(SchemaError) as raised:
+            load_definition(self.path)
+
+        self.assertTrue(isinstance(raised.exception, GameError))
+        self.assertEqual(1, len(raised.exception.problems))
@@ -0,0 +1,178 @@
+import os
+import tempfile
+import threading
+import time
+
+from unittest import TestCase
+
+from sessions import MemoryBackend
+from sessions import SessionStore
+from sessions import SQLiteBackend
+
+
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.store = SessionStore(self.backend, max_entries=3, ttl=60,
+                                  flush_interval=60)
+
+    def test_get_missing(self):
+        self.assertEqual(None, self.store.get('+15551110000'))
+
+    def test_update(self):
+        self.store.update('+15551110000', Stop="Fish", Clue=0)
+        self.store.update('+15551110000', Clue=1)
+
+        self.assertEqual({'Stop': "Fish", 'Clue': 1},
+                         self.store.get('+15551110000'))
+
+    def test_concurrent_update(self):
+        # Teammates texting at once each change their own field.
+        def update(n):
+            for _ in range(0, 200):
+                self.store.update('game:Red', **{'Player{0}'.format(n): n})
+
+        threads = [threading.Thread(target=update, args=(n,))
+                   for n in range(0, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({'Player0': 0, 'Player1': 1, 'Player2': 2,
+                          'Player3': 3}, self.store.get('game:Red'))
+
+    def test_write_behind(self):
+        self.store.update('+15551110000', Stop="Fish")
+
+        self.assertEqual({}, self.backend.data)
+
+        self.assertEqual(1, self.store.flush())
+        self.assertEqual({'+15551110000': {'Stop': "Fish"}},
+                         self.backend.data)
+
+    def test_lru_eviction(self):
+        for n in range(0, 5):
+            self.store.update('+1555111000{0}'.format(n), Clue=n)
+
+        self.assertEqual(3, len(self.store))
+
+        # Evicted entries are still served from pending writes.
+        self.assertEqual({'Clue': 0}, self.store.get('+15551110000'))
+
+        self.store.flush()
+        self.store.clear()
+        self.backend.data['+15551110004'] = {'Clue': 4}
+
+        self.assertEqual({'Clue': 4}, self.store.get('+15551110004'))
+
+    def test_ttl(self):
+        self.store.ttl = 0.01
+        self.store.update('+15551110000', Stop="Fish")
+        self.store.flush()
+
+        time.sleep(0.02)
+
+        self.assertEqual(1, self.store.expire())
+        self.assertEqual(0, len(self.store))
+        self.assertEqual({'Stop': "Fish"}, self.store.get('+15551110000'))
+
+    def test_delete(self):
+        self.store.update('+15551110000', Stop="Fish")
+        self.store.flush()
+
+        self.store.delete('+15551110000')
+
+        self.assertEqual(None, self.store.get('+15551110000'))
+
+        self.store.flush()
+
+        self.assertEqual({}, self.backend.data)
+
+    def test_background_flush(self):
+        self.store.flush_interval = 0.01
+
+        self.store.update('+15551110000', Stop="Fish")
+
+        for _ in range(0, 100):
+            if self.backend.data:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual({'+15551110000': {'Stop': "Fish"}},
+                         self.backend.data)
+
+    def test_failed_flush(self):
+        save_many = self.backend.save_many
+        self.backend.save_many = lambda items: 1 / 0
+
+        self.store.update('+15551110000', Stop="Fish")
+
+        with self.assertRaises(ZeroDivisionError):
+            self.store.flush()
+
+        self.store.update('+15552220000', Stop="Farm")
+        self.backend.save_many = save_many
+
+        # Nothing is lost, and the retry writes both.
+        self.assertEqual(2, self.store.flush())
+        self.assertEqual({'+15551110000': {'Stop': "Fish"},
+                          '+15552220000': {'Stop': "Farm"}},
+                         self.backend.data)
+
+    def test_flusher_survives(self):
+        save_many = self.backend.save_many
+        self.backend.save_many = lambda items: 1 / 0
+        self.store.flush_interval = 0.01
+
+        with self.assertLogs('sessions', 'ERROR'):
+            self.store.update('+15551110000', Stop="Fish")
+            time.sleep(0.05)
+
+        self.backend.save_many = save_many
+
+        for _ in range(0, 100):
+            if self.backend.data:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual({'+15551110000': {'Stop': "Fish"}},
+                         self.backend.data)
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persistence(self):
+        store = SessionStore(SQLiteBackend(self.path), flush_interval=None)
+        store.update('+15551110000', Stop="Farm", Clue=2)
+        store.update('+15552220000', Stop="Fish", Clue=0)
+        store.delete('+15552220000')
+
+        store = SessionStore(SQLiteBackend(self.path))
+
+        self.assertEqual({'Stop': "Farm", 'Clue': 2},
+                         store.get('+15551110000'))
+        self.assertEqual(None, store.get('+15552220000'))
+
+    def test_shared(self):
+        # Two workers on one database.
+        first = SessionStore(SQLiteBackend(self.path), shared=True)
+        second = SessionStore(SQLiteBackend(self.path), shared=True)
+
+        first.update('game:Red', Stop="Fish", Clue=0)
+        self.assertEqual({'Stop': "Fish", 'Clue': 0}, second.get('game:Red'))
+
+        second.update('game:Red', Clue=1)
+        first.update('game:Red', Stop="Farm")
+
+        self.assertEqual({'Stop': "Farm", 'Clue': 1}, second.get('game:Red'))
+
+        second.delete('game:Red')
+
+        self.assertEqual(None, first.get('game:Red'))
@@ -0,0 +1,66 @@
+import copy
+
+from unittest import TestCase
+
+from .context import app
+from .context import twiml
+
+from registry import Game
+from twiml import compile_game
+
+
+class TwiMLCacheTest(TestCase):
+    def setUp(self):
+        self.game = Game('test', app.config['Game'])
+        self.base_url = "https://hunt.example.com/"
+
+    def test_compile_game(self):
+        with app.test_request_context(base_url=self.base_url):
+            compiled = compile_game(self.game.compiled)
+
+        for stop, data in self.game.compiled.stops.items():
+            self.assertTrue((stop, 'Introduction', 0) in compiled)
+            self.assertTrue((stop, 'Victory', 0) in compiled)
+
+            for index in range(0, len(data.clues)):
+                self.assertTrue((stop, 'Clues', index) in compiled)
+
+    def test_external_urls(self):
+        response = twiml.get(self.game, 'Fish', 'Introduction',
+                             base_url=self.base_url)
+
+        self.assertTrue(isinstance(response, bytes))
+        self.assertTrue(b"https://hunt.example.com/video/Fish" in response)
+
+    def test_final_victory(self):
+        response = twiml.get(self.game, 'Brewery', 'Victory',
+                             base_url=self.base_url)
+
+        self.assertTrue(b"https://hunt.example.com/video/Final" in response)
+
+    def test_cached(self):
+        first = twiml.get(self.game, 'Fish', 'Clues', 1,
+                          base_url=self.base_url)
+        second = twiml.get(self.game, 'Fish', 'Clues', 1,
+                           base_url=self.base_url)
+
+        self.assertTrue(first is second)
+
+    def test_rebuild_on_game_change(self):
+        twiml.get(self.game, 'Fish', 'Clues', 0, base_url=self.base_url)
+
+        definition = copy.deepcopy(self.game.definition)
+        definition['Stop']['Fish']['Clues'][0]['Messages'][0]['Body'] = \
+            "Changed."
+        self.game.definition = definition
+
+        response = twiml.get(self.game, 'Fish', 'Clues', 0,
+                             base_url=self.base_url)
+
+        self.assertTrue(b"Changed." in response)
+
+    def test_request_host(self):
+        with app.test_request_context(base_url="http://other.example.com/"):
+            response = twiml.get(self.game, 'Bridge', 'Introduction')
+
+        self.assertTrue(b"http://other.example.com/video/Bridge" in response)
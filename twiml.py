@@ -0,0 +1,138 @@
+'''
+Precompiled TwiML for the static game messages.
+'''
+import threading
+import time
+
+from flask import current_app
+from flask import request
+from flask import url_for
+
+from twilio.twiml.messaging_response import MessagingResponse
+
+
+def reply_message(response, message, stop, game=None):
+    if message.path:
+        response.message(message.body.format(url_for(message.path,
+                                                     location=stop,
+                                                     game=game,
+                                                     _external=True)))
+    elif message.media:
+        msg = response.message(message.body)
+        msg.media(url_for('static', filename=message.media))
+    else:
+        response.message(message.body)
+
+    return response
+
+
+def render_messages(messages, location, game=None):
+    response = MessagingResponse()
+
+    for message in messages:
+        response = reply_message(response, message, location, game=game)
+
+    return str(response).encode('utf-8')
+
+
+def outbound_messages(messages, location, game=None):
+    '''
+    (body, media URL) pairs for sending messages outside a reply, where
+    links have to be absolute.
+    '''
+    outbound = []
+
+    for message in messages:
+        if message.path:
+            outbound.append((message.body.format(url_for(message.path,
+                                                         location=location,
+                                                         game=game,
+                                                         _external=True)),
+                             None))
+        elif message.media:
+            outbound.append((message.body, url_for('static',
+                                                   filename=message.media,
+                                                   _external=True)))
+        else:
+            outbound.append((message.body, None))
+
+    return outbound
+
+
+def compile_game(compiled, game=None):
+    rendered = {}
+
+    for name, stop in compiled.stops.items():
+        rendered[(name, 'Introduction', 0)] = \
+            render_messages(stop.introduction, name, game)
+
+        for index, clue in enumerate(stop.clues):
+            rendered[(name, 'Clues', index)] = \
+                render_messages(clue, name, game)
+
+        # The last stop's victory links to the closing video.
+        rendered[(name, 'Victory', 0)] = \
+            render_messages(stop.victory, name if stop.next in compiled.stops
+                            else "Final", game)
+
+    for name, messages in compiled.commands.items():
+        rendered[(name, 'Commands', 0)] = \
+            render_messages(messages, None, game)
+
+    return rendered
+
+
+class TwiMLCache(object):
+    '''
+    Renders every (stop, section, clue index) once per game and host - the
+    serving app's BASE_URL, or the request's. A game's entries rebuild when
+    its definition is replaced. Each build's
+    time goes to histogram, labelled twiml.
+    '''
+    def __init__(self, app, max_entries=256, histogram=None):
+        self.app = app
+        self.max_entries = max_entries
+        self.histogram = histogram
+
+        self.compiled = {}
+
+        self._lock = threading.Lock()
+
+    def get(self, game, stop, section, index=0, base_url=None):
+        base_url = base_url or current_app.config.get('BASE_URL')
+
+        if not base_url:
+            base_url = request.host_url
+
+        entry = self.compiled.get((game.id, base_url), None)
+
+        if entry is None or entry[0] is not game.definition:
+            entry = self.compile(game, base_url)
+
+        return entry[1][(stop, section, index)]
+
+    def compile(self, game, base_url):
+        with self._lock:
+            entry = self.compiled.get((game.id, base_url), None)
+
+            if entry is not None and entry[0] is game.definition:
+                return entry
+
+            started = time.perf_counter()
+
+            with self.app.test_request_context(base_url=base_url):
+                entry = (game.definition, compile_game(game.compiled,
+                                                       game.id))
+
+            if self.histogram is not None:
+                self.histogram.observe(time.perf_counter() - started, 'twiml')
+
+            compiled = dict(self.compiled)
+
+            if len(compiled) >= self.max_entries:
+                compiled = {}
+
+            compiled[(game.id, base_url)] = entry
+            self.compiled = compiled
+
+            return entry